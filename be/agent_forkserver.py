@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Fork server for the orchestrator's "forkserver" agent mode.
+
+The server process imports every agent module, instantiates the agents
+(loading joblib models), warms their regexes, then freezes the GC heap and
+waits on a Unix socket. Each request is served by a freshly forked child,
+so requests stay as isolated as in "subprocess" mode - state a request
+mutates dies with its child - but skip interpreter start-up, imports and
+model loading. Preloaded memory is shared copy-on-write by all children.
+
+Wire format: 4-byte big-endian length + UTF-8 JSON, in both directions.
+The client sends {"agent": "<script>", "request": {...}}; the child
+answers with {"pid": <child pid>} first (so the client can kill it on
+timeout), then the agent response. Large messages in either direction
+are replaced by shared-memory handles (see shm_transport.py).
+"""
+import os
+import sys
+import json
+import socket
+import struct
+import signal
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Dict, Optional
+
+_HEADER = struct.Struct(">I")
+
+# Cheap requests that exercise each agent's hot path once before forking
+WARMUP_REQUESTS = {
+    "pain_assessment_agent.py": {"transcript": "It hurts about 5 out of 10.", "visit_type": "warmup"},
+    "security_ethics_agent.py": {"mode": "full_pipeline", "text": "warm up", "pain_score": 0.0, "transcript": "warm up"}
+}
+
+def send_frame(conn: socket.socket, data: bytes):
+    conn.sendall(_HEADER.pack(len(data)) + data)
+
+def recv_exact(conn: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = conn.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("fork server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv_frame(conn: socket.socket) -> bytes:
+    (size,) = _HEADER.unpack(recv_exact(conn, _HEADER.size))
+    return recv_exact(conn, size)
+
+def preload_agents() -> Dict[str, Any]:
+    """
+    Import and instantiate every agent and run its warm-up request.
+    """
+    import gc
+    from pain_orchestrator import IN_PROCESS_AGENTS, load_agent_entry_point
+
+    entry_points = {}
+    for agent_script in IN_PROCESS_AGENTS:
+        entry_points[agent_script] = entry_point = load_agent_entry_point(agent_script)
+        warmup = WARMUP_REQUESTS.get(agent_script)
+        if warmup:
+            entry_point(dict(warmup))
+        # Start children with empty metrics, not the preload spans
+        agent = getattr(entry_point, "__self__", None)
+        if agent is not None and hasattr(agent, "metrics"):
+            agent.metrics.drain()
+
+    # Keep the preloaded heap out of future collections so the GC does not
+    # touch (and copy) shared pages in every child
+    gc.collect()
+    gc.freeze()
+    return entry_points
+
+def serve_request(conn: socket.socket, entry_points: Dict[str, Any]):
+    """
+    Runs in the forked child: answer one request and exit.
+    """
+    from agent_results import json_default
+    from instrumentation import profiling
+    from shm_transport import decode_message, encode_message
+
+    send_frame(conn, json.dumps({"pid": os.getpid()}).encode())
+    threshold = None
+    try:
+        message = decode_message(recv_frame(conn))
+        agent_script = os.path.basename(message["agent"])
+        threshold = message["request"].get("shm_threshold")
+        with profiling(os.path.splitext(agent_script)[0]):
+            result = entry_points[agent_script](message["request"])
+    except Exception as e:
+        result = {"success": False, "error": f"Fork server child failed: {e}"}
+    response, _ = encode_message(result, threshold, default=json_default)
+    send_frame(conn, response.encode())
+
+def serve(socket_path: str):
+    # Every child serves a single request, so micro-batchers never wait
+    os.environ.setdefault("CLINICAMIND_PAIN_BATCH_WAIT_MS", "0")
+    from rule_packs import refresh_rules
+    entry_points = preload_agents()
+    parent_pid = os.getppid()
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+    listener.settimeout(1.0)
+    # Children are never waited on; let the kernel reap them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    print("ready", flush=True)
+    # Nobody reads our stdout after start-up; send stray agent output to stderr
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    try:
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                # Exit with the orchestrator that started us
+                if os.getppid() != parent_pid:
+                    break
+                # Pick up edited rule packs while idle, so children inherit
+                # them compiled instead of each reloading them
+                refresh_rules()
+                continue
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    listener.close()
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    conn.settimeout(None)
+                    serve_request(conn, entry_points)
+                except BaseException:
+                    code = 1
+                finally:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(code)
+            conn.close()
+    finally:
+        listener.close()
+        try:
+            os.unlink(socket_path)
+        except FileNotFoundError:
+            pass
+
+class ForkedRequest:
+    """
+    One in-flight request, served by a forked child of the server.
+    """
+    def __init__(self, conn: socket.socket, pid: int):
+        self.conn = conn
+        self.pid = pid
+
+    def result(self, payload: bytes, timeout: Optional[float] = None) -> bytes:
+        try:
+            self.conn.settimeout(timeout)
+            send_frame(self.conn, payload)
+            return recv_frame(self.conn)
+        finally:
+            self.conn.close()
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+class AgentForkServer:
+    """
+    Client handle that starts the server process and forks requests off it.
+    """
+    def __init__(self, startup_timeout: float = 120.0):
+        self.work_dir = tempfile.mkdtemp(prefix="clinicamind_forkserver_")
+        self.socket_path = os.path.join(self.work_dir, "agents.sock")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--socket", self.socket_path],
+            stdout=subprocess.PIPE,
+            text=True
+        )
+        # Wait for the preload to finish; the server prints "ready" when listening
+        import select
+        ready, _, _ = select.select([self.process.stdout], [], [], startup_timeout)
+        if not ready or self.process.stdout.readline().strip() != "ready":
+            self.close()
+            raise RuntimeError("Agent fork server failed to start")
+
+    def submit(self) -> ForkedRequest:
+        """
+        Fork a child to serve one request; the payload is sent by
+        ForkedRequest.result().
+        """
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.socket_path)
+            pid = json.loads(recv_frame(conn))["pid"]
+        except Exception:
+            conn.close()
+            raise
+        return ForkedRequest(conn, pid)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.process.stdout:
+            self.process.stdout.close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(self.work_dir)
+        except OSError:
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent fork server - preloads agents and forks a child per request")
+    parser.add_argument("--socket", required=True, help="Unix socket path to listen on")
+    args = parser.parse_args()
+    try:
+        serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+HTTP agent server for the orchestrator's "http" agent mode.
+
+Serves every agent from one process, preloaded and warmed as in the fork
+server, so agents can run on other hosts than the orchestrator:
+
+    POST /agents/<script>    agent request JSON in, agent response JSON out
+    GET  /health             {"ok": true, "pid": ...}
+
+    python agent_http.py --host 0.0.0.0 --port 8770
+    CLINICAMIND_AGENT_URL=http://agents:8770 python pain_orchestrator.py --mode http ...
+
+Requests are served concurrently on threads against shared agent instances,
+as in "inprocess" mode. Without CLINICAMIND_AGENT_URL the orchestrator starts
+a local server on a free port (AgentHTTPServer) and stops it on close().
+Connections are HTTP/1.1 keep-alive; the client keeps one per thread.
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; don't let Nagle hold the body
+    disable_nagle_algorithm = True
+    entry_points: Dict[str, Any] = {}
+    verbose = False
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, json.dumps({"ok": True, "pid": os.getpid(), "agents": sorted(self.entry_points)}).encode())
+        else:
+            self._send(404, b'{"error": "not found"}')
+
+    def do_POST(self):
+        from agent_results import json_default
+
+        agent_script = os.path.basename(self.path.rstrip("/"))
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.startswith("/agents/") or agent_script not in self.entry_points:
+            self._send(404, json.dumps({"success": False, "error": f"Unknown agent: {agent_script}"}).encode())
+            return
+        try:
+            result = self.entry_points[agent_script](json.loads(body))
+        except Exception as e:
+            result = {"success": False, "error": f"Agent server failed: {e}"}
+        self._send(200, json.dumps(result, default=json_default).encode())
+
+def serve(host: str, port: int, verbose: bool = False):
+    from agent_forkserver import preload_agents
+
+    AgentRequestHandler.entry_points = preload_agents()
+    AgentRequestHandler.verbose = verbose
+    server = ThreadingHTTPServer((host, port), AgentRequestHandler)
+    server.daemon_threads = True
+    # The parent reads the bound port from this line
+    print(f"ready {server.server_address[1]}", flush=True)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+class AgentHTTPClient:
+    """
+    POSTs agent requests to a server, over one keep-alive connection per thread.
+    """
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self._local = threading.local()
+
+    def _connection(self, timeout: Optional[float]) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def post(self, agent_script: str, payload: bytes, timeout: Optional[float] = None) -> bytes:
+        path = f"{self.prefix}/agents/{os.path.basename(agent_script)}"
+        for attempt in range(2):
+            conn = self._connection(timeout)
+            try:
+                conn.request("POST", path, body=payload, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection; reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+            except Exception:
+                conn.close()
+                self._local.conn = None
+                raise
+        if response.status != 200:
+            raise RuntimeError(f"agent server answered {response.status}: {body[:200]!r}")
+        return body
+
+class AgentHTTPServer:
+    """
+    Client handle that starts a local agent server on a free port.
+    """
+    def __init__(self, startup_timeout: float = 120.0):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--host", "127.0.0.1", "--port", "0"],
+            stdout=subprocess.PIPE,
+            text=True
+        )
+        import select
+        ready, _, _ = select.select([self.process.stdout], [], [], startup_timeout)
+        line = self.process.stdout.readline().split() if ready else []
+        if len(line) != 2 or line[0] != "ready":
+            self.close()
+            raise RuntimeError("Agent HTTP server failed to start")
+        self.url = f"http://127.0.0.1:{line[1]}"
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.process.stdout:
+            self.process.stdout.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent HTTP server - preloads agents and serves them over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=8770, help="Port to listen on (0 picks a free one)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+    try:
+        serve(args.host, args.port, args.verbose)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
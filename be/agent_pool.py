@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Long-lived agent worker processes for the orchestrator's "pool" agent mode.
+
+Each worker imports and warms every agent once (as the fork server does)
+and then serves requests one at a time over a Unix socket pair, so it pays
+start-up once per lifetime instead of once per request. The price is that
+agent state and leaked memory carry over between requests, so the pool
+manages worker lifetimes:
+
+  - recycling: after each request the worker's RSS is read from /proc; a
+    worker past CLINICAMIND_POOL_MAX_RSS_MB (default 1024, 0 disables) or
+    CLINICAMIND_POOL_MAX_REQUESTS (default 1000, 0 disables) is retired
+    while idle and replaced on demand.
+  - health checks: a worker idle for longer than CLINICAMIND_POOL_PING_S
+    (default 30) is pinged before it is handed a request; one that does not
+    answer is killed and replaced.
+  - crashes: a worker that dies mid-request is replaced and the request is
+    retried on a fresh worker (once), so a crash costs latency, not the
+    request. A request that times out or is cancelled is not retried; its
+    worker is killed, since it may be stuck.
+
+At most CLINICAMIND_POOL_WORKERS workers (default: CPU count, at least 2)
+run at once; callers beyond that wait for an idle one. The orchestrator
+keeps one pool per process (pain_orchestrator.agent_host), so the cap holds
+across all its orchestrators and threads.
+
+Wire format is the fork server's: 4-byte big-endian length + UTF-8 JSON.
+The pool sends {"agent": "<script>", "request": {...}} and the worker
+answers with the agent response (large messages go through shared memory,
+see shm_transport.py), or {"ping": true} answered by {"pong": true, ...}.
+A request segment stays the sender's: the worker reads it without
+unlinking, so a retry after a crash can send the same handle again.
+A worker exits when its socket is closed.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from agent_forkserver import recv_frame, send_frame
+from instrumentation import Metrics
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def pool_size() -> int:
+    return max(1, int(os.getenv("CLINICAMIND_POOL_WORKERS", max(2, os.cpu_count() or 1))))
+
+def max_requests() -> int:
+    return int(os.getenv("CLINICAMIND_POOL_MAX_REQUESTS", 1000))
+
+def max_rss_bytes() -> int:
+    return int(float(os.getenv("CLINICAMIND_POOL_MAX_RSS_MB", 1024)) * 1024 * 1024)
+
+def ping_interval() -> float:
+    return float(os.getenv("CLINICAMIND_POOL_PING_S", 30.0))
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """
+    Resident set size of a process, or None where /proc is unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def serve(fd: int):
+    """
+    Worker loop: answer requests on the inherited socket until it closes.
+    """
+    # One request at a time per worker, so micro-batchers never wait
+    os.environ.setdefault("CLINICAMIND_PAIN_BATCH_WAIT_MS", "0")
+    from agent_results import json_default
+    from agent_forkserver import preload_agents
+    from instrumentation import profiling
+    from shm_transport import decode_message, encode_message
+
+    conn = socket.socket(fileno=fd)
+    entry_points = preload_agents()
+    # Stdout is not the transport; keep stray agent output off the terminal
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    send_frame(conn, json.dumps({"ready": True, "pid": os.getpid()}).encode())
+    served = 0
+    while True:
+        try:
+            frame = recv_frame(conn)
+        except ConnectionError:
+            break
+        threshold = None
+        try:
+            # The pool may resend this request if we die; leave its segment in place
+            message = decode_message(frame, unlink=False)
+            if message.get("ping"):
+                send_frame(conn, json.dumps({"pong": True, "pid": os.getpid(), "served": served}).encode())
+                continue
+            agent_script = os.path.basename(message["agent"])
+            threshold = message["request"].get("shm_threshold")
+            with profiling(os.path.splitext(agent_script)[0]):
+                result = entry_points[agent_script](message["request"])
+        except Exception as e:
+            result = {"success": False, "error": f"Pool worker failed: {e}"}
+        served += 1
+        response, _ = encode_message(result, threshold, default=json_default)
+        send_frame(conn, response.encode())
+        sys.stdout.flush()
+
+class WorkerCrashed(Exception):
+    pass
+
+class PoolWorker:
+    """
+    Parent-side handle of one worker process.
+    """
+    def __init__(self, startup_timeout: float = 120.0):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--fd", str(child.fileno())],
+                pass_fds=(child.fileno(),),
+                stdout=subprocess.DEVNULL
+            )
+        finally:
+            child.close()
+        self.conn = parent
+        self.pid = self.process.pid
+        self.served = 0
+        self.rss = None
+        self.started_at = time.time()
+        self.last_used = time.monotonic()
+        try:
+            self.conn.settimeout(startup_timeout)
+            json.loads(recv_frame(self.conn))
+        except (OSError, ConnectionError, ValueError):
+            self.kill()
+            raise RuntimeError("Agent pool worker failed to start")
+
+    def exchange(self, payload: bytes, timeout: Optional[float] = None) -> bytes:
+        """
+        One request/response round trip. Raises WorkerCrashed if the worker
+        died, socket.timeout if it did not answer in time.
+        """
+        try:
+            self.conn.settimeout(timeout)
+            send_frame(self.conn, payload)
+            response = recv_frame(self.conn)
+        except socket.timeout:
+            raise
+        except (ConnectionError, OSError) as e:
+            raise WorkerCrashed(f"worker {self.pid} died: {e}")
+        self.last_used = time.monotonic()
+        return response
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        try:
+            return json.loads(self.exchange(b'{"ping": true}', timeout)).get("pong") is True
+        except (WorkerCrashed, socket.timeout, ValueError):
+            return False
+
+    def kill(self):
+        """
+        Cancel whatever the worker is doing; the caller sees it as a crash.
+        """
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+
+    def close(self, timeout: float = 5.0):
+        # Closing our end is the worker's signal to exit
+        self.conn.close()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "served": self.served,
+            "rss_bytes": self.rss,
+            "uptime_s": time.time() - self.started_at,
+            "alive": self.process.poll() is None
+        }
+
+class PooledRequest:
+    """
+    Cancellation handle for a request running on a pool worker.
+    """
+    def __init__(self, worker: PoolWorker):
+        self.worker = worker
+
+    def kill(self):
+        self.worker.kill()
+
+class AgentWorkerPool:
+    def __init__(self, size: Optional[int] = None, max_requests_per_worker: Optional[int] = None,
+                 max_rss: Optional[int] = None, ping_after_s: Optional[float] = None):
+        self.size = size or pool_size()
+        self.max_requests = max_requests() if max_requests_per_worker is None else max_requests_per_worker
+        self.max_rss = max_rss_bytes() if max_rss is None else max_rss
+        self.ping_after = ping_interval() if ping_after_s is None else ping_after_s
+        self._cond = threading.Condition()
+        self._idle: List[PoolWorker] = []
+        self._busy = set()
+        self._starting = 0
+        self._closed = False
+        # Lifetime counters; per-run events also go to the caller's Metrics
+        self.counters = {"started": 0, "recycled": 0, "crashed": 0, "unhealthy": 0, "retried": 0}
+
+    def _count(self, name: str, metrics: Optional[Metrics], **labels):
+        with self._cond:
+            self.counters[name] += 1
+        if metrics is not None:
+            metrics.incr(f"pool_workers_{name}", **labels)
+
+    def _acquire(self, metrics: Optional[Metrics]) -> PoolWorker:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("agent pool is closed")
+                    if self._idle:
+                        # Most recently used first; the others may go cold and get recycled by ping
+                        worker = self._idle.pop()
+                        self._busy.add(worker)
+                        break
+                    if len(self._busy) + self._starting < self.size:
+                        self._starting += 1
+                        worker = None
+                        break
+                    self._cond.wait()
+            if worker is None:
+                try:
+                    with (metrics.span("pool_worker_start") if metrics else nullcontext()):
+                        worker = PoolWorker()
+                finally:
+                    with self._cond:
+                        self._starting -= 1
+                        if worker is not None:
+                            self._busy.add(worker)
+                        self._cond.notify()
+                self._count("started", metrics)
+                return worker
+            if time.monotonic() - worker.last_used < self.ping_after or worker.ping():
+                return worker
+            self._count("unhealthy", metrics)
+            self._discard(worker, kill=True)
+
+    def _release(self, worker: PoolWorker, metrics: Optional[Metrics]):
+        reason = None
+        if self.max_requests and worker.served >= self.max_requests:
+            reason = "requests"
+        elif self.max_rss and worker.rss is not None and worker.rss > self.max_rss:
+            reason = "rss"
+        if reason:
+            self._count("recycled", metrics, reason=reason)
+            self._discard(worker)
+            return
+        with self._cond:
+            self._busy.discard(worker)
+            closed = self._closed
+            if not closed:
+                self._idle.append(worker)
+            self._cond.notify()
+        if closed:
+            # Outside the lock: closing waits for the worker to exit
+            worker.close()
+
+    def _discard(self, worker: PoolWorker, kill: bool = False):
+        with self._cond:
+            self._busy.discard(worker)
+            self._cond.notify()
+        if kill:
+            worker.kill()
+        worker.close()
+
+    def call(self, payload: bytes, timeout: Optional[float] = None, cancellation=None, metrics: Optional[Metrics] = None, retries: int = 1) -> bytes:
+        """
+        Serve one encoded request on an idle worker and return the encoded
+        response. A worker crash is retried on a fresh worker up to
+        `retries` times; timeouts and cancellations are raised.
+        """
+        attempt = 0
+        while True:
+            worker = self._acquire(metrics)
+            handle = PooledRequest(worker)
+            if cancellation and not cancellation.register(handle):
+                self._release(worker, metrics)
+                raise WorkerCrashed("cancelled before dispatch")
+            try:
+                response = worker.exchange(payload, timeout)
+            except socket.timeout:
+                self._discard(worker, kill=True)
+                raise
+            except WorkerCrashed:
+                self._discard(worker, kill=True)
+                if cancellation and cancellation.cancelled:
+                    raise
+                self._count("crashed", metrics)
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                self._count("retried", metrics)
+                continue
+            finally:
+                if cancellation:
+                    cancellation.unregister(handle)
+            worker.served += 1
+            worker.rss = rss_bytes(worker.pid)
+            self._release(worker, metrics)
+            return response
+
+    def check_health(self) -> Dict[str, Any]:
+        """
+        Ping every idle worker now, replacing the ones that fail.
+        """
+        with self._cond:
+            workers, self._idle = self._idle, []
+            self._busy.update(workers)
+        healthy = 0
+        for worker in workers:
+            if worker.ping():
+                healthy += 1
+                self._release(worker, None)
+            else:
+                self._count("unhealthy", None)
+                self._discard(worker, kill=True)
+        return {"checked": len(workers), "healthy": healthy}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            workers = list(self._idle) + list(self._busy)
+            busy = len(self._busy)
+            counters = dict(self.counters)
+        return {"size": self.size, "busy": busy, "workers": [worker.status() for worker in workers], "counters": counters}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            workers, self._idle = self._idle, []
+            self._cond.notify_all()
+        # Busy workers are closed by _release when their request finishes
+        for worker in workers:
+            worker.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent pool worker - preloads agents and serves requests over an inherited socket")
+    parser.add_argument("--fd", type=int, required=True, help="Inherited socket file descriptor")
+    args = parser.parse_args()
+    try:
+        serve(args.fd)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Typed agent results.
+
+Agents build these slotted dataclasses instead of ad-hoc nested dicts, and
+the orchestrator passes them between stages as-is in in-process mode.
+They are turned into JSON-ready dicts only at the edges: when an agent
+prints its response, when a request crosses a subprocess pipe, and when a
+pipeline result is returned or cached.
+
+Optional fields that are None are left out of to_dict() so the JSON shape
+matches the historical agent responses. get()/[]/in are kept for code that
+still treats results as dicts.
+"""
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+class AgentResult:
+    __slots__ = ()
+    # Fields omitted from to_dict() while they are None
+    OPTIONAL = frozenset(("metrics",))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {}
+        for name in self._field_names():
+            value = getattr(self, name)
+            if value is None and name in self.OPTIONAL:
+                continue
+            data[name] = value if type(value) in _SCALAR_TYPES else to_jsonable(value)
+        extra = getattr(self, "extra", None)
+        if extra:
+            data.update(extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AgentResult":
+        """
+        Build a result from its dict form; unknown keys are kept in `extra`
+        when the class has one.
+        """
+        names = cls._field_names()
+        kwargs = {name: data[name] for name in names if name in data}
+        for name, nested_cls in getattr(cls, "NESTED", {}).items():
+            if isinstance(kwargs.get(name), dict):
+                kwargs[name] = nested_cls.from_dict(kwargs[name])
+        if "extra" in cls.__dataclass_fields__:
+            kwargs["extra"] = {key: value for key, value in data.items() if key not in names}
+        return cls(**kwargs)
+
+    @classmethod
+    def _field_names(cls) -> tuple:
+        names = cls.__dict__.get("_FIELD_NAMES")
+        if names is None:
+            names = tuple(f.name for f in fields(cls) if f.name != "extra")
+            cls._FIELD_NAMES = names
+        return names
+
+    def take_metrics(self) -> Optional[Dict[str, Any]]:
+        metrics = getattr(self, "metrics", None)
+        if metrics is not None:
+            self.metrics = None
+        return metrics
+
+    # Dict-style access for callers that predate typed results
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._field_names():
+            value = getattr(self, key)
+            return default if value is None and key in self.OPTIONAL else value
+        extra = getattr(self, "extra", None)
+        return extra.get(key, default) if extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        missing = object()
+        return self.get(key, missing) is not missing
+
+@dataclass(slots=True, kw_only=True)
+class AgentError(AgentResult):
+    success: bool = False
+    error: str
+    agent: Optional[str] = None
+    stderr: Optional[str] = None
+    metrics: Optional[Dict[str, Any]] = None
+
+    OPTIONAL = frozenset(("agent", "stderr", "metrics"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"success": False, "error": self.error}
+        if self.agent is not None:
+            data["agent"] = self.agent
+        if self.stderr is not None:
+            data["stderr"] = self.stderr
+        return data
+
+@dataclass(slots=True, kw_only=True)
+class ASRResult(AgentResult):
+    success: bool = True
+    agent: str
+    transcript: str
+    audio_path: str
+    language: str
+    backend: str
+    preprocessing: Optional[Dict[str, Any]] = None
+    segments: Optional[List[Dict[str, Any]]] = None
+    vad: Optional[Dict[str, Any]] = None
+    chunks: Optional[List[Dict[str, Any]]] = None
+    visit_type: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
+    metrics: Optional[Dict[str, Any]] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    OPTIONAL = frozenset(("preprocessing", "segments", "vad", "chunks", "visit_type", "metadata", "metrics"))
+
+@dataclass(slots=True, kw_only=True)
+class TTSResult(AgentResult):
+    success: bool = True
+    agent: str
+    text: str
+    output_path: str
+    language_code: str
+    voice_name: str
+    openai_voice: str
+    backend: str
+    file_size: int
+    metrics: Optional[Dict[str, Any]] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass(slots=True, kw_only=True)
+class PainAssessment(AgentResult):
+    success: bool = True
+    agent: str
+    version: str
+    visit_type: str
+    transcript: str
+    pain_nrs: float
+    severity: str
+    classification: Any = None
+    regression_prediction: Optional[float] = None
+    classification_error: Optional[str] = None
+    regression_error: Optional[str] = None
+    metrics: Optional[Dict[str, Any]] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    OPTIONAL = frozenset(("classification_error", "regression_error", "metrics"))
+
+@dataclass(slots=True, kw_only=True)
+class InputValidation(AgentResult):
+    secure: bool
+    issues: List[Dict[str, Any]]
+    redacted_text: str
+    concerning_terms: List[str]
+    requires_escalation: bool
+
+@dataclass(slots=True, kw_only=True)
+class EthicsValidation(AgentResult):
+    ethically_compliant: bool
+    flags: List[str]
+    recommendations: List[Dict[str, Any]]
+    requires_human_review: bool
+
+@dataclass(slots=True, kw_only=True)
+class ValidationSummary(AgentResult):
+    input_secure: bool = True
+    ethically_compliant: bool = True
+    requires_escalation: bool = False
+    requires_human_review: bool = False
+
+@dataclass(slots=True, kw_only=True)
+class AuditEntry(AgentResult):
+    session_id: str
+    timestamp: str
+    agent: str
+    validation_summary: ValidationSummary
+    recommendations: List[Dict[str, Any]]
+    security_issues_count: int
+    ethical_flags_count: int
+
+    NESTED = {"validation_summary": ValidationSummary}
+
+@dataclass(slots=True, kw_only=True)
+class OverallStatus(AgentResult):
+    approved: bool = True
+    requires_review: bool = False
+    blocking_issues: bool = False
+
+@dataclass(slots=True, kw_only=True)
+class SecurityResult(AgentResult):
+    success: bool = True
+    agent: str
+    mode: str
+    session_id: str
+    input_validation: Optional[InputValidation] = None
+    ethics_validation: Optional[EthicsValidation] = None
+    audit_log: Optional[AuditEntry] = None
+    overall_status: OverallStatus = field(default_factory=OverallStatus)
+    metrics: Optional[Dict[str, Any]] = None
+
+    OPTIONAL = frozenset(("input_validation", "ethics_validation", "audit_log", "metrics"))
+    NESTED = {
+        "input_validation": InputValidation,
+        "ethics_validation": EthicsValidation,
+        "audit_log": AuditEntry,
+        "overall_status": OverallStatus
+    }
+
+# Agent response "agent" name -> result class
+RESULT_TYPES = {
+    "ASR_Agent": ASRResult,
+    "TTS_Agent": TTSResult,
+    "Pain_Assessment_Agent": PainAssessment,
+    "Security_Ethics_Agent": SecurityResult
+}
+
+def parse_agent_result(data: Dict[str, Any]) -> Any:
+    """
+    Typed result for a decoded agent response; failures become AgentError,
+    responses from agents without a result class stay dicts.
+    """
+    if not data.get("success"):
+        return AgentError(error=data.get("error", "unknown error"), agent=data.get("agent"), stderr=data.get("stderr"))
+    result_cls = RESULT_TYPES.get(data.get("agent"))
+    return result_cls.from_dict(data) if result_cls else data
+
+_SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+
+def to_jsonable(value: Any, _seen: Optional[Dict[int, Any]] = None) -> Any:
+    """
+    Convert typed results nested anywhere in dicts/lists to plain dicts.
+    A result referenced in several places is converted once and shared.
+    """
+    if type(value) in _SCALAR_TYPES:
+        return value
+    seen = {} if _seen is None else _seen
+    if isinstance(value, AgentResult):
+        converted = seen.get(id(value))
+        if converted is None:
+            converted = seen[id(value)] = value.to_dict()
+        return converted
+    if isinstance(value, dict):
+        return {key: item if type(item) in _SCALAR_TYPES else to_jsonable(item, seen) for key, item in value.items()}
+    if isinstance(value, list):
+        return [item if type(item) in _SCALAR_TYPES else to_jsonable(item, seen) for item in value]
+    return value
+
+def json_default(value: Any) -> Any:
+    """
+    `default=` hook for json.dumps so typed results can be encoded directly.
+    """
+    if isinstance(value, AgentResult):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
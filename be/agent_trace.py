@@ -0,0 +1,146 @@
+"""
+Capture of agent request/response traces for capacity testing.
+
+With CLINICAMIND_TRACE_FILE set (or PainOrchestrator(trace_file=...),
+pain_orchestrator.py --trace), every call_agent() appends one JSON line:
+
+    {"ts": <unix time>, "agent": "asr_agent.py", "mode": "subprocess",
+     "latency_ms": ..., "success": true, "request": {...}, "response": {...}}
+
+Requests and responses follow the schemas in the agents' process()
+docstrings; trace_replay.py plays them back as load. CLINICAMIND_TRACE_SAMPLE
+(0-1, default 1) records only that fraction of calls.
+
+Traces are redacted before they are written (CLINICAMIND_TRACE_REDACT):
+
+  - "text" (default): free text (transcripts, TTS text, redacted input
+    text) is replaced by filler of the same word count, so payload sizes
+    stay realistic but no clinical content is kept, and everything below.
+  - "patterns": matches of the security rule pack's sensitive patterns
+    (SSNs, phone numbers, emails, ...) in the request's language become
+    "[REDACTED]", and file paths become opaque names that keep only the
+    extension, since file names often carry patient names. Free text is
+    kept, so anything the patterns miss (names, addresses) is kept too.
+  - "none": traces are written as-is, e.g. to replay against the real
+    audio files on a development machine. Never use it on patient data.
+
+Free text and paths are found by key name, from the fixed PATH_KEYS and
+TEXT_KEYS lists below, not from the agents' schemas. A field added to a
+request or response under a new key is only pattern-redacted until it is
+added to those lists, so extend them together with the agents.
+
+Lines are appended with a single O_APPEND write, so several processes can
+share one trace file.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from agent_results import json_default, to_jsonable
+from rule_packs import load_rules
+
+REDACTION_MODES = ("none", "patterns", "text")
+REDACTED = "[REDACTED]"
+# Keys holding file paths, and keys holding free text for "text" redaction;
+# keep in step with the agents' request and response fields
+PATH_KEYS = frozenset(("audio_path", "output_path", "audio_input", "input_path"))
+TEXT_KEYS = frozenset(("transcript", "text", "redacted_text", "first_visit_transcript", "second_visit_transcript"))
+
+def redact_path(path: str) -> str:
+    extension = os.path.splitext(path)[1]
+    return f"redacted-{hashlib.sha256(path.encode()).hexdigest()[:12]}{extension}"
+
+def filler(text: str) -> str:
+    return " ".join("word" for _ in text.split())
+
+def redact(value: Any, patterns: List[Any], mode: str = "text", key: Optional[str] = None) -> Any:
+    """
+    Redacted copy of a JSON value (see module docstring).
+    """
+    if isinstance(value, dict):
+        return {k: redact(v, patterns, mode, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(item, patterns, mode, key) for item in value]
+    if not isinstance(value, str):
+        return value
+    if key in PATH_KEYS:
+        return redact_path(value)
+    if mode == "text" and key in TEXT_KEYS:
+        return filler(value)
+    for _, pattern in patterns:
+        value = pattern.sub(REDACTED, value)
+    return value
+
+class TraceRecorder:
+    def __init__(self, path: str, redaction: Optional[str] = None, sample: Optional[float] = None):
+        self.path = path
+        self.redaction = redaction or os.getenv("CLINICAMIND_TRACE_REDACT", "text")
+        if self.redaction not in REDACTION_MODES:
+            raise ValueError(f"Unknown trace redaction mode: {self.redaction}")
+        self.sample = float(os.getenv("CLINICAMIND_TRACE_SAMPLE", 1.0)) if sample is None else sample
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _write(self, line: bytes):
+        with self._lock:
+            # Reopen after fork rather than share the parent's descriptor
+            if self._fd is None or self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                self._pid = os.getpid()
+            os.write(self._fd, line)
+
+    def record(self, agent_script: str, request: Dict[str, Any], result: Any, seconds: float, mode: str):
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return
+        request = to_jsonable(request)
+        response = to_jsonable(result)
+        if isinstance(response, dict):
+            response.pop("metrics", None)
+        if self.redaction != "none":
+            patterns = load_rules("security", request.get("language") or request.get("language_code")).sensitive_patterns
+            request = redact(request, patterns, self.redaction)
+            response = redact(response, patterns, self.redaction)
+        entry = {
+            "ts": time.time(),
+            "agent": os.path.basename(agent_script),
+            "mode": mode,
+            "latency_ms": seconds * 1000.0,
+            "success": bool(response.get("success")) if isinstance(response, dict) else True,
+            "request": request,
+            "response": response
+        }
+        self._write((json.dumps(entry, default=json_default) + "\n").encode())
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+
+def trace_recorder(trace_file: Optional[str] = None) -> Optional[TraceRecorder]:
+    """
+    Recorder for `trace_file` or CLINICAMIND_TRACE_FILE; None when neither is set.
+    """
+    path = trace_file or os.getenv("CLINICAMIND_TRACE_FILE")
+    return TraceRecorder(path) if path else None
+
+def load_traces(path: str, agents: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Trace entries from a trace file, optionally only those of `agents`
+    (script names, with or without ".py").
+    """
+    wanted = {agent if agent.endswith(".py") else f"{agent}.py" for agent in agents} if agents else None
+    traces = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if wanted is None or entry["agent"] in wanted:
+                traces.append(entry)
+    return traces
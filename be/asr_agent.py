@@ -3,23 +3,76 @@ import json
 import sys
 import argparse
 import os
-from typing import Dict, Any
+import shutil
+import tempfile
+from typing import Dict, Any, List, Optional, Tuple, Union
+from instrumentation import Metrics, profiling
+from speech_fakes import fake_backend_enabled, fake_transcribe
+from content_cache import ContentCache, file_sha256, make_key
+from resilience import CircuitBreaker, RateLimiter, ResiliencePolicy, resilient_call
+from openai_client import get_openai_client
+from agent_results import AgentError, ASRResult
+from shm_transport import decode_message, encode_message
 
-def transcribe_openai_whisper(audio_path: str, language: str = "en") -> str:
+def audio_duration_s(audio_path: str) -> float:
     """
-    Transcribe audio using OpenAI Whisper API.
+    Duration of an audio file, for audio-seconds quotas. Falls back to an
+    estimate from the file size (128 kbit/s) when it cannot be probed.
     """
-    from openai import OpenAI
+    try:
+        if audio_path.lower().endswith(".wav"):
+            import wave
+            with wave.open(audio_path, "rb") as wav:
+                return wav.getnframes() / float(wav.getframerate())
+        from pydub.utils import mediainfo
+        return float(mediainfo(audio_path)["duration"])
+    except Exception:
+        return os.path.getsize(audio_path) / 16000.0
+
+def label_visit(response: ASRResult, request: Dict[str, Any]):
+    """
+    Set the visit type and component metadata of a result from its request.
+    Kept apart from transcription so a cached transcript can be relabelled
+    for the visit that reuses it.
+    """
+    visit_type = request.get("visit_type")
+    response.visit_type = None
+    response.metadata = None
+    if visit_type in ["first_visit", "second_visit"]:
+        response.visit_type = visit_type
+        
+        # Add metadata based on visit type for better integration with components
+        response.metadata = {
+            "conversation_id": 1 if visit_type == "first_visit" else 2,
+            "visit_sequence": visit_type,
+            "timestamp": request.get("timestamp"),
+            "id": request.get("id", f"{visit_type}_{hash(response.audio_path) % 10000}")
+        }
+
+def transcribe_openai_whisper(audio_path: str, language: str = "en", timeout: Optional[float] = None,
+                              cache_dir: Union[str, bool, None] = None) -> str:
+    """
+    Transcribe audio using OpenAI Whisper API, within the shared
+    requests/min and audio-seconds/min quotas kept under `cache_dir`.
+    """
+    limiter = RateLimiter.from_env("openai_whisper", "CLINICAMIND_WHISPER_RPM", "CLINICAMIND_WHISPER_AUDIO_S_PER_MIN", cache_dir)
+    audio_seconds = audio_duration_s(audio_path) if limiter.limits["units"] else 0.0
+    return limiter.call(lambda remaining: _transcribe_openai_whisper(audio_path, language, remaining), audio_seconds, timeout)
+
+def _transcribe_openai_whisper(audio_path: str, language: str, timeout: Optional[float]) -> str:
+    if fake_backend_enabled():
+        return fake_transcribe(audio_path, language)
     
-    # Initialize OpenAI client
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    # Shared, connection-pooled client; retries are handled by the resilience layer
+    client = get_openai_client()
     
     try:
         with open(audio_path, "rb") as audio_file:
             transcript = client.audio.transcriptions.create(
                 model="whisper-1",
                 file=audio_file,
-                language=language[:2] if len(language) > 2 else language  # Convert en-US to en
+                language=language[:2] if len(language) > 2 else language,  # Convert en-US to en
+                timeout=timeout
             )
         
         return transcript.text.strip()
@@ -27,18 +80,157 @@ def transcribe_openai_whisper(audio_path: str, language: str = "en") -> str:
     except Exception as e:
         raise RuntimeError(f"OpenAI Whisper transcription failed: {str(e)}") from e
 
+def transcribe_local_whisper(audio_path: str, language: str = "en") -> Optional[str]:
+    """
+    Transcribe with a locally installed openai-whisper model, if available.
+    """
+    try:
+        import whisper
+    except ImportError:
+        return None
+    model = whisper.load_model(os.getenv("CLINICAMIND_LOCAL_WHISPER_MODEL", "base"))
+    return model.transcribe(audio_path, language=language[:2])["text"].strip()
+
+def speech_backend() -> str:
+    """
+    Backend behind the Whisper API calls; cache keys include it so fake
+    transcripts are never served to runs against the real API.
+    """
+    return "fake" if fake_backend_enabled() else "openai_whisper"
+
+def transcribe_resilient(audio_path: str, language: str = "en-US", cache_dir: Union[str, bool, None] = None) -> Tuple[str, str]:
+    """
+    Transcribe via Whisper with deadlines, retries and a circuit breaker,
+    falling back to a previously cached transcript of the same audio content
+    and then to a local Whisper model. Returns (transcript, backend).
+    `cache_dir` is the transcript cache's root (False bypasses it) and
+    roots the shared breaker and rate limiter state.
+    """
+    cache = ContentCache("asr_transcripts", cache_dir)
+    key = make_key(file_sha256(audio_path), language, speech_backend())
+    
+    def cached_transcript():
+        entry = cache.get_json(key)
+        return entry["transcript"] if entry else None
+    
+    primary = speech_backend()
+    transcript, backend = resilient_call(
+        CircuitBreaker("openai_whisper", cache_dir=cache_dir),
+        lambda timeout: transcribe_openai_whisper(audio_path, language, timeout, cache_dir),
+        ResiliencePolicy.from_env(attempt_timeout=120.0, deadline=300.0),
+        fallbacks=[
+            ("cache", cached_transcript),
+            ("local_whisper", lambda: transcribe_local_whisper(audio_path, language))
+        ],
+        primary_name=primary
+    )
+    if backend == primary:
+        cache.put_json(key, {"transcript": transcript})
+    return transcript, backend
+
+def transcribe_pcm_cached(samples, language: str, work_path: str, cache_dir: Union[str, bool, None] = None) -> Dict[str, Any]:
+    """
+    Transcribe a span of 16 kHz mono PCM, reusing the cached transcript of
+    byte-identical samples when there is one.
+    """
+    from audio_preprocess import encode_audio
+    from audio_chunking import pcm_digest
+    
+    cache = ContentCache("asr_chunks", cache_dir)
+    key = make_key("asr_pcm", pcm_digest(samples), language, speech_backend())
+    entry = cache.get_json(key)
+    if entry is not None:
+        return {"text": entry["text"], "backend": "chunk_cache", "cached": True}
+    
+    text, backend = transcribe_resilient(encode_audio(samples, work_path), language, cache_dir)
+    # Keep lower-quality local fallback output out of the cache
+    if backend != "local_whisper":
+        cache.put_json(key, {"text": text})
+    return {"text": text, "backend": backend, "cached": False}
+
+def transcribe_spans(samples, spans: List[Tuple[int, int]], language: str, sample_rate: int, max_workers: int = 4, cache_dir: Union[str, bool, None] = None) -> Tuple[str, List[Dict[str, Any]], str]:
+    """
+    Transcribe (start_sample, end_sample) spans of decoded audio in parallel
+    and stitch the texts. Returns (transcript, pieces, backend), where each
+    piece has start/end offsets in seconds of the original recording.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    work_dir = tempfile.mkdtemp(prefix="asr_spans_")
+    
+    def transcribe_span(item):
+        index, (start, end) = item
+        piece = transcribe_pcm_cached(samples[start:end], language, os.path.join(work_dir, f"span_{index}.ogg"), cache_dir)
+        return dict(piece, start=start / sample_rate, end=end / sample_rate)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pieces = list(executor.map(transcribe_span, enumerate(spans)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    backends = {piece["backend"] for piece in pieces}
+    backend = backends.pop() if len(backends) == 1 else ("mixed" if backends else "none")
+    transcript = " ".join(piece["text"] for piece in pieces if piece["text"])
+    return transcript, pieces, backend
+
+def transcribe_speech_segments(audio_path: str, language: str = "en-US", max_workers: int = 4, cache_dir: Union[str, bool, None] = None) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any], str]:
+    """
+    Run voice activity detection over the decoded audio and transcribe only
+    the speech regions. Segment offsets are seconds into the original
+    recording, so downstream timing stays aligned.
+    Returns (transcript, segments, vad_summary, backend).
+    """
+    from audio_preprocess import decode_audio, ASR_SAMPLE_RATE
+    from vad import speech_segments
+    
+    samples = decode_audio(audio_path, ASR_SAMPLE_RATE)
+    vad = speech_segments(samples, ASR_SAMPLE_RATE)
+    spans = [(segment["start_sample"], segment["end_sample"]) for segment in vad["segments"]]
+    transcript, segments, backend = transcribe_spans(samples, spans, language, ASR_SAMPLE_RATE, max_workers, cache_dir)
+    return transcript, segments, {"duration_s": vad["duration_s"], "speech_ratio": vad["speech_ratio"]}, backend
+
+def transcribe_chunked(audio_path: str, language: str = "en-US", max_workers: int = 4, cache_dir: Union[str, bool, None] = None) -> Tuple[str, List[Dict[str, Any]], str]:
+    """
+    Split the decoded audio into content-defined chunks and transcribe only
+    chunks whose samples have not been transcribed before, so a trimmed or
+    extended recording re-uses the transcripts of its unchanged parts.
+    Returns (transcript, chunks, backend).
+    """
+    from audio_preprocess import decode_audio, ASR_SAMPLE_RATE
+    from audio_chunking import content_defined_chunks
+    
+    samples = decode_audio(audio_path, ASR_SAMPLE_RATE)
+    spans = content_defined_chunks(samples, ASR_SAMPLE_RATE)
+    return transcribe_spans(samples, spans, language, ASR_SAMPLE_RATE, max_workers, cache_dir)
+
 class ASRAgent:
+    name = "ASR_Agent"
+    version = "1.0"
+    
     def __init__(self):
-        self.name = "ASR_Agent"
-        self.version = "1.0"
+        self.metrics = Metrics()
     
-    def process(self, request: Dict[str, Any]) -> Dict[str, Any]:
+    @classmethod
+    def fingerprint(cls) -> str:
+        """
+        Identity of everything that determines this agent's output besides
+        the request; the orchestrator keys its stage cache on it.
+        """
+        return make_key(cls.name, cls.version, "fake" if fake_backend_enabled() else "whisper")
+    
+    def process(self, request: Dict[str, Any]) -> ASRResult:
         """
         Process ASR request and return JSON response.
         Expected input: {
             "audio_path": "path/to/file", 
             "language": "en-US",
-            "visit_type": "first_visit" | "second_visit" (optional)
+            "visit_type": "first_visit" | "second_visit" (optional),
+            "preprocess": true | false (optional, default from CLINICAMIND_ASR_PREPROCESS),
+            "vad": true | false (optional, default from CLINICAMIND_ASR_VAD),
+            "chunked": true | false (optional, default from CLINICAMIND_ASR_CHUNKED),
+            "speech_cache": "cache/dir" | false (optional, transcript cache root,
+                            default CLINICAMIND_CACHE_DIR; false bypasses it)
         }
         """
         try:
@@ -47,43 +239,69 @@ class ASRAgent:
             visit_type = request.get("visit_type")
             
             if not audio_path:
-                return {
-                    "success": False,
-                    "error": "Missing audio_path in request",
-                    "agent": self.name
-                }
+                return AgentError(error="Missing audio_path in request", agent=self.name)
+            
+            preprocess = request.get("preprocess", os.getenv("CLINICAMIND_ASR_PREPROCESS", "") == "1")
+            use_vad = request.get("vad", os.getenv("CLINICAMIND_ASR_VAD", "") == "1")
+            chunked = request.get("chunked", os.getenv("CLINICAMIND_ASR_CHUNKED", "") == "1")
+            cache_dir = request.get("speech_cache")
+            preprocessing = None
+            segments = None
+            vad_summary = None
+            chunks = None
             
-            transcript = transcribe_openai_whisper(audio_path, language)
+            # VAD and chunked modes decode and re-encode each span themselves;
+            # VAD segments are cached per span just like chunks
+            if use_vad:
+                with self.metrics.span("api_call", api="whisper", vad=True):
+                    transcript, segments, vad_summary, backend = transcribe_speech_segments(audio_path, language, cache_dir=cache_dir)
+                self.metrics.incr("speech_segments", len(segments))
+                self.metrics.incr("span_cache_hits", sum(segment["cached"] for segment in segments))
+            elif chunked:
+                with self.metrics.span("api_call", api="whisper", chunked=True):
+                    transcript, chunks, backend = transcribe_chunked(audio_path, language, cache_dir=cache_dir)
+                self.metrics.incr("audio_chunks", len(chunks))
+                self.metrics.incr("span_cache_hits", sum(chunk["cached"] for chunk in chunks))
+            else:
+                upload_path = audio_path
+                if preprocess:
+                    from audio_preprocess import preprocess_for_asr
+                    with self.metrics.span("preprocess"):
+                        preprocessing = preprocess_for_asr(audio_path, cache_dir=cache_dir)
+                    upload_path = preprocessing["path"]
+                
+                try:
+                    with self.metrics.span("api_call", api="whisper"):
+                        transcript, backend = transcribe_resilient(upload_path, language, cache_dir)
+                    self.metrics.incr("upload_bytes", os.path.getsize(upload_path))
+                finally:
+                    # An uncached run keeps no copy of the patient audio
+                    if preprocessing and preprocessing.get("temporary"):
+                        os.unlink(upload_path)
+            self.metrics.incr("backend_calls", backend=backend)
             
             # Base response structure
-            response = {
-                "success": True,
-                "agent": self.name,
-                "transcript": transcript,
-                "audio_path": audio_path,
-                "language": language
-            }
+            response = ASRResult(
+                agent=self.name,
+                transcript=transcript,
+                audio_path=audio_path,
+                language=language,
+                backend=backend,
+                preprocessing=preprocessing or None,
+                segments=segments,
+                vad=vad_summary,
+                chunks=chunks
+            )
             
-            # Add visit type information if provided
-            if visit_type in ["first_visit", "second_visit"]:
-                response["visit_type"] = visit_type
-                
-                # Add metadata based on visit type for better integration with components
-                response["metadata"] = {
-                    "conversation_id": 1 if visit_type == "first_visit" else 2,
-                    "visit_sequence": visit_type,
-                    "timestamp": request.get("timestamp"),
-                    "id": request.get("id", f"{visit_type}_{hash(audio_path) % 10000}")
-                }
+            label_visit(response, request)
+            
+            if request.get("collect_metrics"):
+                response.metrics = self.metrics.drain()
             
             return response
             
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "agent": self.name
-            }
+            return AgentError(error=str(e), agent=self.name)
 
 def main():
     parser = argparse.ArgumentParser(description="ASR Agent - Speech-to-Text service")
@@ -92,6 +310,9 @@ def main():
     parser.add_argument("--language", default="en-US", help="Language code")
     parser.add_argument("--visit-type", choices=["first_visit", "second_visit"], 
                        help="Visit type for medical context")
+    parser.add_argument("--preprocess", action="store_true", help="Resample to 16 kHz mono and re-encode before upload")
+    parser.add_argument("--vad", action="store_true", help="Transcribe only speech segments detected by VAD")
+    parser.add_argument("--chunked", action="store_true", help="Transcribe content-defined chunks, re-using cached chunk transcripts")
     args = parser.parse_args()
     
     agent = ASRAgent()
@@ -103,6 +324,12 @@ def main():
         }
         if args.visit_type:
             request["visit_type"] = args.visit_type
+        if args.preprocess:
+            request["preprocess"] = True
+        if args.vad:
+            request["vad"] = True
+        if args.chunked:
+            request["chunked"] = True
     elif args.input:
         if args.input.startswith('{'):
             request = json.loads(args.input)
@@ -110,10 +337,12 @@ def main():
             with open(args.input, 'r') as f:
                 request = json.load(f)
     else:
-        request = json.load(sys.stdin)
+        request = decode_message(sys.stdin.read())
     
-    result = agent.process(request)
-    print(json.dumps(result, indent=2))
+    with profiling("asr_agent"):
+        result = agent.process(request)
+    output, _ = encode_message(result.to_dict(), request.get("shm_threshold"), indent=2)
+    print(output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Audio pre-processing for ASR: decode any input pydub/ffmpeg can read,
+resample to 16 kHz mono and re-encode compactly before upload.
+
+Speech recognition does not benefit from 44.1 kHz stereo, so this shrinks
+uploads considerably for long encounters and gives every ASR backend the
+same input format. Results are cached by source content hash.
+"""
+import os
+import tempfile
+from typing import Dict, Any, Optional, Union
+
+import numpy as np
+
+from content_cache import ContentCache, file_sha256, make_key
+
+ASR_SAMPLE_RATE = 16000
+PREPROCESS_VERSION = "1"
+
+# Container -> (pydub export kwargs); all are accepted by the Whisper API
+ENCODINGS = {
+    "ogg": {"format": "ogg", "codec": "libopus", "bitrate": "24k"},
+    "mp3": {"format": "mp3", "bitrate": "32k"},
+    "flac": {"format": "flac"}
+}
+
+def decode_audio(audio_path: str, sample_rate: int = ASR_SAMPLE_RATE) -> np.ndarray:
+    """
+    Decode an audio file to mono 16-bit PCM samples at `sample_rate`.
+    """
+    from pydub import AudioSegment
+
+    segment = AudioSegment.from_file(audio_path)
+    segment = segment.set_channels(1).set_frame_rate(sample_rate).set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype=np.int16)
+
+def encode_audio(samples: np.ndarray, out_path: str, sample_rate: int = ASR_SAMPLE_RATE, fmt: str = "ogg") -> str:
+    """
+    Encode mono 16-bit PCM samples to `out_path` in one of ENCODINGS.
+    """
+    from pydub import AudioSegment
+
+    segment = AudioSegment(
+        np.ascontiguousarray(samples, dtype=np.int16).tobytes(),
+        frame_rate=sample_rate,
+        sample_width=2,
+        channels=1
+    )
+    segment.export(out_path, **ENCODINGS[fmt])
+    return out_path
+
+def preprocess_for_asr(audio_path: str, fmt: str = None, sample_rate: int = ASR_SAMPLE_RATE, cache_dir: Union[str, bool, None] = None) -> Dict[str, Any]:
+    """
+    Return a compact 16 kHz mono re-encoding of `audio_path`, reusing a cached
+    copy when the same content has been processed before. With
+    `cache_dir=False` nothing is cached: the re-encoding goes to a temporary
+    file ("temporary": True) that the caller deletes after upload.
+    """
+    fmt = fmt or os.getenv("CLINICAMIND_ASR_PREPROCESS_FORMAT", "ogg")
+    if fmt not in ENCODINGS:
+        raise ValueError(f"Unsupported preprocessing format: {fmt}")
+
+    if cache_dir is False:
+        samples = decode_audio(audio_path, sample_rate)
+        fd, out_path = tempfile.mkstemp(prefix="asr_preprocessed_", suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            encode_audio(samples, out_path, sample_rate, fmt)
+        except BaseException:
+            os.unlink(out_path)
+            raise
+        return {
+            "path": out_path,
+            "format": fmt,
+            "sample_rate": sample_rate,
+            "source_bytes": os.path.getsize(audio_path),
+            "upload_bytes": os.path.getsize(out_path),
+            "duration_s": len(samples) / sample_rate,
+            "cached": False,
+            "temporary": True
+        }
+
+    cache = ContentCache("asr_preprocessed", cache_dir)
+    key = make_key("preprocess", PREPROCESS_VERSION, file_sha256(audio_path), sample_rate, fmt)
+    out_path = cache.path(key, f".{fmt}")
+    meta = cache.get_json(key)
+    cached = meta is not None and os.path.exists(out_path)
+
+    if not cached:
+        samples = decode_audio(audio_path, sample_rate)
+        os.makedirs(cache.directory, exist_ok=True)
+        # Encode beside the final path, then rename so readers never see a partial file
+        part_path = f"{out_path}.{os.getpid()}.part.{fmt}"
+        encode_audio(samples, part_path, sample_rate, fmt)
+        os.replace(part_path, out_path)
+        meta = {"duration_s": len(samples) / sample_rate}
+        cache.put_json(key, meta)
+
+    return {
+        "path": out_path,
+        "format": fmt,
+        "sample_rate": sample_rate,
+        "source_bytes": os.path.getsize(audio_path),
+        "upload_bytes": os.path.getsize(out_path),
+        "duration_s": meta["duration_s"],
+        "cached": cached
+    }
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Batch runner with a priority triage lane.
+
+Encounters (visit pairs) from a manifest are transcribed first, in
+manifest order. A fast pre-screen of the transcripts - the security agent's
+concerning terms, and a lexicon pain estimate against its pain score
+thresholds - assigns each encounter a priority. Full pipeline runs are then
+taken from a heap in priority order, so emergency and self-harm encounters
+overtake a queued backlog of routine ones.
+
+The full run reuses the screened transcripts through the orchestrator's
+stage cache, so nothing is transcribed twice.
+
+Manifest: a JSON list, or JSON lines, of
+    {"id": "<optional>", "first_visit": "<audio>", "second_visit": "<audio>"}
+Ids name the per-encounter output files, so they must be unique and are
+limited to letters, digits, ".", "_" and "-".
+"""
+import os
+import re
+import json
+import time
+import heapq
+import argparse
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+from instrumentation import Metrics
+from pain_orchestrator import AGENT_MODES, PainOrchestrator
+from pain_assessment_agent import estimate_pain_from_text, pain_lexicon
+
+# Priority levels, most urgent first
+PRIORITIES = ("emergency", "urgent", "routine")
+ROUTINE = {"priority": "routine", "level": 2, "reasons": [], "estimated_pain": None}
+ENCOUNTER_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9._-]*")
+
+def triage(transcripts: List[str], language: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Pre-screen an encounter's transcripts and assign a priority, with the
+    rule packs for their language.
+    Any concerning term (self-harm, abuse, ...) or an estimated pain score
+    at the emergency threshold makes the encounter an emergency.
+    """
+    from security_ethics_agent import SecurityEthicsAgent
+    rules = SecurityEthicsAgent.rules(language)
+    lexicon = pain_lexicon(language)
+    thresholds = rules.pain_score_thresholds
+
+    reasons = []
+    estimates = []
+    for transcript in transcripts:
+        reasons.extend(f"concerning_term:{term}" for term in rules.find_concerning(transcript))
+        estimates.append(estimate_pain_from_text(transcript, lexicon)[0])
+    reasons = list(dict.fromkeys(reasons))
+    estimated_pain = max(estimates, default=None)
+
+    if estimated_pain is not None and estimated_pain >= thresholds['emergency']:
+        reasons.append(f"estimated_pain:{estimated_pain:g}")
+    if reasons:
+        level = 0
+    elif estimated_pain is not None and estimated_pain >= thresholds['urgent']:
+        reasons.append(f"estimated_pain:{estimated_pain:g}")
+        level = 1
+    else:
+        level = 2
+    return {"priority": PRIORITIES[level], "level": level, "reasons": reasons, "estimated_pain": estimated_pain}
+
+class TriageQueue:
+    """
+    Blocking priority queue: lowest level first, FIFO within a level.
+    get() returns None once the queue is closed and drained.
+    """
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, level: int, item: Any):
+        with self._cond:
+            heapq.heappush(self._heap, (level, next(self._seq), item))
+            self._cond.notify()
+
+    def get(self) -> Optional[Any]:
+        with self._cond:
+            while not self._heap and not self._closed:
+                self._cond.wait()
+            if not self._heap:
+                return None
+            return heapq.heappop(self._heap)[2]
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        text = f.read()
+    stripped = text.lstrip()
+    entries = json.loads(text) if stripped.startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    for index, entry in enumerate(entries):
+        entry.setdefault("id", f"encounter_{index + 1}")
+    return entries
+
+def check_encounter_ids(encounters: List[Dict[str, Any]]):
+    """
+    Raise ValueError for an id that is not a plain file name (e.g. "bad/id"
+    or "..") or that is used twice, before any output is written.
+    """
+    seen = set()
+    for encounter in encounters:
+        encounter_id = encounter.get("id")
+        if not isinstance(encounter_id, str) or not ENCOUNTER_ID.fullmatch(encounter_id):
+            raise ValueError(f"Invalid encounter id {encounter_id!r}: use letters, digits, '.', '_' and '-'")
+        if encounter_id in seen:
+            raise ValueError(f"Duplicate encounter id {encounter_id!r}: each encounter needs its own output files")
+        seen.add(encounter_id)
+
+class BatchRunner:
+    """
+    Screens encounters with `screen_workers` threads and runs full pipelines
+    with `workers` threads, highest priority first. Each thread drives its
+    own PainOrchestrator, since an orchestrator tracks one run at a time.
+    """
+    def __init__(self, output_dir: str, workers: int = 2, screen_workers: int = 4, use_triage: bool = True, language: str = "en-US", voice_name: str = "en-US-Neural2-F", **orchestrator_kwargs):
+        self.output_dir = output_dir
+        self.workers = max(1, workers)
+        self.screen_workers = max(1, screen_workers)
+        self.use_triage = use_triage
+        self.language = language
+        self.voice_name = voice_name
+        self.orchestrator_kwargs = orchestrator_kwargs
+        self.metrics = Metrics()
+        self._local = threading.local()
+        self._orchestrators = []
+        self._lock = threading.Lock()
+
+    def _orchestrator(self) -> PainOrchestrator:
+        orchestrator = getattr(self._local, "orchestrator", None)
+        if orchestrator is None:
+            orchestrator = self._local.orchestrator = PainOrchestrator(**self.orchestrator_kwargs)
+            with self._lock:
+                self._orchestrators.append(orchestrator)
+        return orchestrator
+
+    def screen(self, encounter: Dict[str, Any]) -> Dict[str, Any]:
+        orchestrator = self._orchestrator()
+        with self.metrics.span("screen"):
+            transcripts = []
+            for visit_name in ("first_visit", "second_visit"):
+                asr_result = orchestrator.transcribe(encounter[visit_name], self.language, visit_name)
+                if asr_result.success:
+                    transcripts.append(asr_result.transcript)
+            # A failed transcription stays routine; the full run reports it
+            return triage(transcripts, self.language)
+
+    def process(self, encounter: Dict[str, Any], screening: Dict[str, Any], started: float, log) -> Dict[str, Any]:
+        orchestrator = self._orchestrator()
+        encounter_id = encounter["id"]
+        result = orchestrator.process_dual_audio(
+            encounter["first_visit"],
+            encounter["second_visit"],
+            language=self.language,
+            voice_name=self.voice_name,
+            output_audio=os.path.join(self.output_dir, f"{encounter_id}.wav")
+        )
+        result["triage"] = screening
+        # Written through a temp file and rename, so the JSON is never seen half-written
+        path = os.path.join(self.output_dir, f"{encounter_id}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, path)
+
+        latency = time.perf_counter() - started
+        self.metrics.record_span("encounter_latency", latency, priority=screening["priority"])
+        final = result["final_result"]
+        entry = {
+            "id": encounter_id,
+            "priority": screening["priority"],
+            "reasons": screening["reasons"],
+            "success": bool(final.get("success")),
+            "requires_review": bool(final.get("requires_review")) or screening["level"] == 0,
+            "latency_ms": latency * 1000.0
+        }
+        if not entry["success"]:
+            entry["error"] = final.get("error")
+        self.log_entry(log, entry)
+        return entry
+
+    def failed(self, encounter: Dict[str, Any], screening: Dict[str, Any], started: float, error: Exception, log) -> Dict[str, Any]:
+        """
+        Log an encounter whose run raised, so one bad encounter neither
+        kills its worker nor goes missing from the review log.
+        """
+        self.metrics.incr("encounter_failures", priority=screening["priority"])
+        entry = {
+            "id": encounter["id"],
+            "priority": screening["priority"],
+            "reasons": screening["reasons"],
+            "success": False,
+            "requires_review": screening["level"] == 0,
+            "latency_ms": (time.perf_counter() - started) * 1000.0,
+            "error": f"Encounter failed: {error}"
+        }
+        self.log_entry(log, entry)
+        return entry
+
+    def log_entry(self, log, entry: Dict[str, Any]):
+        # Completion-ordered review log, flushed per encounter
+        with self._lock:
+            log.write(json.dumps(entry) + "\n")
+            log.flush()
+
+    def run(self, encounters: List[Dict[str, Any]]) -> Dict[str, Any]:
+        from concurrent.futures import ThreadPoolExecutor
+
+        check_encounter_ids(encounters)
+        os.makedirs(self.output_dir, exist_ok=True)
+        queue = TriageQueue()
+        started = time.perf_counter()
+        entries = []
+
+        def screen_and_enqueue(encounter: Dict[str, Any]):
+            screening = dict(ROUTINE)
+            if self.use_triage:
+                try:
+                    screening = self.screen(encounter)
+                except Exception:
+                    # Like a failed transcription: routine, and the full run reports it
+                    self.metrics.incr("screen_failures")
+            self.metrics.incr("encounters_screened", priority=screening["priority"])
+            queue.put(screening["level"], (encounter, screening))
+
+        def worker(log):
+            while True:
+                item = queue.get()
+                if item is None:
+                    return
+                encounter, screening = item
+                try:
+                    entry = self.process(encounter, screening, started, log)
+                except Exception as e:
+                    entry = self.failed(encounter, screening, started, e, log)
+                with self._lock:
+                    entries.append(entry)
+
+        with open(os.path.join(self.output_dir, "triage.jsonl"), "w") as log:
+            threads = [threading.Thread(target=worker, args=(log,), daemon=True) for _ in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            try:
+                with ThreadPoolExecutor(max_workers=self.screen_workers) as executor:
+                    list(executor.map(screen_and_enqueue, encounters))
+            finally:
+                queue.close()
+                for thread in threads:
+                    thread.join()
+                for orchestrator in self._orchestrators:
+                    orchestrator.close()
+
+        latency = {entry["labels"]["priority"]: {k: entry[k] for k in ("count", "p50_ms", "p95_ms", "p99_ms", "max_ms")}
+                   for entry in self.metrics.summary() if entry["name"] == "encounter_latency"}
+        return {
+            "encounters": len(encounters),
+            "succeeded": sum(entry["success"] for entry in entries),
+            "by_priority": {priority: sum(entry["priority"] == priority for entry in entries) for priority in PRIORITIES},
+            "latency": latency,
+            "elapsed_s": time.perf_counter() - started
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch pain assessment with a priority triage lane for high-risk encounters")
+    parser.add_argument("--manifest", required=True, help="JSON list or JSON lines of {id, first_visit, second_visit}")
+    parser.add_argument("--output-dir", required=True, help="Directory for per-encounter results and triage.jsonl")
+    parser.add_argument("--workers", type=int, default=2, help="Full pipeline runs in parallel")
+    parser.add_argument("--screen-workers", type=int, default=4, help="Encounters transcribed and screened in parallel")
+    parser.add_argument("--no-triage", action="store_true", help="Process encounters in manifest order (FIFO baseline)")
+    parser.add_argument("--mode", choices=AGENT_MODES, default="subprocess", help="Agent execution mode")
+    parser.add_argument("--cache-dir", help="Pipeline and per-stage result cache directory")
+    parser.add_argument("--language", default="en-US", help="Language code")
+    parser.add_argument("--voice", default="en-US-Neural2-F", help="TTS voice name")
+    args = parser.parse_args()
+
+    runner = BatchRunner(
+        args.output_dir,
+        workers=args.workers,
+        screen_workers=args.screen_workers,
+        use_triage=not args.no_triage,
+        language=args.language,
+        voice_name=args.voice,
+        cache_dir=args.cache_dir,
+        mode=args.mode
+    )
+    encounters = load_manifest(args.manifest)
+    try:
+        check_encounter_ids(encounters)
+    except ValueError as e:
+        parser.error(str(e))
+    summary = runner.run(encounters)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
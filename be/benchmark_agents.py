@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the pain assessment agents and the end-to-end pipeline.
+
+Runs offline: speech APIs are replaced by the fakes in speech_fakes.py and
+transcripts come from a seeded synthetic corpus, so results are reproducible
+and comparable between commits.
+
+    python benchmark_agents.py --output bench.json
+    python benchmark_agents.py --output new.json --compare bench.json
+
+Each agent's cold import time is also checked against IMPORT_BUDGETS_MS
+(via `python -X importtime`); the run fails if an agent is over budget.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import shutil
+import platform
+import subprocess
+import tempfile
+from typing import Dict, Any, List, Callable
+
+from instrumentation import Metrics
+
+CLINICAL_SENTENCES = [
+    "The patient reports sharp pain on the left arm, upper part on the front.",
+    "It started about a week ago after a fall.",
+    "Lying down makes it worse and turning the head left is painful.",
+    "Extra strength Tylenol helps a bit.",
+    "Reflexes are symmetric and strength is normal.",
+    "The pain is throbbing and really wakes me up at night.",
+    "It feels moderate most days but sometimes severe.",
+    "I would say it is about a {score} out of 10 today.",
+    "Ibuprofen twice daily with food for one week.",
+    "We will schedule an EMG and nerve conduction study."
+]
+
+# Cold-start budget per module: cumulative `-X importtime` of the module,
+# median of several fresh interpreters. Measured medians are 25-80 ms
+# depending on the machine; budgets leave about 2x headroom for timing noise
+# and still fail when a heavy dependency (numpy, joblib, sklearn, openai,
+# pydub - each 80 ms to over a second) is imported eagerly.
+IMPORT_BUDGETS_MS = {
+    "asr_agent": 150.0,
+    "tts_agent": 150.0,
+    "pain_assessment_agent": 120.0,
+    "security_ethics_agent": 120.0,
+    "test_security_agent": 60.0,
+    "pain_orchestrator": 150.0
+}
+
+def _pii_token(rng: random.Random) -> str:
+    kind = rng.randrange(4)
+    if kind == 0:
+        return f"{rng.randrange(100, 999)}-{rng.randrange(10, 99)}-{rng.randrange(1000, 9999)}"
+    if kind == 1:
+        return "".join(str(rng.randrange(10)) for _ in range(16))
+    if kind == 2:
+        return f"patient{rng.randrange(1000)}@example.com"
+    return "".join(str(rng.randrange(10)) for _ in range(10))
+
+def make_transcript(rng: random.Random, n_words: int, pii_density: float) -> str:
+    """
+    Build a synthetic encounter transcript of roughly n_words words where
+    about pii_density of the words are PII tokens (SSN, card, email, phone).
+    """
+    words = []
+    while len(words) < n_words:
+        sentence = rng.choice(CLINICAL_SENTENCES).format(score=rng.randrange(11))
+        for word in sentence.split():
+            if pii_density and rng.random() < pii_density:
+                words.append(_pii_token(rng))
+            words.append(word)
+    return " ".join(words[:n_words])
+
+def build_corpus(seed: int, lengths: List[int], densities: List[float], samples: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [
+        {
+            "n_words": n_words,
+            "pii_density": density,
+            "transcripts": [make_transcript(rng, n_words, density) for _ in range(samples)]
+        }
+        for n_words in lengths
+        for density in densities
+    ]
+
+def measure(fn: Callable[[Any], Any], inputs: List[Any], repeats: int, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Time fn over every input `repeats` times and summarise latency and throughput.
+    """
+    for item in inputs[:warmup]:
+        fn(item)
+
+    metrics = Metrics()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in inputs:
+            with metrics.span("call"):
+                fn(item)
+    elapsed = time.perf_counter() - start
+
+    summary = metrics.summary()[0]
+    return {
+        "calls": summary["count"],
+        "mean_ms": summary["total_ms"] / summary["count"],
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": summary["p99_ms"],
+        "max_ms": summary["max_ms"],
+        "throughput_per_s": summary["count"] / elapsed if elapsed > 0 else None
+    }
+
+def run_benchmark(results: List[Dict[str, Any]], name: str, params: Dict[str, Any], fn: Callable[[Any], Any], inputs: List[Any], repeats: int):
+    entry = {"benchmark": name, "params": params}
+    try:
+        entry.update(measure(fn, inputs, repeats))
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    results.append(entry)
+    status = entry.get("error") or f"p50 {entry['p50_ms']:.3f} ms, p99 {entry['p99_ms']:.3f} ms, {entry['throughput_per_s']:.1f}/s"
+    print(f"{name} {params}: {status}", file=sys.stderr)
+
+def bench_text_agents(results: List[Dict[str, Any]], corpus: List[Dict[str, Any]], repeats: int):
+    from pain_assessment_agent import estimate_pain_from_text
+    from security_ethics_agent import SecurityEthicsAgent
+
+    security_agent = SecurityEthicsAgent()
+    try:
+        from pain_assessment_agent import PainAssessmentAgent
+        pain_agent = PainAssessmentAgent()
+    except Exception as e:
+        pain_agent = None
+        pain_agent_error = f"{type(e).__name__}: {e}"
+
+    for bucket in corpus:
+        params = {"n_words": bucket["n_words"], "pii_density": bucket["pii_density"]}
+        transcripts = bucket["transcripts"]
+        run_benchmark(results, "estimate_pain_from_text", params, estimate_pain_from_text, transcripts, repeats)
+        run_benchmark(results, "validate_input_security", params, security_agent.validate_input_security, transcripts, repeats)
+        if pain_agent:
+            run_benchmark(results, "assess_pain", params, lambda t: pain_agent.assess_pain({"transcript": t}), transcripts, repeats)
+        else:
+            results.append({"benchmark": "assess_pain", "params": params, "error": pain_agent_error})
+
+def bench_micro_batching(results: List[Dict[str, Any]], repeats: int, requests: int = 256):
+    """
+    Concurrent single-row predictions through MicroBatcher versus one
+    predict() per row. The simulated model costs 1 ms per call plus 20 us
+    per row, roughly the shape of a small sklearn estimator.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from micro_batcher import MicroBatcher
+
+    def predict(rows):
+        time.sleep(0.001 + 0.00002 * len(rows))
+        return [sum(row) for row in rows]
+
+    for concurrency in (1, 8, 32):
+        for max_batch_size in (1, 32):
+            params = {"concurrency": concurrency, "max_batch_size": max_batch_size}
+            metrics = Metrics()
+            batcher = MicroBatcher(predict, max_batch_size=max_batch_size, max_wait_ms=2.0, metrics=metrics)
+
+            def call(row):
+                with metrics.span("call"):
+                    batcher.predict(row)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for _ in range(repeats):
+                    list(executor.map(call, [[i, i % 7] for i in range(requests)]))
+            elapsed = time.perf_counter() - start
+
+            summary = {entry["name"]: entry for entry in metrics.summary()}["call"]
+            counters = {counter["name"]: counter["value"] for counter in metrics.to_dict()["counters"]}
+            entry = {
+                "benchmark": "micro_batch_predict",
+                "params": params,
+                "calls": summary["count"],
+                "p50_ms": summary["p50_ms"],
+                "p99_ms": summary["p99_ms"],
+                "throughput_per_s": summary["count"] / elapsed,
+                "mean_batch_size": counters["batched_rows"] / counters["batches"]
+            }
+            results.append(entry)
+            print(f"micro_batch_predict {params}: p50 {entry['p50_ms']:.3f} ms, {entry['throughput_per_s']:.1f}/s, "
+                  f"mean batch {entry['mean_batch_size']:.1f}", file=sys.stderr)
+
+def bench_pipeline(results: List[Dict[str, Any]], seed: int, n_words: int, repeats: int):
+    from pain_orchestrator import AGENT_MODES, PainOrchestrator, close_agent_hosts
+
+    rng = random.Random(seed)
+    work_dir = tempfile.mkdtemp(prefix="clinicamind_bench_")
+    try:
+        visit_paths = []
+        for visit_name in ("first_visit", "second_visit"):
+            audio_path = os.path.join(work_dir, f"{visit_name}.m4a")
+            with open(audio_path, "wb") as f:
+                f.write(rng.randbytes(64 * 1024))
+            with open(f"{audio_path}.txt", "w") as f:
+                f.write(make_transcript(rng, n_words, 0.0))
+            visit_paths.append(audio_path)
+        output_audio = os.path.join(work_dir, "assessment.wav")
+
+        last_results = []
+        # Agent modes run uncached; "cached" re-runs an already memoized encounter
+        for mode, use_cache in [(mode, False) for mode in AGENT_MODES] + [("subprocess", True)]:
+            orchestrator = PainOrchestrator(cache_dir=os.path.join(work_dir, "cache"), mode=mode)
+
+            def run_pipeline(_):
+                result = orchestrator.process_dual_audio(visit_paths[0], visit_paths[1], output_audio=output_audio, use_cache=use_cache)
+                if not result["final_result"].get("success"):
+                    raise RuntimeError(result["final_result"].get("error", "pipeline failed"))
+                last_results.append(result)
+
+            if use_cache:
+                run_pipeline(None)
+            run_benchmark(results, "process_dual_audio", {"mode": mode, "cached": use_cache, "n_words": n_words}, run_pipeline, [None], repeats)
+            orchestrator.close()
+            # Each mode starts its own agent host; stop it before the next mode
+            close_agent_hosts()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if last_results:
+        bench_serialization(results, last_results[-1], n_words, repeats)
+
+def bench_serialization(results: List[Dict[str, Any]], pipeline_result: Dict[str, Any], n_words: int, repeats: int):
+    from result_format import available_encodings, compact_result, encode_result
+
+    for compact in (False, True):
+        for encoding in available_encodings():
+            params = {"compact": compact, "encoding": encoding, "n_words": n_words}
+            encode = lambda r: encode_result(compact_result(r) if compact else r, encoding)
+            run_benchmark(results, "serialize_result", params, encode, [pipeline_result], repeats * 10)
+            results[-1]["output_bytes"] = len(encode(pipeline_result))
+
+def import_time_ms(module: str) -> float:
+    """
+    Cumulative import time of `module` in a fresh interpreter, in milliseconds.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True)
+    for line in reversed(proc.stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000.0
+    raise RuntimeError(f"No -X importtime entry for {module}")
+
+def bench_import_times(results: List[Dict[str, Any]], repeats: int) -> bool:
+    """
+    Record each agent's cold import time; return False if any exceeds its budget.
+    """
+    ok = True
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        entry = {"benchmark": "import_time", "params": {"module": module}, "budget_ms": budget_ms}
+        try:
+            samples = sorted(import_time_ms(module) for _ in range(repeats))
+            median = samples[len(samples) // 2]
+            entry.update({"best_ms": samples[0], "median_ms": median, "within_budget": median <= budget_ms})
+            status = f"median {median:.1f} ms (budget {budget_ms:.0f} ms){'' if entry['within_budget'] else '  OVER BUDGET'}"
+        except Exception as e:
+            entry.update({"error": f"{type(e).__name__}: {e}", "within_budget": False})
+            status = entry["error"]
+        ok = ok and entry["within_budget"]
+        results.append(entry)
+        print(f"import_time {module}: {status}", file=sys.stderr)
+    return ok
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> bool:
+    """
+    Print p50 ratios against a baseline run; return False if any benchmark
+    slowed down by more than max_regression (e.g. 0.2 = 20%).
+    """
+    def key(entry):
+        return (entry["benchmark"], json.dumps(entry["params"], sort_keys=True))
+
+    baseline_by_key = {key(e): e for e in baseline.get("results", []) if "p50_ms" in e}
+    ok = True
+    print(f"Comparing against {baseline.get('meta', {}).get('commit', 'unknown')}:")
+    for entry in current["results"]:
+        old = baseline_by_key.get(key(entry))
+        if not old or "p50_ms" not in entry:
+            continue
+        ratio = entry["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"  {entry['benchmark']} {entry['params']}: p50 {old['p50_ms']:.3f} -> {entry['p50_ms']:.3f} ms (x{ratio:.2f}){flag}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark agents and the end-to-end pipeline")
+    parser.add_argument("--output", "-o", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p50 slowdown vs baseline before failing")
+    parser.add_argument("--seed", type=int, default=1234, help="Corpus random seed")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[50, 500, 5000], help="Transcript lengths in words")
+    parser.add_argument("--pii-densities", type=float, nargs="+", default=[0.0, 0.01, 0.05], help="Fraction of words that are PII")
+    parser.add_argument("--samples", type=int, default=20, help="Transcripts per corpus bucket")
+    parser.add_argument("--repeats", type=int, default=5, help="Passes over each corpus bucket")
+    parser.add_argument("--pipeline-repeats", type=int, default=3, help="End-to-end pipeline runs per mode")
+    parser.add_argument("--skip-pipeline", action="store_true", help="Only benchmark the text agents")
+    parser.add_argument("--import-repeats", type=int, default=5, help="Fresh interpreters per agent for the import-time check")
+    parser.add_argument("--skip-import-budget", action="store_true", help="Do not measure or enforce agent import-time budgets")
+    args = parser.parse_args()
+
+    # Agents and models are resolved relative to the backend directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.environ["CLINICAMIND_SPEECH_BACKEND"] = "fake"
+
+    results = []
+    imports_ok = args.skip_import_budget or bench_import_times(results, args.import_repeats)
+    corpus = build_corpus(args.seed, args.lengths, args.pii_densities, args.samples)
+    bench_text_agents(results, corpus, args.repeats)
+    bench_micro_batching(results, args.repeats)
+    if not args.skip_pipeline:
+        bench_pipeline(results, args.seed, args.lengths[0], args.pipeline_repeats)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "samples": args.samples,
+            "repeats": args.repeats
+        },
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    ok = imports_ok
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        ok = compare(report, baseline, args.max_regression) and ok
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
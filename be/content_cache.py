@@ -0,0 +1,66 @@
+"""
+Content-addressed on-disk cache shared by the orchestrator and agents.
+
+Entries live under CLINICAMIND_CACHE_DIR (default ".clinicamind_cache"),
+one directory per namespace. Writes go through a temp file and os.replace,
+so concurrent processes never observe a partial entry. A cache created
+with cache_dir=False is disabled: every get misses and puts are dropped.
+"""
+import os
+import json
+import hashlib
+import tempfile
+from typing import Any, Optional, Union
+
+def cache_root(cache_dir: Optional[str] = None) -> str:
+    return cache_dir or os.getenv("CLINICAMIND_CACHE_DIR", ".clinicamind_cache")
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_key(*parts: Any) -> str:
+    return hashlib.sha256(":".join(str(p) for p in parts).encode()).hexdigest()
+
+class ContentCache:
+    def __init__(self, namespace: str, cache_dir: Union[str, bool, None] = None):
+        self.enabled = cache_dir is not False
+        self.directory = os.path.join(cache_root(cache_dir or None), namespace)
+
+    def path(self, key: str, suffix: str = ".json") -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def get_bytes(self, key: str, suffix: str = ".bin") -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path(key, suffix), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put_bytes(self, key: str, data: bytes, suffix: str = ".bin") -> Optional[str]:
+        if not self.enabled:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        final_path = self.path(key, suffix)
+        os.replace(tmp_path, final_path)
+        return final_path
+
+    def get_json(self, key: str) -> Optional[Any]:
+        data = self.get_bytes(key, ".json")
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def put_json(self, key: str, value: Any) -> Optional[str]:
+        return self.put_bytes(key, json.dumps(value).encode(), ".json")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Local fake of the OpenAI speech endpoints for exercising the resilience layer.
+
+    python fake_speech_server.py --port 8765 --fail-rate 0.3 --hang-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python asr_agent.py --audio "first visit.m4a"
+
+Failures are injected per request: --fail-rate answers with --fail-status
+(default 503), --rate-limit-rate answers 429, and --hang-rate sleeps for
+--hang-seconds before answering, to trigger client timeouts.
+"""
+import io
+import json
+import wave
+import time
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from speech_fakes import FAKE_TRANSCRIPT
+
+def _silent_wav(seconds: float = 1.0, sample_rate: int = 24000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\x00\x00" * int(sample_rate * seconds))
+    return buffer.getvalue()
+
+class FakeSpeechHandler(BaseHTTPRequestHandler):
+    config = None
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send(status, json.dumps({"error": {"message": message, "type": "fake_error"}}).encode())
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        config = self.config
+
+        if config.latency_ms:
+            time.sleep(config.latency_ms / 1000.0)
+        roll = random.random()
+        if roll < config.hang_rate:
+            time.sleep(config.hang_seconds)
+        elif roll < config.hang_rate + config.fail_rate:
+            return self._send_error(config.fail_status, "Injected failure")
+        elif roll < config.hang_rate + config.fail_rate + config.rate_limit_rate:
+            return self._send_error(429, "Injected rate limit")
+
+        if self.path.endswith("/audio/transcriptions"):
+            return self._send(200, json.dumps({"text": config.transcript}).encode())
+        if self.path.endswith("/audio/speech"):
+            return self._send(200, _silent_wav(), "audio/wav")
+        return self._send_error(404, f"Unknown endpoint {self.path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI speech API server with failure injection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed latency added to every request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with --fail-status")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--hang-seconds", type=float, default=300.0)
+    parser.add_argument("--transcript", default=FAKE_TRANSCRIPT, help="Transcript returned for every upload")
+    parser.add_argument("--seed", type=int, help="Random seed for failure injection")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    FakeSpeechHandler.config = args
+    server = ThreadingHTTPServer((args.host, args.port), FakeSpeechHandler)
+    print(f"Fake speech API listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
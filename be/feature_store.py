@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Columnar, memory-mapped store of transcript features.
+
+Pain scoring reads a handful of features from each transcript (see
+pain_assessment_agent.extract_features). Batch scoring and model refreshes
+read them from here instead of re-parsing text: features are extracted
+once per distinct transcript and kept in uncompressed .npz segments under
+
+    <CLINICAMIND_CACHE_DIR>/features/<schema>/seg-<pid>-<id>.npz
+
+Each segment holds one column per feature, row-aligned:
+
+    key               S64      sha256 of the transcript
+    length            int64
+    pain_count        int64
+    numeric_scale     float64  NaN when the transcript states no 0-10 score
+    severity_hits     bool     (rows, len(lexicon.severity_phrases))
+    intensifier_hits  bool     (rows, len(lexicon.intensifier_phrases))
+
+Segments are mapped read-only (model_export.map_npz), so readers share
+pages and never copy the columns. Writers only ever add whole segments
+(temp file + os.replace), so concurrent processes can share a store;
+compact() folds the segments into one. <schema> fingerprints the extractor
+and its lexicon pack, so changing either starts a fresh store rather than
+mixing incompatible rows.
+
+    python feature_store.py extract --transcripts transcripts.jsonl
+    python feature_store.py score --transcripts transcripts.jsonl
+    python feature_store.py export -o features.npz
+"""
+import os
+import json
+import uuid
+import hashlib
+import argparse
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from content_cache import cache_root, make_key
+from model_export import map_npz
+from rule_packs import PainLexicon
+from pain_assessment_agent import PainAssessmentAgent, TranscriptFeatures, estimate_pain, extract_features, pain_lexicon
+
+FEATURE_VERSION = "1"
+COLUMNS = ("key", "length", "pain_count", "numeric_scale", "severity_hits", "intensifier_hits")
+
+def feature_schema(lexicon: PainLexicon) -> str:
+    return make_key("features", FEATURE_VERSION, lexicon.fingerprint)
+
+def transcript_key(transcript: str) -> bytes:
+    return hashlib.sha256(transcript.encode()).hexdigest().encode()
+
+def to_columns(keys: List[bytes], features: List[TranscriptFeatures], lexicon: PainLexicon) -> Dict[str, np.ndarray]:
+    return {
+        "key": np.array(keys, dtype="S64"),
+        "length": np.array([f.length for f in features], dtype=np.int64),
+        "pain_count": np.array([f.pain_count for f in features], dtype=np.int64),
+        "numeric_scale": np.array([np.nan if f.numeric_scale is None else f.numeric_scale for f in features], dtype=np.float64),
+        "severity_hits": np.array([f.severity_hits for f in features], dtype=bool).reshape(len(features), len(lexicon.severity_phrases)),
+        "intensifier_hits": np.array([f.intensifier_hits for f in features], dtype=bool).reshape(len(features), len(lexicon.intensifier_phrases))
+    }
+
+def features_at(columns: Dict[str, np.ndarray], row: int) -> TranscriptFeatures:
+    numeric_scale = float(columns["numeric_scale"][row])
+    return TranscriptFeatures(
+        length=int(columns["length"][row]),
+        pain_count=int(columns["pain_count"][row]),
+        numeric_scale=None if np.isnan(numeric_scale) else numeric_scale,
+        severity_hits=tuple(bool(hit) for hit in columns["severity_hits"][row]),
+        intensifier_hits=tuple(bool(hit) for hit in columns["intensifier_hits"][row])
+    )
+
+def model_matrix(columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Model input rows (TranscriptFeatures.model_row) for a whole column set.
+    """
+    return np.column_stack([columns["length"], columns["pain_count"]])
+
+class FeatureStore:
+    """
+    Features under one lexicon pack: the current one unless given. A store
+    keeps its pack, so a hot-swapped lexicon needs a new store.
+    """
+    def __init__(self, cache_dir: Optional[str] = None, lexicon: Optional[PainLexicon] = None):
+        self.lexicon = lexicon or pain_lexicon()
+        self.directory = os.path.join(cache_root(cache_dir), "features", feature_schema(self.lexicon))
+        self._segments = {}
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def _segment_names(self) -> List[str]:
+        try:
+            return sorted(name for name in os.listdir(self.directory) if name.startswith("seg-") and name.endswith(".npz"))
+        except FileNotFoundError:
+            return []
+
+    def refresh(self):
+        """
+        Map segments written since the last refresh, by any process.
+        """
+        with self._lock:
+            for name in self._segment_names():
+                if name in self._segments:
+                    continue
+                try:
+                    columns = map_npz(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    # Compacted away by another process; its rows live on in the new segment
+                    continue
+                self._segments[name] = columns
+                for row, key in enumerate(columns["key"]):
+                    self._index.setdefault(bytes(key), (name, row))
+
+    def _write_segment(self, columns: Dict[str, np.ndarray]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"seg-{os.getpid()}-{uuid.uuid4().hex}.npz"
+        tmp_path = os.path.join(self.directory, f".{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+        return name
+
+    def features(self, transcripts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Feature columns for `transcripts`, in order. Transcripts not in the
+        store yet are extracted once and appended as a new segment.
+        """
+        keys = [transcript_key(t) for t in transcripts]
+        self.refresh()
+        missing = {}
+        for key, transcript in zip(keys, transcripts):
+            if key not in self._index and key not in missing:
+                missing[key] = transcript
+        if missing:
+            features = [extract_features(t, self.lexicon) for t in missing.values()]
+            self._write_segment(to_columns(list(missing), features, self.lexicon))
+            self.refresh()
+        return self._gather(keys)
+
+    def _gather(self, keys: List[bytes]) -> Dict[str, np.ndarray]:
+        if not keys:
+            return to_columns([], [], self.lexicon)
+        locations = [self._index[key] for key in keys]
+        by_segment = {}
+        for position, (name, row) in enumerate(locations):
+            by_segment.setdefault(name, ([], []))
+            by_segment[name][0].append(position)
+            by_segment[name][1].append(row)
+        columns = {}
+        for column in COLUMNS:
+            template = self._segments[locations[0][0]][column]
+            out = np.empty((len(keys),) + template.shape[1:], dtype=template.dtype)
+            for name, (positions, rows) in by_segment.items():
+                out[positions] = self._segments[name][column][rows]
+            columns[column] = out
+        return columns
+
+    def table(self) -> Dict[str, np.ndarray]:
+        """
+        Every stored row once, for retraining and exports.
+        """
+        self.refresh()
+        return self._gather(sorted(self._index))
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Fold all current segments into one. Readers that still map an old
+        segment keep working; unlinking does not invalidate a mapping.
+        """
+        table = self.table()
+        old = list(self._segments)
+        if len(old) <= 1:
+            return {"segments": len(old), "rows": len(table["key"])}
+        name = self._write_segment(table)
+        for stale in old:
+            try:
+                os.unlink(os.path.join(self.directory, stale))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._segments = {}
+            self._index = {}
+        self.refresh()
+        return {"segments": 1, "rows": len(table["key"]), "segment": name}
+
+def score(columns: Dict[str, np.ndarray], agent: PainAssessmentAgent, lexicon: PainLexicon) -> List[Dict[str, Any]]:
+    """
+    Pain assessment of stored features: the lexicon estimate per row and
+    one vectorized predict() per model over all rows.
+    """
+    rows = len(columns["key"])
+    results = []
+    for row in range(rows):
+        pain_nrs, severity = estimate_pain(features_at(columns, row), lexicon)
+        results.append({"key": columns["key"][row].decode(), "pain_nrs": pain_nrs, "severity": severity})
+    matrix = model_matrix(columns)
+    for field_name, model in (("classification", agent.classification_model), ("regression_prediction", agent.regression_model)):
+        if model is None or not rows:
+            continue
+        try:
+            predictions = np.asarray(model.predict(matrix))
+        except Exception as e:
+            for result in results:
+                result[f"{field_name.split('_')[0]}_error"] = str(e)
+            continue
+        for result, prediction in zip(results, predictions.tolist()):
+            result[field_name] = prediction
+    return results
+
+def load_transcripts(path: str) -> List[str]:
+    """
+    A JSON list, or JSON lines, of transcripts or of objects with a
+    "transcript" field (agent requests and ASR results both qualify).
+    """
+    with open(path) as f:
+        text = f.read()
+    entries = json.loads(text) if text.lstrip().startswith("[") else [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [entry if isinstance(entry, str) else entry["transcript"] for entry in entries]
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar transcript feature store for batch scoring and retraining")
+    parser.add_argument("command", choices=("extract", "score", "export", "compact"))
+    parser.add_argument("--transcripts", help="JSON list or JSON lines of transcripts (extract, score)")
+    parser.add_argument("-o", "--output", help="Output .npz (export)")
+    parser.add_argument("--cache-dir", help="Cache root (default: CLINICAMIND_CACHE_DIR)")
+    parser.add_argument("--language", help="Language code of the transcripts; selects the lexicon pack")
+    args = parser.parse_args()
+
+    store = FeatureStore(args.cache_dir, pain_lexicon(args.language))
+    if args.command in ("extract", "score"):
+        if not args.transcripts:
+            parser.error(f"{args.command} needs --transcripts")
+        columns = store.features(load_transcripts(args.transcripts))
+        if args.command == "extract":
+            print(json.dumps({"rows": len(columns["key"]), "store": store.directory}, indent=2))
+        else:
+            for result in score(columns, PainAssessmentAgent(), store.lexicon):
+                print(json.dumps(result))
+    elif args.command == "export":
+        if not args.output:
+            parser.error("export needs --output")
+        table = store.table()
+        with open(args.output, "wb") as f:
+            np.savez(f, severity_phrases=np.array(store.lexicon.severity_phrases), intensifier_phrases=np.array(store.lexicon.intensifier_phrases), **table)
+        print(json.dumps({"rows": len(table["key"]), "output": args.output}, indent=2))
+    else:
+        print(json.dumps(store.compact(), indent=2))
+
+if __name__ == "__main__":
+    main()
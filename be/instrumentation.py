@@ -0,0 +1,221 @@
+"""
+Lightweight instrumentation shared by the orchestrator and agents.
+
+Spans time a named block of work, counters accumulate sizes and event counts.
+Agents return their records inside the response when the request carries
+"collect_metrics": true, and the orchestrator merges them with an agent label.
+"""
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Held by the one profiling() block that owns the process-wide profilers
+_PROFILE_OWNER = threading.Lock()
+
+def _label_key(labels: Dict[str, Any]) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    # Nearest-rank quantile, good enough for per-run summaries
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+def escape_label_value(value: Any) -> str:
+    """
+    A label value as the Prometheus text format requires: backslash, double
+    quote and line feed escaped.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """
+        Time the enclosed block and record it as a span.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, time.perf_counter() - start, **labels)
+
+    def record_span(self, name: str, seconds: float, **labels):
+        with self._lock:
+            self.spans.append({"name": name, "labels": labels, "duration_ms": seconds * 1000.0})
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            entry = self.counters.setdefault(key, {"name": name, "labels": labels, "value": 0})
+            entry["value"] += value
+
+    def merge(self, data: Optional[Dict[str, Any]], **labels):
+        """
+        Merge records exported by another Metrics instance (e.g. an agent response).
+        """
+        if not data:
+            return
+        for span in data.get("spans", []):
+            self.record_span(span["name"], span["duration_ms"] / 1000.0, **dict(span.get("labels", {}), **labels))
+        for counter in data.get("counters", []):
+            self.incr(counter["name"], counter["value"], **dict(counter.get("labels", {}), **labels))
+
+    def drain(self) -> Dict[str, Any]:
+        """
+        Export raw records and reset, so a long-lived agent reports each request once.
+        """
+        with self._lock:
+            data = {"spans": self.spans, "counters": list(self.counters.values())}
+            self.spans = []
+            self.counters = {}
+        return data
+
+    def summary(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            groups = {}
+            for span in self.spans:
+                key = (span["name"], _label_key(span["labels"]))
+                groups.setdefault(key, {"name": span["name"], "labels": span["labels"], "values": []})["values"].append(span["duration_ms"])
+
+        summary = []
+        for group in groups.values():
+            values = sorted(group["values"])
+            entry = {
+                "name": group["name"],
+                "labels": group["labels"],
+                "count": len(values),
+                "total_ms": sum(values),
+                "max_ms": values[-1]
+            }
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}_ms"] = _quantile(values, q)
+            summary.append(entry)
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+            counters = [dict(c) for c in self.counters.values()]
+        return {"spans": spans, "counters": counters, "summary": self.summary()}
+
+    def to_prometheus(self, prefix: str = "clinicamind") -> str:
+        """
+        Render span summaries and counters in the Prometheus text exposition format.
+        """
+        def fmt_labels(labels: Dict[str, Any]) -> str:
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{escape_label_value(v)}"' for k, v in sorted(labels.items())) + "}"
+
+        lines = [f"# TYPE {prefix}_span_seconds summary"]
+        for entry in self.summary():
+            labels = dict(entry["labels"], span=entry["name"])
+            for q in QUANTILES:
+                lines.append(f"{prefix}_span_seconds{fmt_labels(dict(labels, quantile=q))} {entry[f'p{int(q * 100)}_ms'] / 1000.0}")
+            lines.append(f"{prefix}_span_seconds_sum{fmt_labels(labels)} {entry['total_ms'] / 1000.0}")
+            lines.append(f"{prefix}_span_seconds_count{fmt_labels(labels)} {entry['count']}")
+
+        with self._lock:
+            counters = [dict(c) for c in self.counters.values()]
+        for name in sorted({c["name"] for c in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for counter in counters:
+                if counter["name"] == name:
+                    lines.append(f"{prefix}_{name}_total{fmt_labels(counter['labels'])} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, fmt: str = "json"):
+        with open(path, "w") as f:
+            if fmt == "prometheus":
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+
+@contextmanager
+def profiling(run_name: str):
+    """
+    Opt-in profiling hook. CLINICAMIND_PROFILE is a comma-separated list of
+    "cprofile" and/or "tracemalloc"; dumps go to CLINICAMIND_PROFILE_DIR.
+    cProfile covers threads started inside the block (e.g. the visit
+    executors) as well: before Python 3.12 a profiler only sees its own
+    thread, so each new thread gets one via threading.setprofile and their
+    stats are merged into the dump. Threads that were already running when
+    the block started are not profiled.
+
+    cProfile, tracemalloc and the thread hook are process-wide, so only the
+    outermost active block profiles; blocks nested in it or overlapping it
+    from other threads (concurrent batch runs) run unprofiled, and their
+    work shows up in the owner's dump.
+    """
+    modes = {m.strip() for m in os.getenv("CLINICAMIND_PROFILE", "").split(",") if m.strip()}
+    if not modes or not _PROFILE_OWNER.acquire(blocking=False):
+        yield
+        return
+    try:
+        yield from _profile(run_name, modes)
+    finally:
+        _PROFILE_OWNER.release()
+
+def _profile(run_name: str, modes: set):
+    profile_dir = os.getenv("CLINICAMIND_PROFILE_DIR", "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    stem = os.path.join(profile_dir, f"{run_name}-{os.getpid()}-{int(time.time() * 1000)}")
+
+    profiler = None
+    thread_profilers = []
+    # From 3.12 cProfile hooks sys.monitoring, which already spans all threads
+    per_thread = sys.version_info < (3, 12)
+    if "cprofile" in modes:
+        import cProfile
+        profiler = cProfile.Profile()
+
+        def profile_thread(frame, event, arg):
+            # First event in a new thread: replace this hook with a profiler of its own
+            thread_profiler = cProfile.Profile()
+            thread_profilers.append(thread_profiler)
+            thread_profiler.enable()
+
+        if per_thread:
+            threading.setprofile(profile_thread)
+    # Leave tracing started elsewhere (e.g. python -X tracemalloc) running
+    own_tracemalloc = False
+    if "tracemalloc" in modes:
+        import tracemalloc
+        own_tracemalloc = not tracemalloc.is_tracing()
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            if per_thread:
+                threading.setprofile(None)
+            import pstats
+            stats = pstats.Stats(profiler)
+            for thread_profiler in list(thread_profilers):
+                stats.add(thread_profiler)
+            stats.dump_stats(f"{stem}.prof")
+        if "tracemalloc" in modes:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if own_tracemalloc:
+                tracemalloc.stop()
+            with open(f"{stem}.tracemalloc.txt", "w") as f:
+                f.write(f"current_bytes {current}\npeak_bytes {peak}\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
+        print(f"Profile written to {stem}.*", file=sys.stderr)
@@ -0,0 +1,103 @@
+"""
+Micro-batching for single-row model predictions.
+
+Concurrent callers each submit one feature row; the batcher coalesces them
+into one vectorized predict() call and hands every caller its own output.
+A batch is dispatched when it reaches `max_batch_size` rows or when its
+oldest row has waited for the batching window; while a batch is running,
+new rows queue up for the next one. The window adapts: it is halved
+(down to zero) every time waiting gathered no other row, and reset to
+`max_wait_ms` as soon as a batch holds more than one, so an uncontended
+caller stops paying for the wait. There is no background thread: the oldest
+waiting caller runs the batch, so the batcher survives fork() and costs
+nothing when idle.
+"""
+import time
+import threading
+from typing import Any, Callable, List, Optional, Sequence
+
+from instrumentation import Metrics
+
+class _Slot:
+    __slots__ = ("row", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, row: Sequence[Any]):
+        self.row = row
+        self.enqueued_at = time.perf_counter()
+        self.done = False
+        self.result = None
+        self.error = None
+
+class MicroBatcher:
+    def __init__(self, predict: Callable[[List[Sequence[Any]]], Sequence[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, metrics: Optional[Metrics] = None, **labels):
+        self._predict = predict
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.metrics = metrics
+        self.labels = labels
+        self._cond = threading.Condition()
+        self._queue = []
+        self._busy = False
+        self._window = self.max_wait
+
+    def predict(self, row: Sequence[Any]) -> Any:
+        """
+        Predict one row; blocks until the batch containing it has run.
+        """
+        slot = _Slot(row)
+        with self._cond:
+            self._queue.append(slot)
+            if len(self._queue) >= self.max_batch_size:
+                self._cond.notify_all()
+            while True:
+                if slot.done:
+                    if slot.error is not None:
+                        raise slot.error
+                    return slot.result
+                if not self._busy and self._queue and self._queue[0] is slot:
+                    remaining = slot.enqueued_at + self._window - time.perf_counter()
+                    if len(self._queue) >= self.max_batch_size or remaining <= 0:
+                        batch = self._queue[:self.max_batch_size]
+                        del self._queue[:self.max_batch_size]
+                        self._busy = True
+                        if len(batch) > 1:
+                            self._window = self.max_wait
+                        elif self._window > self.max_wait / 16:
+                            self._window /= 2
+                        else:
+                            self._window = 0.0
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+
+        # This caller leads the batch
+        self._run(batch)
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _run(self, batch: List[_Slot]):
+        dispatched_at = time.perf_counter()
+        try:
+            outputs = self._predict([slot.row for slot in batch])
+            if len(outputs) != len(batch):
+                raise ValueError(f"predict returned {len(outputs)} outputs for {len(batch)} rows")
+            for slot, output in zip(batch, outputs):
+                slot.result = output
+        except Exception as e:
+            for slot in batch:
+                slot.error = e
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_span("batch_predict", time.perf_counter() - dispatched_at, **self.labels)
+                for slot in batch:
+                    self.metrics.record_span("batch_queue_wait", dispatched_at - slot.enqueued_at, **self.labels)
+                self.metrics.incr("batches", **self.labels)
+                self.metrics.incr("batched_rows", len(batch), **self.labels)
+            with self._cond:
+                for slot in batch:
+                    slot.done = True
+                self._busy = False
+                self._cond.notify_all()
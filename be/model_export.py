@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Export scikit-learn pain models to a dependency-light NumPy format.
+
+export_model() converts a supported estimator into a flat, uncompressed
+`.npz`: every parameter is a plain array, and the pipeline structure is a
+JSON spec stored next to them. load_exported() maps the file read-only and
+builds every array straight on top of the mapping (np.load cannot mmap
+members of an .npz), so loading costs no parsing or copying, pages are
+shared between processes, and inference needs only NumPy - no sklearn,
+no joblib, no pickle.
+
+Supported:
+    preprocessing  Pipeline steps of StandardScaler, and ColumnTransformer
+                   blocks of StandardScaler / OneHotEncoder (numeric
+                   categories) / "passthrough" / "drop"
+    estimators     linear models (coef_/intercept_), DecisionTree,
+                   RandomForest / ExtraTrees, GradientBoosting with a
+                   constant (dummy or zero) init
+
+Anything else is refused with ValueError rather than exported wrongly.
+Rows are positional: ColumnTransformer columns given by name are resolved
+through the fitted `feature_names_in_`.
+
+    python model_export.py arm_pain_classification_model.joblib --check
+"""
+import os
+import sys
+import json
+import mmap
+import zipfile
+import argparse
+import warnings
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+FORMAT_VERSION = 1
+_SPEC_KEY = "__spec__"
+
+def exported_path(model_path: str) -> str:
+    """
+    Where the exported form of a joblib model lives: same name, `.npz`.
+    """
+    return os.path.splitext(model_path)[0] + ".npz"
+
+class _Writer:
+    def __init__(self):
+        self.arrays = {}
+
+    def add(self, name: str, value: Any, dtype=None) -> str:
+        key = f"a{len(self.arrays)}_{name}"
+        array = np.asarray(value, dtype=dtype)
+        if array.dtype == object:
+            raise ValueError(f"Cannot export object array {name}")
+        self.arrays[key] = np.ascontiguousarray(array)
+        return key
+
+def _class_name(obj: Any) -> str:
+    return type(obj).__name__
+
+def _export_scaler(scaler: Any, writer: _Writer) -> Dict[str, Any]:
+    n = scaler.n_features_in_
+    mean = scaler.mean_ if getattr(scaler, "mean_", None) is not None else np.zeros(n)
+    scale = scaler.scale_ if getattr(scaler, "scale_", None) is not None else np.ones(n)
+    return {"mean": writer.add("mean", mean, np.float64), "scale": writer.add("scale", scale, np.float64)}
+
+def _resolve_columns(columns: Any, transformer: Any) -> List[int]:
+    names = getattr(transformer, "feature_names_in_", None)
+    if isinstance(columns, slice):
+        return list(range(transformer.n_features_in_))[columns]
+    columns = list(np.atleast_1d(columns))
+    if columns and isinstance(columns[0], (bool, np.bool_)):
+        return [i for i, keep in enumerate(columns) if keep]
+    if columns and isinstance(columns[0], str):
+        if names is None:
+            raise ValueError("ColumnTransformer selects columns by name but has no feature_names_in_")
+        positions = {name: i for i, name in enumerate(names)}
+        return [positions[c] for c in columns]
+    return [int(c) for c in columns]
+
+def _export_column_transformer(ct: Any, writer: _Writer) -> Dict[str, Any]:
+    # Sparse and dense outputs hold the same values; rows here are always dense
+    blocks = []
+    for name, transformer, columns in ct.transformers_:
+        cols = _resolve_columns(columns, ct)
+        if transformer == "drop" or not cols:
+            continue
+        # Newer sklearn fits "passthrough" into an identity FunctionTransformer
+        if transformer == "passthrough" or (_class_name(transformer) == "FunctionTransformer" and transformer.func is None):
+            blocks.append({"kind": "passthrough", "columns": cols})
+        elif _class_name(transformer) == "StandardScaler":
+            blocks.append({"kind": "scale", "columns": cols, **_export_scaler(transformer, writer)})
+        elif _class_name(transformer) == "OneHotEncoder":
+            if getattr(transformer, "drop_idx_", None) is not None:
+                raise ValueError(f"OneHotEncoder '{name}' with drop= is not supported")
+            if transformer.handle_unknown not in ("error", "ignore"):
+                raise ValueError(f"OneHotEncoder '{name}' handle_unknown={transformer.handle_unknown!r} is not supported")
+            # min_frequency / max_categories fold rare categories into one shared column
+            if any(infrequent is not None for infrequent in getattr(transformer, "infrequent_categories_", None) or ()):
+                raise ValueError(f"OneHotEncoder '{name}' with infrequent categories is not supported")
+            categories = []
+            for values in transformer.categories_:
+                if values.dtype == object or values.dtype.kind not in "biuf":
+                    raise ValueError(f"OneHotEncoder '{name}' has non-numeric categories")
+                categories.append(writer.add("categories", values, np.float64))
+            blocks.append({"kind": "onehot", "columns": cols, "categories": categories, "handle_unknown": transformer.handle_unknown})
+        else:
+            raise ValueError(f"Unsupported ColumnTransformer block '{name}': {_class_name(transformer)}")
+    return {"op": "columns", "blocks": blocks}
+
+def _flatten_trees(trees: Sequence[Any], writer: _Writer, proba: bool) -> Dict[str, Any]:
+    """
+    Concatenate tree node arrays with global node ids. Leaves point to
+    themselves, so a fixed number of vectorized steps reaches every leaf.
+    """
+    left, right, feature, threshold, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for tree in trees:
+        t = tree.tree_
+        ids = np.arange(t.node_count)
+        leaf = t.children_left == -1
+        left.append(np.where(leaf, ids, t.children_left) + offset)
+        right.append(np.where(leaf, ids, t.children_right) + offset)
+        feature.append(np.where(leaf, 0, t.feature))
+        threshold.append(t.threshold)
+        value = t.value[:, 0, :]
+        if proba:
+            totals = value.sum(axis=1, keepdims=True)
+            value = value / np.where(totals == 0, 1, totals)
+        values.append(value)
+        roots.append(offset)
+        offset += t.node_count
+        max_depth = max(max_depth, int(t.max_depth))
+    return {
+        "left": writer.add("left", np.concatenate(left), np.int64),
+        "right": writer.add("right", np.concatenate(right), np.int64),
+        "feature": writer.add("feature", np.concatenate(feature), np.int64),
+        "threshold": writer.add("threshold", np.concatenate(threshold), np.float64),
+        "value": writer.add("value", np.concatenate(values), np.float64),
+        "roots": writer.add("roots", roots, np.int64),
+        "max_depth": max_depth
+    }
+
+def _export_estimator(est: Any, writer: _Writer) -> Dict[str, Any]:
+    name = _class_name(est)
+    classes = getattr(est, "classes_", None)
+    spec = {"classes": writer.add("classes", classes) if classes is not None else None}
+
+    if name in ("DecisionTreeClassifier", "DecisionTreeRegressor", "RandomForestClassifier", "RandomForestRegressor",
+                "ExtraTreesClassifier", "ExtraTreesRegressor", "ExtraTreeClassifier", "ExtraTreeRegressor"):
+        if getattr(est, "n_outputs_", 1) != 1:
+            raise ValueError(f"Multi-output {name} is not supported")
+        trees = getattr(est, "estimators_", None) or [est]
+        spec.update(kind="forest", **_flatten_trees(trees, writer, proba=classes is not None))
+        return spec
+
+    if name in ("GradientBoostingClassifier", "GradientBoostingRegressor"):
+        init = est.init_
+        if not (init == "zero" or _class_name(init) in ("DummyClassifier", "DummyRegressor")):
+            raise ValueError(f"{name} with a {_class_name(init)} init estimator is not supported")
+        loss = getattr(est, "loss", None)
+        if classes is None and loss not in ("squared_error", "ls", "absolute_error", "lad", "huber", "quantile"):
+            raise ValueError(f"{name} loss {loss!r} is not supported")
+        if classes is not None and loss not in ("log_loss", "deviance"):
+            raise ValueError(f"{name} loss {loss!r} is not supported")
+        # Dummy and zero inits predict a constant raw score
+        raw_init = est._raw_predict_init(np.zeros((1, est.n_features_in_)))[0]
+        stages, outputs = est.estimators_.shape
+        trees = [est.estimators_[stage, k] for stage in range(stages) for k in range(outputs)]
+        spec.update(
+            kind="boosting",
+            init=writer.add("init", raw_init, np.float64),
+            learning_rate=float(est.learning_rate),
+            outputs=int(outputs),
+            **_flatten_trees(trees, writer, proba=False)
+        )
+        return spec
+
+    coef = getattr(est, "coef_", None)
+    if coef is not None and not hasattr(coef, "toarray"):
+        intercept = np.broadcast_to(np.asarray(getattr(est, "intercept_", 0.0), dtype=np.float64), np.atleast_2d(coef).shape[:1])
+        spec.update(kind="linear", coef=writer.add("coef", np.atleast_2d(coef), np.float64),
+                    intercept=writer.add("intercept", intercept, np.float64), vector=np.ndim(coef) == 1,
+                    ovr=getattr(est, "multi_class", "auto") == "ovr")
+        return spec
+
+    raise ValueError(f"Unsupported estimator: {name}")
+
+def export_model(model: Any, path: str) -> Dict[str, Any]:
+    """
+    Write `model` (an estimator or a Pipeline ending in one) to `path` as
+    an uncompressed .npz. Returns the spec.
+    """
+    writer = _Writer()
+    steps = [step for _, step in model.steps] if _class_name(model) == "Pipeline" else [model]
+    ops = []
+    for step in steps[:-1]:
+        if step is None or step == "passthrough":
+            continue
+        if _class_name(step) == "StandardScaler":
+            ops.append({"op": "scale", **_export_scaler(step, writer)})
+        elif _class_name(step) == "ColumnTransformer":
+            ops.append(_export_column_transformer(step, writer))
+        else:
+            raise ValueError(f"Unsupported pipeline step: {_class_name(step)}")
+    spec = {
+        "format": FORMAT_VERSION,
+        "n_features": int(getattr(steps[0], "n_features_in_", 0)),
+        "preprocess": ops,
+        "estimator": _export_estimator(steps[-1], writer)
+    }
+    arrays = dict(writer.arrays)
+    arrays[_SPEC_KEY] = np.frombuffer(json.dumps(spec).encode(), dtype=np.uint8)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return spec
+
+def map_npz(path: str) -> Dict[str, np.ndarray]:
+    """
+    Read-only arrays backed by a mapping of an uncompressed .npz.
+    """
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    arrays = {}
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: member {info.filename} is compressed; re-export with export_model()")
+            # Local file header: fixed 30 bytes, then name and extra field
+            header = mapping[info.header_offset:info.header_offset + 30]
+            name_len = int.from_bytes(header[26:28], "little")
+            extra_len = int.from_bytes(header[28:30], "little")
+            start = info.header_offset + 30 + name_len + extra_len
+            member = _MappedFile(mapping, start)
+            version = np.lib.format.read_magic(member)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(member)
+            elif version == (2, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(member)
+            else:
+                raise ValueError(f"{path}: unsupported .npy version {version} for {info.filename}")
+            if dtype.hasobject:
+                raise ValueError(f"{path}: member {info.filename} holds objects")
+            count = int(np.prod(shape))
+            array = np.frombuffer(mapping, dtype=dtype, count=count, offset=member.position)
+            arrays[info.filename[:-4]] = array.reshape(shape, order="F" if fortran_order else "C")
+    return arrays
+
+class _MappedFile:
+    """
+    Minimal file-like reader over a mapping, for the .npy header parser.
+    """
+    def __init__(self, mapping: mmap.mmap, position: int):
+        self.mapping = mapping
+        self.position = position
+
+    def read(self, size: int) -> bytes:
+        data = self.mapping[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+class ExportedModel:
+    """
+    Pure-NumPy predictor for a model written by export_model().
+    predict()/predict_proba() take a 2-D batch of rows, like sklearn.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.arrays = map_npz(path)
+        self.spec = json.loads(bytes(self.arrays.pop(_SPEC_KEY)))
+        if self.spec.get("format") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported export format {self.spec.get('format')}")
+        estimator = self.spec["estimator"]
+        self.classes_ = self.arrays[estimator["classes"]] if estimator.get("classes") else None
+        self.n_features_in_ = self.spec["n_features"]
+
+    def _array(self, key: str) -> np.ndarray:
+        return self.arrays[key]
+
+    def _transform(self, X: np.ndarray) -> np.ndarray:
+        for op in self.spec["preprocess"]:
+            if op["op"] == "scale":
+                X = (X - self._array(op["mean"])) / self._array(op["scale"])
+                continue
+            parts = []
+            for block in op["blocks"]:
+                columns = X[:, block["columns"]]
+                if block["kind"] == "passthrough":
+                    parts.append(columns)
+                elif block["kind"] == "scale":
+                    parts.append((columns - self._array(block["mean"])) / self._array(block["scale"]))
+                else:
+                    for i, key in enumerate(block["categories"]):
+                        categories = self._array(key)
+                        onehot = columns[:, i:i + 1] == categories
+                        if block["handle_unknown"] == "error" and not onehot.any(axis=1).all():
+                            raise ValueError("Found unknown categories during transform")
+                        parts.append(onehot.astype(np.float64))
+            X = np.hstack(parts) if parts else np.empty((X.shape[0], 0))
+        return X
+
+    def _leaf_values(self, X: np.ndarray, estimator: Dict[str, Any]) -> np.ndarray:
+        """
+        Leaf values of every tree for every row: (rows, trees, width).
+        """
+        left = self._array(estimator["left"])
+        right = self._array(estimator["right"])
+        feature = self._array(estimator["feature"])
+        threshold = self._array(estimator["threshold"])
+        nodes = np.broadcast_to(self._array(estimator["roots"]), (X.shape[0], len(self._array(estimator["roots"])))).copy()
+        rows = np.arange(X.shape[0])[:, None]
+        # sklearn trees compare float32 inputs against their thresholds
+        X = X.astype(np.float32)
+        for _ in range(estimator["max_depth"]):
+            go_left = X[rows, feature[nodes]] <= threshold[nodes]
+            nodes = np.where(go_left, left[nodes], right[nodes])
+        return self._array(estimator["value"])[nodes]
+
+    def _raw(self, X: Any) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        X = self._transform(X)
+        estimator = self.spec["estimator"]
+        kind = estimator["kind"]
+        if kind == "linear":
+            return X @ self._array(estimator["coef"]).T + self._array(estimator["intercept"])
+        values = self._leaf_values(X, estimator)
+        if kind == "forest":
+            return values.mean(axis=1)
+        # Boosting: trees are stored stage-major, one per output
+        leaves = values[:, :, 0].reshape(X.shape[0], -1, estimator["outputs"])
+        return self._array(estimator["init"]) + estimator["learning_rate"] * leaves.sum(axis=1)
+
+    def predict_proba(self, X: Any) -> np.ndarray:
+        estimator = self.spec["estimator"]
+        if self.classes_ is None:
+            raise AttributeError("predict_proba is only available for classifiers")
+        raw = self._raw(X)
+        if estimator["kind"] == "forest":
+            return raw
+        if raw.shape[1] == 1:
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        if estimator["kind"] == "linear" and estimator["ovr"]:
+            # One-vs-rest logistic, normalized like sklearn's LogisticRegression(ovr)
+            proba = 1.0 / (1.0 + np.exp(-raw))
+            return proba / proba.sum(axis=1, keepdims=True)
+        shifted = np.exp(raw - raw.max(axis=1, keepdims=True))
+        return shifted / shifted.sum(axis=1, keepdims=True)
+
+    def predict(self, X: Any) -> np.ndarray:
+        raw = self._raw(X)
+        estimator = self.spec["estimator"]
+        if self.classes_ is None:
+            return raw[:, 0] if estimator.get("vector", True) and raw.shape[1] == 1 else raw
+        if raw.shape[1] == 1 and estimator["kind"] != "forest":
+            return self.classes_[(raw[:, 0] > 0).astype(np.int64)]
+        return self.classes_[raw.argmax(axis=1)]
+
+def load_exported(path: str) -> ExportedModel:
+    return ExportedModel(path)
+
+def check_export(model: Any, exported: ExportedModel, rows: Any) -> Dict[str, Any]:
+    """
+    Compare sklearn and exported predictions on the same rows.
+    """
+    expected = np.asarray(model.predict(rows))
+    actual = exported.predict(rows)
+    if exported.classes_ is not None:
+        mismatches = int((expected != actual).sum())
+        return {"rows": len(expected), "mismatches": mismatches, "ok": mismatches == 0}
+    max_abs_error = float(np.max(np.abs(expected.astype(np.float64) - actual))) if len(expected) else 0.0
+    return {"rows": len(expected), "max_abs_error": max_abs_error, "ok": max_abs_error <= 1e-9 * max(1.0, float(np.max(np.abs(expected))))}
+
+def _sample_rows(n_features: int) -> np.ndarray:
+    # The pain agent's features: transcript length and "pain" mentions
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, 2000, size=(256, n_features)).astype(np.float64)
+    if n_features > 1:
+        rows[:, 1] = rng.integers(0, 12, size=256)
+    return rows
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Export a joblib pain model to a NumPy .npz for sklearn-free, mmap'd inference")
+    parser.add_argument("model", help="joblib model file")
+    parser.add_argument("-o", "--output", help="Output .npz (default: next to the model)")
+    parser.add_argument("--check", action="store_true", help="Compare predictions against sklearn after exporting")
+    args = parser.parse_args(argv)
+
+    import joblib
+    output = args.output or exported_path(args.model)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            model = joblib.load(args.model)
+        spec = export_model(model, output)
+    except Exception as e:
+        print(f"Cannot export {args.model}: {e}", file=sys.stderr)
+        sys.exit(1)
+    report = {"output": output, "bytes": os.path.getsize(output), "estimator": spec["estimator"]["kind"]}
+    if args.check:
+        report["check"] = check_export(model, load_exported(output), _sample_rows(spec["n_features"]))
+    print(json.dumps(report, indent=2))
+    if args.check and not report["check"]["ok"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
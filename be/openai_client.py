@@ -0,0 +1,56 @@
+"""
+Process-wide OpenAI client shared by the ASR and TTS agents.
+
+One client means one keep-alive HTTP connection pool, so repeated calls
+from the same process (in-process orchestrator mode, long-lived workers)
+reuse open TLS connections instead of handshaking per request. Pool size
+and keep-alive expiry come from CLINICAMIND_OPENAI_POOL_SIZE and
+CLINICAMIND_OPENAI_KEEPALIVE_S. A forked child never reuses its parent's
+sockets: the client is rebuilt on first use after a fork.
+"""
+import os
+import threading
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+def get_openai_client():
+    """
+    Return the shared OpenAI client, creating it on first use in this process.
+    """
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            import httpx
+            from openai import OpenAI, DefaultHttpxClient
+
+            pool_size = int(os.getenv("CLINICAMIND_OPENAI_POOL_SIZE", 10))
+            http_client = DefaultHttpxClient(limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=float(os.getenv("CLINICAMIND_OPENAI_KEEPALIVE_S", 60))
+            ))
+            # Retries are handled by the resilience layer
+            _client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0, http_client=http_client)
+            _client_pid = os.getpid()
+        return _client
+
+def _reinit_lock_in_child():
+    # The lock may have been held by another thread at fork time
+    global _lock
+    _lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_lock_in_child)
+
+def reset_openai_client():
+    """
+    Drop the shared client, e.g. after changing its configuration.
+    """
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
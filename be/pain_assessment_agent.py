@@ -1,148 +1,240 @@
 #!/usr/bin/env python3
 import json
 import sys
-import re
-import numpy as np
-from typing import Dict, Any
-import joblib
+from typing import Dict, Any, List, Optional, Tuple
 import os
 import warnings
+from dataclasses import dataclass
+from instrumentation import Metrics, profiling
+from content_cache import file_sha256, make_key
+from micro_batcher import MicroBatcher
+from rule_packs import PainLexicon, load_rules, pack_fingerprint
+from agent_results import AgentError, PainAssessment
+from shm_transport import decode_message, encode_message
 
-WORD2NUM = {"zero":0,"one":1,"two":2,"three":3,"four":4,"five":5,"six":6,"seven":7,"eight":8,"nine":9,"ten":10}
-SEVERITY_WORDS = {
-    "no pain":0, "mild":2, "slight":2, "tolerable":3, "moderate":5, "bad":6,
-    "severe":8, "very severe":9, "excruciating":9.5, "worst imaginable":10, "worst":10, "agonizing":10
-}
-INTENSIFIERS = {
-    "a little":-0.5, "a bit":-0.5, "some":-0.3, "quite":0.5, "really":0.8, "very":0.8, "extremely":1.0,
-    "wakes me up":1.0, "can't sleep":1.2, "throbbing":0.3, "stabbing":0.7, "burning":0.5, "numb":-0.4
-}
+CLASSIFICATION_MODEL_PATH = "arm_pain_classification_model.joblib"
+REGRESSION_MODEL_PATH = "arm_pain_regression_model.joblib"
+
+def model_file(path: str) -> str:
+    """
+    The file a model is served from: its NumPy export (see model_export.py)
+    when one sits next to the joblib file, else the joblib file itself.
+    """
+    exported = os.path.splitext(path)[0] + ".npz"
+    return exported if os.path.exists(exported) else path
+
+def load_model(path: str):
+    """
+    Load a model; an exported .npz is mmap'd and served by pure NumPy,
+    anything else goes through joblib (and sklearn). Both are only
+    imported when a model file is actually present.
+    """
+    path = model_file(path)
+    if path.endswith(".npz"):
+        from model_export import load_exported
+        return load_exported(path)
+    import joblib
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return joblib.load(path)
+
+def pain_lexicon(language: Optional[str] = None) -> PainLexicon:
+    """
+    Current pain lexicon pack for a language code (rules/pain_lexicon.json,
+    or rules/<lang>/pain_lexicon.json).
+    """
+    return load_rules("pain_lexicon", language)
+
+@dataclass(slots=True)
+class TranscriptFeatures:
+    """
+    Everything pain scoring reads from a transcript, extracted in one pass.
+    Hit vectors are aligned with the lexicon's severity_phrases /
+    intensifier_phrases.
+    """
+    length: int
+    pain_count: int
+    numeric_scale: Optional[float]
+    severity_hits: Tuple[bool, ...]
+    intensifier_hits: Tuple[bool, ...]
+
+    def model_row(self) -> List[int]:
+        # Input row of the classification and regression models
+        return [self.length, self.pain_count]
+
+def extract_features(text: str, lexicon: Optional[PainLexicon] = None) -> TranscriptFeatures:
+    lexicon = lexicon or pain_lexicon()
+    tl = lexicon.normalize(text)
+    m = lexicon.numeric_scale_re.search(tl)
+    if m:
+        numeric_scale = float(min(max(int(m.group(1)), 0), 10))
+    else:
+        m = lexicon.word_scale_re.search(tl)
+        numeric_scale = float(lexicon.word2num[m.group(1)]) if m else None
+    return TranscriptFeatures(
+        length=len(text),
+        pain_count=tl.count(lexicon.pain_term),
+        numeric_scale=numeric_scale,
+        severity_hits=tuple(phrase in tl for phrase in lexicon.severity_phrases),
+        intensifier_hits=tuple(phrase in tl for phrase in lexicon.intensifier_phrases)
+    )
+
+def bucketize(x: float) -> str:
+    if x <= 3: return "mild (0–3)"
+    if x <= 6: return "moderate (4–6)"
+    return "severe (7–10)"
+
+def estimate_pain(features: TranscriptFeatures, lexicon: Optional[PainLexicon] = None):
+    """
+    Lexicon pain estimate (NRS 0-10) and its severity bucket: a stated 0-10
+    score, else the mean of the severity words, else the lexicon default,
+    shifted by the intensifiers.
+    """
+    lexicon = lexicon or pain_lexicon()
+    base = features.numeric_scale
+    if base is None:
+        base = lexicon.severity_score(features.severity_hits)
+    if base is None:
+        base = lexicon.default_score
+    est = float(min(max(base + lexicon.intensifier_shift(features.intensifier_hits), 0), 10))
+    return est, bucketize(est)
+
+def estimate_pain_from_text(text: str, lexicon: Optional[PainLexicon] = None):
+    lexicon = lexicon or pain_lexicon()
+    return estimate_pain(extract_features(text, lexicon), lexicon)
 
 class PainAssessmentAgent:
+    name = "Pain_Assessment_Agent"
+    version = "1.0"
+    
     def __init__(self):
-        self.name = "Pain_Assessment_Agent"
-        self.version = "1.0"
+        self.metrics = Metrics()
         
-        classification_model_path = "arm_pain_classification_model.joblib"
-        regression_model_path = "arm_pain_regression_model.joblib"
+        classification_model_path = CLASSIFICATION_MODEL_PATH
+        regression_model_path = REGRESSION_MODEL_PATH
         
         # Try to load models with error handling for version compatibility
         self.classification_model = None
         self.regression_model = None
         
-        if os.path.exists(classification_model_path):
+        if os.path.exists(model_file(classification_model_path)):
             try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    self.classification_model = joblib.load(classification_model_path)
+                with self.metrics.span("model_load", model="classification"):
+                    self.classification_model = load_model(classification_model_path)
             except Exception as e:
                 print(f"Warning: Could not load classification model: {e}", file=sys.stderr)
                 self.classification_model = None
             
-        if os.path.exists(regression_model_path):
+        if os.path.exists(model_file(regression_model_path)):
             try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    self.regression_model = joblib.load(regression_model_path)
+                with self.metrics.span("model_load", model="regression"):
+                    self.regression_model = load_model(regression_model_path)
             except Exception as e:
                 print(f"Warning: Could not load regression model: {e}", file=sys.stderr)
                 self.regression_model = None
+        
+        # Concurrent requests (in-process orchestrators, batch runs) share one
+        # vectorized predict() per model instead of one call per row
+        batch_size = int(os.getenv("CLINICAMIND_PAIN_BATCH_SIZE", 32))
+        batch_wait_ms = float(os.getenv("CLINICAMIND_PAIN_BATCH_WAIT_MS", 2.0))
+        self.classification_batcher = None
+        self.regression_batcher = None
+        if self.classification_model:
+            self.classification_batcher = MicroBatcher(self.classification_model.predict, batch_size, batch_wait_ms, self.metrics, model="classification")
+        if self.regression_model:
+            self.regression_batcher = MicroBatcher(self.regression_model.predict, batch_size, batch_wait_ms, self.metrics, model="regression")
+
+    @classmethod
+    def fingerprint(cls) -> str:
+        """
+        Identity of everything that determines this agent's output besides
+        the request: version, lexicon packs in every language and model
+        files. The orchestrator keys its stage cache on it.
+        """
+        models = [model_file(path) for path in (CLASSIFICATION_MODEL_PATH, REGRESSION_MODEL_PATH)]
+        models = [file_sha256(path) if os.path.exists(path) else None for path in models]
+        return make_key(cls.name, cls.version, pack_fingerprint("pain_lexicon"), *models)
 
     def parse_numeric_scale(self, text: str):
-        tl = text.lower()
-        m = re.search(r'(\b\d{1,2})\s*(?:/|out of|over)\s*(?:10|ten)\b', tl)
-        if m:
-            return float(np.clip(int(m.group(1)), 0, 10))
-        m = re.search(r'\b(zero|one|two|three|four|five|six|seven|eight|nine|ten)\s*(?:/|out of|over)\s*(?:10|ten)\b', tl)
-        if m:
-            return float(WORD2NUM[m.group(1)])
-        return None
+        return extract_features(text).numeric_scale
 
     def parse_severity_words(self, text: str):
-        tl = text.lower()
-        hits = []
-        for phrase, score in sorted(SEVERITY_WORDS.items(), key=lambda x: -len(x[0])):
-            if phrase in tl:
-                hits.append(score)
-        return float(np.mean(hits)) if hits else None
+        lexicon = pain_lexicon()
+        return lexicon.severity_score(extract_features(text, lexicon).severity_hits)
 
     def compute_intensifier_shift(self, text: str):
-        tl = text.lower()
-        return sum(w for phrase, w in INTENSIFIERS.items() if phrase in tl)
+        lexicon = pain_lexicon()
+        return lexicon.intensifier_shift(extract_features(text, lexicon).intensifier_hits)
 
     def bucketize(self, x: float) -> str:
-        if x <= 3: return "mild (0–3)"
-        if x <= 6: return "moderate (4–6)"
-        return "severe (7–10)"
+        return bucketize(x)
+
+    def estimate_pain_from_features(self, features: TranscriptFeatures, lexicon: Optional[PainLexicon] = None):
+        return estimate_pain(features, lexicon)
 
     def estimate_pain_from_text(self, text: str):
-        base = self.parse_numeric_scale(text)
-        if base is None:
-            base = self.parse_severity_words(text)
-        if base is None:
-            base = 4.5
-        est = float(np.clip(base + self.compute_intensifier_shift(text), 0, 10))
-        return est, self.bucketize(est)
-
-    def assess_pain(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return estimate_pain_from_text(text)
+
+    def assess_pain(self, request: Dict[str, Any]) -> PainAssessment:
         try:
             transcript = request.get("transcript", "")
             visit_type = request.get("visit_type", "unknown")
+            language = request.get("language")
             
             if not transcript:
-                return {
-                    "success": False,
-                    "agent": self.name,
-                    "error": "No transcript provided"
-                }
+                return AgentError(agent=self.name, error="No transcript provided")
 
-            pain_score, severity_bucket = self.estimate_pain_from_text(transcript)
+            # One pass over the text feeds the lexicon score and both models
+            with self.metrics.span("lexicon_scan"):
+                lexicon = pain_lexicon(language)
+                features = extract_features(transcript, lexicon)
+                pain_score, severity_bucket = estimate_pain(features, lexicon)
             
-            result = {
-                "success": True,
-                "agent": self.name,
-                "version": self.version,
-                "visit_type": visit_type,
-                "transcript": transcript,
-                "pain_nrs": pain_score,
-                "severity": severity_bucket,
-                "classification": None,
-                "regression_prediction": None
-            }
+            result = PainAssessment(
+                agent=self.name,
+                version=self.version,
+                visit_type=visit_type,
+                transcript=transcript,
+                pain_nrs=pain_score,
+                severity=severity_bucket
+            )
             
-            if self.classification_model:
+            if self.classification_batcher:
                 try:
-                    classification_features = [len(transcript), transcript.lower().count('pain')]
-                    classification_result = self.classification_model.predict([classification_features])[0]
-                    result["classification"] = classification_result
+                    with self.metrics.span("model_predict", model="classification"):
+                        classification_result = self.classification_batcher.predict(features.model_row())
+                    result.classification = classification_result
                 except Exception as e:
-                    result["classification_error"] = str(e)
+                    result.classification_error = str(e)
             
-            if self.regression_model:
+            if self.regression_batcher:
                 try:
-                    regression_features = [len(transcript), transcript.lower().count('pain')]
-                    regression_result = self.regression_model.predict([regression_features])[0]
-                    result["regression_prediction"] = float(regression_result)
+                    with self.metrics.span("model_predict", model="regression"):
+                        regression_result = self.regression_batcher.predict(features.model_row())
+                    result.regression_prediction = float(regression_result)
                 except Exception as e:
-                    result["regression_error"] = str(e)
+                    result.regression_error = str(e)
+            
+            if request.get("collect_metrics"):
+                result.metrics = self.metrics.drain()
             
             return result
             
         except Exception as e:
-            return {
-                "success": False,
-                "agent": self.name,
-                "error": f"Pain assessment failed: {str(e)}"
-            }
+            return AgentError(agent=self.name, error=f"Pain assessment failed: {str(e)}")
 
 def main():
     try:
-        request = json.loads(sys.stdin.read())
+        request = decode_message(sys.stdin.read())
         
+        # One request per process: nothing to wait for
+        os.environ.setdefault("CLINICAMIND_PAIN_BATCH_WAIT_MS", "0")
         agent = PainAssessmentAgent()
-        response = agent.assess_pain(request)
+        with profiling("pain_assessment_agent"):
+            response = agent.assess_pain(request)
         
-        print(json.dumps(response, indent=2))
+        output, _ = encode_message(response.to_dict(), request.get("shm_threshold"), indent=2)
+        print(output)
         
     except json.JSONDecodeError:
         error_response = {
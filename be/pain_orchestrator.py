@@ -3,69 +3,451 @@ import json
 import sys
 import argparse
 import subprocess
-import tempfile
 import os
-import re
-import numpy as np
-from typing import Dict, Any
+import time
+import functools
+import socket
+import threading
+import atexit
+from typing import Dict, Any, Callable, List, Optional
+from instrumentation import Metrics, profiling
+from content_cache import ContentCache, cache_root, file_sha256, make_key
+from result_format import available_encodings, compact_result, encode_result
+from agent_results import AgentError, json_default, parse_agent_result, to_jsonable
+from agent_trace import trace_recorder
+from rule_packs import rules_signature
+from shm_transport import discard, encode_message, is_handle, load_shared, shm_threshold
 
-# Pain NLP extractor (from original pipeline)
-WORD2NUM = {"zero":0,"one":1,"two":2,"three":3,"four":4,"five":5,"six":6,"seven":7,"eight":8,"nine":9,"ten":10}
-SEVERITY_WORDS = {
-    "no pain":0, "mild":2, "slight":2, "tolerable":3, "moderate":5, "bad":6,
-    "severe":8, "very severe":9, "excruciating":9.5, "worst imaginable":10, "worst":10, "agonizing":10
-}
-INTENSIFIERS = {
-    "a little":-0.5, "a bit":-0.5, "some":-0.3, "quite":0.5, "really":0.8, "very":0.8, "extremely":1.0,
-    "wakes me up":1.0, "can't sleep":1.2, "throbbing":0.3, "stabbing":0.7, "burning":0.5, "numb":-0.4
-}
+def compute_pain_trend(scores: List[float], window: int = 3, change_threshold: float = 2.0) -> Dict[str, Any]:
+    """
+    Trend statistics over per-visit pain scores, ordered by visit.
+    Change points are the visit indices where the score moves by at least
+    `change_threshold` NRS points relative to the previous visit.
+    """
+    # Only series runs need numpy; keep it out of the orchestrator's import time
+    import numpy as np
+    
+    y = np.asarray(scores, dtype=float)
+    n = int(y.size)
+    if n == 0:
+        return {"visit_count": 0}
+    
+    w = max(1, min(window, n))
+    rolling = np.convolve(y, np.ones(w) / w, mode="valid")
+    steps = np.diff(y)
+    
+    return {
+        "visit_count": n,
+        "mean": float(y.mean()),
+        "min": float(y.min()),
+        "max": float(y.max()),
+        "net_change": float(y[-1] - y[0]),
+        "slope_per_visit": float(np.polyfit(np.arange(n, dtype=float), y, 1)[0]) if n > 1 else 0.0,
+        "rolling_window": w,
+        "rolling_average": rolling.tolist(),
+        "change_points": (np.flatnonzero(np.abs(steps) >= change_threshold) + 1).tolist()
+    }
 
-def parse_numeric_scale(text: str):
-    tl = text.lower()
-    m = re.search(r'(\b\d{1,2})\s*(?:/|out of|over)\s*(?:10|ten)\b', tl)
-    if m:
-        return float(np.clip(int(m.group(1)), 0, 10))
-    m = re.search(r'\b(zero|one|two|three|four|five|six|seven|eight|nine|ten)\s*(?:/|out of|over)\s*(?:10|ten)\b', tl)
-    if m:
-        return float(WORD2NUM[m.group(1)])
-    return None
+# Fork server, worker pool and local agent HTTP server, shared by every
+# orchestrator in the process; see agent_host()
+_agent_hosts = {}
+_agent_hosts_lock = threading.Lock()
 
-def parse_severity_words(text: str):
-    tl = text.lower()
-    hits = []
-    for phrase, score in sorted(SEVERITY_WORDS.items(), key=lambda x: -len(x[0])):
-        if phrase in tl:
-            hits.append(score)
-    return float(np.mean(hits)) if hits else None
+def agent_host(kind: str, start: Callable[[], Any]) -> Any:
+    """
+    The process-wide agent host of a kind ("fork_server", "pool" or
+    "http_server"), started by `start` on first use and stopped at exit.
+    Batch and queue runs drive one orchestrator per thread; sharing the host
+    keeps them to one fork server, one local HTTP server and one pool of at
+    most CLINICAMIND_POOL_WORKERS workers.
+    """
+    with _agent_hosts_lock:
+        host = _agent_hosts.get(kind)
+        if host is None:
+            host = _agent_hosts[kind] = start()
+        return host
 
-def compute_intensifier_shift(text: str):
-    tl = text.lower()
-    return sum(w for phrase, w in INTENSIFIERS.items() if phrase in tl)
+def close_agent_hosts():
+    """
+    Stop the shared agent hosts; the next call in their mode starts new ones.
+    """
+    with _agent_hosts_lock:
+        hosts = list(_agent_hosts.values())
+        _agent_hosts.clear()
+    for host in hosts:
+        host.close()
 
-def bucketize(x: float) -> str:
-    if x <= 3: return "mild (0–3)"
-    if x <= 6: return "moderate (4–6)"
-    return "severe (7–10)"
+atexit.register(close_agent_hosts)
 
-def estimate_pain_from_text(text: str):
-    base = parse_numeric_scale(text)
-    if base is None:
-        base = parse_severity_words(text)
-    if base is None:
-        base = 4.5
-    est = float(np.clip(base + compute_intensifier_shift(text), 0, 10))
-    return est, bucketize(est)
+# Request fields that only label a stage's result; see refresh_result()
+LABEL_FIELDS = ("visit_type",)
+# Request fields that only say where agents keep their own caches
+CACHE_FIELDS = ("speech_cache",)
 
-class PainOrchestrator:
+def refresh_result(agent_script: str, result: Any, request: Dict[str, Any]):
+    """
+    Re-apply the request's labels to a stage result served from the cache,
+    which carries those of the run that computed it, and give security
+    results this run's session and audit entry.
+    """
+    agent = os.path.basename(agent_script)
+    if agent == "asr_agent.py":
+        from asr_agent import label_visit
+        label_visit(result, request)
+    elif agent == "pain_assessment_agent.py":
+        result.visit_type = request.get("visit_type", "unknown")
+    elif agent == "security_ethics_agent.py":
+        from security_ethics_agent import reissue_audit_log
+        reissue_audit_log(result, request)
+
+def refresh_pipeline_result(result: Dict[str, Any]):
+    """
+    Stamp a pipeline result served from the pipeline cache with this run's
+    timestamp and give every security result in it a new session and audit
+    entry, as refresh_result() does for single stages.
+    """
+    from security_ethics_agent import SecurityEthicsAgent, reissue_audit_log
+    
+    result["timestamp"] = int(time.time())
+    for component in result["final_result"].get("components", []):
+        if "timestamp" in component.get("params", {}):
+            component["params"]["timestamp"] = result["timestamp"]
+    
+    def walk(value: Any):
+        if isinstance(value, dict):
+            if value.get("agent") == SecurityEthicsAgent.name and value.get("audit_log"):
+                security_result = parse_agent_result(value)
+                reissue_audit_log(security_result, {})
+                value.update(to_jsonable(security_result))
+                return
+            for item in value.values():
+                walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+    
+    walk(result["steps"])
+
+def without_audit_records(value: Any) -> Any:
+    """
+    JSON copy of a request with the per-run session and audit timestamp
+    taken out of embedded security results, so a downstream stage's key
+    does not change every time its security input is refreshed.
+    """
+    from security_ethics_agent import SecurityEthicsAgent
+    
+    if isinstance(value, dict):
+        value = {key: without_audit_records(item) for key, item in value.items()}
+        if value.get("agent") == SecurityEthicsAgent.name and value.get("audit_log"):
+            value.pop("session_id", None)
+            value["audit_log"] = {key: item for key, item in value["audit_log"].items() if key not in ("session_id", "timestamp")}
+        return value
+    if isinstance(value, list):
+        return [without_audit_records(item) for item in value]
+    return value
+
+class StageCache:
+    """
+    On-disk memo of successful agent results per pipeline stage, keyed by
+    the agent's fingerprint and its exact request, with audio inputs
+    identified by content hash. Downstream requests embed upstream results,
+    so a changed agent only invalidates its own stages and the stages whose
+    inputs it actually changes.
+    """
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache = ContentCache("stages", cache_dir)
+    
+    def key(self, agent_fingerprint: str, request: Dict[str, Any]) -> str:
+        # Labels do not change a stage's output; keying on them would make a
+        # visit inserted into a series invalidate every later visit's stages
+        inputs = without_audit_records(to_jsonable({field: value for field, value in request.items() if field not in LABEL_FIELDS + CACHE_FIELDS}))
+        if inputs.get("audio_path"):
+            inputs["audio_sha256"] = file_sha256(inputs["audio_path"])
+        return make_key("stage", agent_fingerprint, json.dumps(inputs, sort_keys=True, default=json_default))
+    
+    def get(self, key: str) -> Any:
+        data = self.cache.get_json(key)
+        return parse_agent_result(data) if data is not None else None
+    
+    def put(self, key: str, result: Any):
+        self.cache.put_json(key, to_jsonable(result))
+
+class Cancellation:
+    """
+    Cancels the agent calls of one pipeline run: calls that have not
+    started return an error immediately, in-flight agent subprocesses and
+    forked children are killed (abandoning their API calls).
+    """
     def __init__(self):
+        self.reason = None
+        self._lock = threading.Lock()
+        self._inflight = set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+    
+    def cancel(self, reason: str):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            inflight = list(self._inflight)
+        for call in inflight:
+            call.kill()
+    
+    def register(self, call) -> bool:
+        """
+        Track an in-flight call (anything with kill()); False if the run
+        was already cancelled, in which case the caller must kill it.
+        """
+        with self._lock:
+            if self.reason is None:
+                self._inflight.add(call)
+                return True
+            return False
+    
+    def unregister(self, call):
+        with self._lock:
+            self._inflight.discard(call)
+
+class PipelineCache:
+    """
+    On-disk memo of whole pipeline results, keyed by audio content hashes,
+    run parameters and every agent fingerprint. The TTS audio is stored
+    alongside so a hit can reproduce the output file.
+    """
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache = ContentCache("pipelines", cache_dir)
+    
+    def key(self, pipeline: str, audio_paths: List[str], params: Dict[str, Any], fingerprints: Dict[str, str]) -> str:
+        return make_key(
+            "pipeline", pipeline,
+            *[file_sha256(path) for path in audio_paths],
+            json.dumps(params, sort_keys=True),
+            json.dumps(fingerprints, sort_keys=True)
+        )
+    
+    def get(self, key: str, output_audio: str) -> Optional[Dict[str, Any]]:
+        """
+        Cached pipeline result with its TTS audio restored to `output_audio`,
+        or None on a miss.
+        """
+        result = self.cache.get_json(key)
+        if result is None:
+            return None
+        tts_outputs = [result["steps"].get("tts"), result["final_result"].get("tts_output")]
+        if any(tts and tts.get("success") for tts in tts_outputs):
+            audio = self.cache.get_bytes(key, ".audio")
+            if audio is None:
+                return None
+            with open(output_audio, "wb") as f:
+                f.write(audio)
+            for tts in tts_outputs:
+                if tts and tts.get("success"):
+                    tts["output_path"] = output_audio
+        return result
+    
+    def put(self, key: str, result: Dict[str, Any], output_audio: str):
+        tts = result["steps"].get("tts")
+        if tts and tts.get("success"):
+            with open(output_audio, "rb") as f:
+                self.cache.put_bytes(key, f.read(), ".audio")
+        self.cache.put_json(key, result)
+
+AGENT_MODES = ("subprocess", "forkserver", "inprocess", "pool", "http")
+
+# Agent script -> (module, class or None for a module-level function, entry point),
+# used when agents run inside the orchestrator process
+IN_PROCESS_AGENTS = {
+    "asr_agent.py": ("asr_agent", "ASRAgent", "process"),
+    "tts_agent.py": ("tts_agent", "TTSAgent", "process"),
+    "pain_assessment_agent.py": ("pain_assessment_agent", "PainAssessmentAgent", "assess_pain"),
+    "security_ethics_agent.py": ("security_ethics_agent", "SecurityEthicsAgent", "process"),
+    "test_security_agent.py": ("test_security_agent", None, "check_pipeline_security")
+}
+
+def load_agent_entry_point(agent_script: str):
+    """
+    Import an agent module and return the callable that serves its requests.
+    """
+    import importlib
+    module_name, class_name, method_name = IN_PROCESS_AGENTS[os.path.basename(agent_script)]
+    module = importlib.import_module(module_name)
+    target = getattr(module, class_name)() if class_name else module
+    return getattr(target, method_name)
+
+def agent_fingerprint(agent_script: str) -> str:
+    """
+    Fingerprint of an agent's version and rules (lexicons, patterns,
+    models), from its class's or module's fingerprint().
+    """
+    import importlib
+    module_name, class_name, _ = IN_PROCESS_AGENTS[os.path.basename(agent_script)]
+    module = importlib.import_module(module_name)
+    return (getattr(module, class_name) if class_name else module).fingerprint()
+
+def _detach_metrics(result: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(result, dict):
+        return result.pop("metrics", None)
+    return result.take_metrics()
+
+def instrumented_pipeline(run_name: str):
+    """
+    Give each pipeline run a fresh Metrics instance, an overall span and the
+    opt-in profiling hook, and attach the collected metrics to the result.
+    Typed agent results inside the pipeline result are converted to plain
+    dicts here, once, on the way out.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            self.metrics = Metrics()
+            with profiling(run_name):
+                with self.metrics.span("pipeline", pipeline=run_name):
+                    result = method(self, *args, **kwargs)
+            result = to_jsonable(result)
+            result["metrics"] = self.metrics.to_dict()
+            return result
+        return wrapper
+    return decorator
+
+class PainOrchestrator:
+    def __init__(self, cache_dir: Optional[str] = None, mode: str = "subprocess", agent_timeout: Optional[float] = 600.0, asr_options: Optional[Dict[str, Any]] = None, security_prescreen: bool = True, trace_file: Optional[str] = None):
         self.name = "Pain_Orchestrator"
         self.version = "1.0"
+        self.agent_timeout = agent_timeout
+        # Extra ASR request fields, e.g. {"preprocess": True, "vad": True}
+        self.asr_options = dict(asr_options or {})
+        self.cache_dir = cache_dir
+        self.stage_cache = StageCache(cache_dir)
+        self.pipeline_cache = PipelineCache(cache_dir)
+        self._agent_fingerprints = None
+        # Scan transcripts for blocking issues right after ASR
+        self.security_prescreen = security_prescreen
+        self._prescreen_agent = None
+        self.metrics = Metrics()
+        if mode not in AGENT_MODES:
+            raise ValueError(f"Unknown agent mode: {mode}")
+        self.mode = mode
+        self._agent_entry_points = {}
+        self._entry_point_lock = threading.Lock()
+        self._http_client = None
+        self._http_client_lock = threading.Lock()
+        self.shm_threshold = shm_threshold()
+        # call_agent() request/response capture for trace_replay.py
+        self.tracer = trace_recorder(trace_file)
+    
+    def close(self):
+        """
+        Drop this orchestrator's agent HTTP client and close its trace. The
+        fork server, worker pool and local agent HTTP server are shared with
+        the process's other orchestrators and stay up until
+        close_agent_hosts() or exit.
+        """
+        self._http_client = None
+        if self.tracer is not None:
+            self.tracer.close()
+    
+    def agent_fingerprints(self) -> Dict[str, str]:
+        """
+        Fingerprints of all agents, computed once per orchestrator and again
+        whenever a rule pack is swapped.
+        """
+        packs = rules_signature()
+        if self._agent_fingerprints is None or self._agent_fingerprints[0] != packs:
+            self._agent_fingerprints = (packs, {agent_script: agent_fingerprint(agent_script) for agent_script in IN_PROCESS_AGENTS})
+        return self._agent_fingerprints[1]
+    
+    def _get_fork_server(self):
+        def start():
+            from agent_forkserver import AgentForkServer
+            with self.metrics.span("fork_server_start"):
+                return AgentForkServer()
+        return agent_host("fork_server", start)
+    
+    def _get_worker_pool(self):
+        def start():
+            from agent_pool import AgentWorkerPool
+            return AgentWorkerPool()
+        return agent_host("pool", start)
+    
+    def _get_http_client(self):
+        with self._http_client_lock:
+            if self._http_client is None:
+                from agent_http import AgentHTTPClient, AgentHTTPServer
+                url = os.getenv("CLINICAMIND_AGENT_URL")
+                if not url:
+                    def start():
+                        with self.metrics.span("http_server_start"):
+                            return AgentHTTPServer()
+                    url = agent_host("http_server", start).url
+                self._http_client = AgentHTTPClient(url)
+            return self._http_client
     
-    def call_agent(self, agent_script: str, request: Dict[str, Any]) -> Dict[str, Any]:
+    def _in_process_entry_point(self, agent_script: str):
         """
-        Call an agent subprocess with JSON input/output.
+        Resolve (and cache) the callable that serves an agent in this process.
+        Agent instances are created once and reused across requests.
         """
+        entry_point = self._agent_entry_points.get(agent_script)
+        if entry_point is None:
+            # Visits run in parallel threads; load each agent (and its models) once
+            with self._entry_point_lock:
+                entry_point = self._agent_entry_points.get(agent_script)
+                if entry_point is None:
+                    entry_point = self._agent_entry_points[agent_script] = load_agent_entry_point(agent_script)
+        return entry_point
+    
+    def call_agent(self, agent_script: str, request: Dict[str, Any], cancellation: Optional[Cancellation] = None) -> Any:
+        """
+        Call an agent in a subprocess (JSON over stdin/stdout), a child forked
+        from the preloaded fork server, a long-lived pool worker, an agent
+        HTTP server, or in-process, depending on the orchestrator mode. Either way the result is a typed agent result
+        (AgentError on failure), or a dict for agents without one.
+        If `cancellation` is cancelled before or during the call, the call
+        is skipped or killed and an AgentError is returned.
+        The call is recorded when tracing is on (see agent_trace.py).
+        """
+        if self.tracer is None:
+            return self._call_agent(agent_script, request, cancellation)
+        start = time.perf_counter()
+        result = self._call_agent(agent_script, request, cancellation)
+        self.tracer.record(agent_script, request, result, time.perf_counter() - start, self.mode)
+        return result
+    
+    def _call_agent(self, agent_script: str, request: Dict[str, Any], cancellation: Optional[Cancellation] = None) -> Any:
+        agent = os.path.splitext(os.path.basename(agent_script))[0]
+        if cancellation and cancellation.cancelled:
+            return self._cancelled(agent, cancellation)
+        
+        if self.mode == "inprocess":
+            try:
+                with self.metrics.span("agent_roundtrip", agent=agent):
+                    result = self._in_process_entry_point(agent_script)(dict(request, collect_metrics=True))
+                self.metrics.merge(_detach_metrics(result), agent=agent)
+                if cancellation and cancellation.cancelled:
+                    # Cannot be interrupted in-process; drop the result
+                    return self._cancelled(agent, cancellation)
+                return parse_agent_result(result) if isinstance(result, dict) else result
+            except Exception as e:
+                self.metrics.incr("agent_failures", agent=agent)
+                return AgentError(error=f"Failed to call agent: {str(e)}")
+        
+        if self.mode == "forkserver":
+            return self._call_forked_agent(agent, agent_script, request, cancellation)
+        
+        if self.mode == "pool":
+            return self._call_pooled_agent(agent, agent_script, request, cancellation)
+        
+        if self.mode == "http":
+            return self._call_http_agent(agent, agent_script, request, cancellation)
+        
+        shared = None
         try:
+            payload, shared = self._encode_request(agent, self._agent_request(request))
+            
+            spawn_start = time.perf_counter()
             process = subprocess.Popen(
                 [sys.executable, agent_script],
                 stdin=subprocess.PIPE,
@@ -73,30 +455,280 @@ class PainOrchestrator:
                 stderr=subprocess.PIPE,
                 text=True
             )
+            self.metrics.record_span("spawn", time.perf_counter() - spawn_start, agent=agent)
+            if cancellation and not cancellation.register(process):
+                process.kill()
+            
+            try:
+                with self.metrics.span("agent_roundtrip", agent=agent):
+                    stdout, stderr = process.communicate(input=payload, timeout=self.agent_timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                self.metrics.incr("agent_timeouts", agent=agent)
+                return AgentError(error=f"Agent timed out after {self.agent_timeout}s")
+            finally:
+                if cancellation:
+                    cancellation.unregister(process)
             
-            stdout, stderr = process.communicate(input=json.dumps(request))
+            if cancellation and cancellation.cancelled:
+                return self._cancelled(agent, cancellation)
             
             if process.returncode != 0:
-                return {
-                    "success": False,
-                    "error": f"Agent failed with return code {process.returncode}",
-                    "stderr": stderr
-                }
+                self.metrics.incr("agent_failures", agent=agent)
+                return AgentError(error=f"Agent failed with return code {process.returncode}", stderr=stderr)
             
-            return json.loads(stdout)
+            return self._decode_response(agent, stdout)
             
         except Exception as e:
-            return {
-                "success": False,
-                "error": f"Failed to call agent: {str(e)}"
-            }
+            self.metrics.incr("agent_failures", agent=agent)
+            return AgentError(error=f"Failed to call agent: {str(e)}")
+        finally:
+            # Normally already unlinked by the agent that read it
+            discard(shared)
+    
+    def _cancelled(self, agent: str, cancellation: Cancellation) -> AgentError:
+        self.metrics.incr("agent_cancellations", agent=agent)
+        return AgentError(error=f"Cancelled: {cancellation.reason}")
     
-    def process_dual_audio(self, first_visit_path: str, second_visit_path: str, language: str = "en-US", voice_name: str = "en-US-Neural2-F", output_audio: str = None) -> Dict[str, Any]:
+    def _agent_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        request = dict(request, collect_metrics=True)
+        if self.shm_threshold:
+            # Lets the agent answer through shared memory too
+            request["shm_threshold"] = self.shm_threshold
+        return request
+    
+    def _encode_request(self, agent: str, message: Dict[str, Any], use_shm: bool = True):
         """
-        Complete pain assessment pipeline using agent architecture for both visits.
+        JSON-encode a request; large ones are placed in shared memory and
+        only their handle is returned for the pipe.
+        """
+        with self.metrics.span("json_encode", agent=agent):
+            payload, shared = encode_message(message, self.shm_threshold if use_shm else None, default=json_default)
+        self.metrics.incr("request_bytes", len(payload), agent=agent)
+        if shared:
+            self.metrics.incr("shm_request_bytes", shared["size"], agent=agent)
+        return payload, shared
+    
+    def _decode_response(self, agent: str, data: Any) -> Any:
+        self.metrics.incr("response_bytes", len(data), agent=agent)
+        with self.metrics.span("json_decode", agent=agent):
+            result = json.loads(data)
+            if is_handle(result):
+                self.metrics.incr("shm_response_bytes", result["size"], agent=agent)
+                result = load_shared(result)
+        self.metrics.merge(result.pop("metrics", None), agent=agent)
+        return parse_agent_result(result)
+    
+    def _call_forked_agent(self, agent: str, agent_script: str, request: Dict[str, Any], cancellation: Optional[Cancellation] = None) -> Any:
+        """
+        Serve one request in a copy-on-write child of the fork server.
+        """
+        shared = None
+        try:
+            payload, shared = self._encode_request(agent, {
+                "agent": os.path.basename(agent_script),
+                "request": self._agent_request(request)
+            })
+            
+            fork_server = self._get_fork_server()
+            with self.metrics.span("fork", agent=agent):
+                forked = fork_server.submit()
+            if cancellation and not cancellation.register(forked):
+                forked.kill()
+            
+            try:
+                with self.metrics.span("agent_roundtrip", agent=agent):
+                    response = forked.result(payload.encode(), timeout=self.agent_timeout)
+            except socket.timeout:
+                forked.kill()
+                self.metrics.incr("agent_timeouts", agent=agent)
+                return AgentError(error=f"Agent timed out after {self.agent_timeout}s")
+            finally:
+                if cancellation:
+                    cancellation.unregister(forked)
+            
+            return self._decode_response(agent, response)
+            
+        except Exception as e:
+            if cancellation and cancellation.cancelled:
+                return self._cancelled(agent, cancellation)
+            self.metrics.incr("agent_failures", agent=agent)
+            return AgentError(error=f"Failed to call agent: {str(e)}")
+        finally:
+            discard(shared)
+    
+    def _call_pooled_agent(self, agent: str, agent_script: str, request: Dict[str, Any], cancellation: Optional[Cancellation] = None) -> Any:
+        """
+        Serve one request on a long-lived pool worker; a worker that crashes
+        mid-request is replaced and the request retried (see agent_pool.py).
+        """
+        from agent_pool import WorkerCrashed
+        shared = None
+        try:
+            payload, shared = self._encode_request(agent, {
+                "agent": os.path.basename(agent_script),
+                "request": self._agent_request(request)
+            })
+            
+            try:
+                with self.metrics.span("agent_roundtrip", agent=agent):
+                    response = self._get_worker_pool().call(payload.encode(), self.agent_timeout, cancellation, self.metrics)
+            except socket.timeout:
+                self.metrics.incr("agent_timeouts", agent=agent)
+                return AgentError(error=f"Agent timed out after {self.agent_timeout}s")
+            
+            return self._decode_response(agent, response)
+            
+        except WorkerCrashed as e:
+            if cancellation and cancellation.cancelled:
+                return self._cancelled(agent, cancellation)
+            # The worker died again on the retry; the request itself may be the cause
+            self.metrics.incr("agent_crashes", agent=agent)
+            return AgentError(error=f"Agent worker crashed: {e}")
+        except Exception as e:
+            if cancellation and cancellation.cancelled:
+                return self._cancelled(agent, cancellation)
+            self.metrics.incr("agent_failures", agent=agent)
+            return AgentError(error=f"Failed to call agent: {str(e)}")
+        finally:
+            discard(shared)
+    
+    def _call_http_agent(self, agent: str, agent_script: str, request: Dict[str, Any], cancellation: Optional[Cancellation] = None) -> Any:
+        """
+        POST one request to the agent HTTP server. Large messages stay
+        inline: the server may be on another host, out of shared memory's reach.
+        """
+        try:
+            payload, _ = self._encode_request(agent, dict(request, collect_metrics=True), use_shm=False)
+            try:
+                with self.metrics.span("agent_roundtrip", agent=agent):
+                    response = self._get_http_client().post(agent_script, payload.encode(), self.agent_timeout)
+            except socket.timeout:
+                self.metrics.incr("agent_timeouts", agent=agent)
+                return AgentError(error=f"Agent timed out after {self.agent_timeout}s")
+            if cancellation and cancellation.cancelled:
+                # A remote call cannot be interrupted; drop the result
+                return self._cancelled(agent, cancellation)
+            return self._decode_response(agent, response)
+        except Exception as e:
+            if cancellation and cancellation.cancelled:
+                return self._cancelled(agent, cancellation)
+            self.metrics.incr("agent_failures", agent=agent)
+            return AgentError(error=f"Failed to call agent: {str(e)}")
+    
+    def run_step(self, steps: Dict[str, Any], step_name: str, agent_script: str, request: Dict[str, Any], cache_hits: Optional[List[str]] = None, cancellation: Optional[Cancellation] = None, **labels) -> Any:
+        """
+        Call an agent as a named pipeline step, timing it and recording its result.
+        When `cache_hits` is given the step is memoized in the stage cache
+        and its name is appended to the list if it was served from there.
+        """
+        cache_key = None
+        if cache_hits is not None:
+            cache_key = self.stage_cache.key(self.agent_fingerprints()[agent_script], request)
+            result = self.stage_cache.get(cache_key)
+            if result is not None:
+                refresh_result(agent_script, result, request)
+                self.metrics.incr("stage_cache_hits", step=step_name, **labels)
+                cache_hits.append(step_name)
+                steps[step_name] = result
+                return result
+        
+        with self.metrics.span("step", step=step_name, **labels):
+            result = self.call_agent(agent_script, request, cancellation)
+        if cache_key and result.get("success"):
+            self.stage_cache.put(cache_key, result)
+        steps[step_name] = result
+        return result
+    
+    def speech_cache(self, use_cache: bool) -> Any:
+        """
+        "speech_cache" field for ASR and TTS requests: this orchestrator's
+        cache root for the agents' transcript and audio caches, or False to
+        bypass them in a run without caching. Absolute, so agents resolve it
+        the same wherever they run.
         """
-        import time
+        return os.path.abspath(cache_root(self.cache_dir)) if use_cache else False
+    
+    def asr_request(self, audio_path: str, language: str, visit_name: str, use_cache: bool = True) -> Dict[str, Any]:
+        return {
+            "audio_path": audio_path,
+            "language": language,
+            "visit_type": visit_name,
+            "speech_cache": self.speech_cache(use_cache),
+            **self.asr_options
+        }
+    
+    def transcribe(self, audio_path: str, language: str = "en-US", visit_name: str = "first_visit") -> Any:
+        """
+        Run only the ASR stage for one visit, through the stage cache, e.g. to
+        screen an encounter ahead of its full pipeline run, which then reuses
+        the cached transcript.
+        """
+        return self.run_step({}, f"{visit_name}_asr", "asr_agent.py", self.asr_request(audio_path, language, visit_name), [], visit=visit_name)
+    
+    def prescreen(self, steps: Dict[str, Any], step_name: str, transcript: str, language: Optional[str] = None, **labels) -> Optional[Any]:
+        """
+        Run the security agent's input scan on a fresh transcript, in this
+        process, before any downstream stage, with the rule pack for the
+        transcript's language. Returns the validation if it found issues
+        that block further processing.
+        """
+        if not self.security_prescreen:
+            return None
+        if self._prescreen_agent is None:
+            from security_ethics_agent import SecurityEthicsAgent
+            self._prescreen_agent = SecurityEthicsAgent()
+        with self.metrics.span("security_prescreen", **labels):
+            validation = self._prescreen_agent.validate_input_security(transcript, self._prescreen_agent.rules(language))
+        steps[step_name] = validation
+        if not self._prescreen_agent.blocks_processing(validation):
+            return None
+        self.metrics.incr("prescreen_blocked", **labels)
+        return validation
+    
+    def _memoized_pipeline(self, pipeline: str, audio_paths: List[str], params: Dict[str, Any], output_audio: str, use_cache: bool, run):
+        """
+        Serve a pipeline run from the pipeline cache, or run it with stage
+        memoization and cache it if it succeeds. `run(cache_hits)` builds the
+        pipeline result; `cache_hits` is None when caching is off.
+        """
+        if not use_cache:
+            return run(None)
+        
+        pipeline_key = self.pipeline_cache.key(pipeline, audio_paths, dict(params, audio_paths=audio_paths, asr_options=self.asr_options, security_prescreen=self.security_prescreen), self.agent_fingerprints())
+        cached = self.pipeline_cache.get(pipeline_key, output_audio)
+        if cached is not None:
+            self.metrics.incr("pipeline_cache_hits", pipeline=pipeline)
+            refresh_pipeline_result(cached)
+            cached["cached_stages"] = list(cached["steps"])
+            return cached
         
+        cache_hits = []
+        pipeline_result = run(cache_hits)
+        pipeline_result["cached_stages"] = cache_hits
+        if pipeline_result["final_result"].get("success"):
+            self.pipeline_cache.put(pipeline_key, to_jsonable(pipeline_result), output_audio)
+        return pipeline_result
+    
+    @instrumented_pipeline("dual_visit_pain_assessment")
+    def process_dual_audio(self, first_visit_path: str, second_visit_path: str, language: str = "en-US", voice_name: str = "en-US-Neural2-F", output_audio: str = None, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Complete pain assessment pipeline using agent architecture for both visits.
+        An unchanged encounter is served from the pipeline cache; otherwise
+        only stages whose agent or inputs changed are recomputed.
+        """
+        output_audio = output_audio if output_audio else "temp_assessment.wav"
+        return self._memoized_pipeline(
+            "dual_visit_pain_assessment",
+            [first_visit_path, second_visit_path],
+            {"language": language, "voice_name": voice_name},
+            output_audio,
+            use_cache,
+            lambda cache_hits: self._dual_audio_pipeline(first_visit_path, second_visit_path, language, voice_name, output_audio, cache_hits)
+        )
+    
+    def _dual_audio_pipeline(self, first_visit_path: str, second_visit_path: str, language: str, voice_name: str, output_audio: str, cache_hits: Optional[List[str]]) -> Dict[str, Any]:
         pipeline_result = {
             "pipeline": "dual_visit_pain_assessment",
             "orchestrator": self.name,
@@ -105,66 +737,70 @@ class PainOrchestrator:
             "final_result": {}
         }
         
-        # Process both audio files
-        visits_data = {}
+        # Steps 1-2 for both visits in parallel: ASR, the security pre-screen
+        # of the transcript, then the pain assessment. The first failure or
+        # blocked transcript cancels whatever the other visit has in flight.
+        from concurrent.futures import ThreadPoolExecutor
         
-        for visit_name, audio_path in [("first_visit", first_visit_path), ("second_visit", second_visit_path)]:
-            # Step 1: ASR Agent for each visit
-            asr_request = {
-                "audio_path": audio_path,
-                "language": language,
-                "visit_type": visit_name
-            }
+        steps = pipeline_result["steps"]
+        cancellation = Cancellation()
+        
+        def process_visit_audio(visit_name: str, audio_path: str) -> Dict[str, Any]:
+            asr_result = self.run_step(steps, f"{visit_name}_asr", "asr_agent.py", self.asr_request(audio_path, language, visit_name, cache_hits is not None), cache_hits, cancellation)
+            if not asr_result.success:
+                return {"error": f"ASR agent failed for {visit_name}", "details": asr_result}
             
-            asr_result = self.call_agent("asr_agent.py", asr_request)
-            pipeline_result["steps"][f"{visit_name}_asr"] = asr_result
+            blocked = self.prescreen(steps, f"{visit_name}_security_prescreen", asr_result.transcript, language, visit=visit_name)
+            if blocked:
+                return {"error": f"Security pre-screen blocked {visit_name}", "details": blocked, "blocked": True}
             
-            if not asr_result.get("success"):
-                pipeline_result["final_result"] = {
-                    "success": False,
-                    "error": f"ASR agent failed for {visit_name}",
-                    "details": asr_result
-                }
-                return pipeline_result
+            pain_request = {
+                "transcript": asr_result.transcript,
+                "visit_type": visit_name,
+                "language": language
+            }
+            pain_result = self.run_step(steps, f"{visit_name}_pain_assessment", "pain_assessment_agent.py", pain_request, cache_hits, cancellation)
+            if not pain_result.success:
+                return {"error": f"Pain assessment failed for {visit_name}", "details": pain_result}
             
-            visits_data[visit_name] = {
-                "audio_path": audio_path,
-                "transcript": asr_result["transcript"]
+            return {"audio_path": audio_path, "transcript": asr_result.transcript, "pain_assessment": pain_result}
+        
+        def run_visit(args) -> Dict[str, Any]:
+            visit = process_visit_audio(*args)
+            if "error" in visit:
+                cancellation.cancel(visit["error"])
+            return visit
+        
+        visit_names = ["first_visit", "second_visit"]
+        with ThreadPoolExecutor(max_workers=len(visit_names)) as executor:
+            visits_data = dict(zip(visit_names, executor.map(run_visit, zip(visit_names, [first_visit_path, second_visit_path]))))
+        
+        if cancellation.cancelled:
+            # Report the failure that cancelled the run, not the stages it cancelled
+            failed = next(visit for visit in visits_data.values() if visit.get("error") == cancellation.reason)
+            pipeline_result["final_result"] = {
+                "success": False,
+                "error": failed["error"],
+                "details": failed["details"]
             }
+            if failed.get("blocked"):
+                pipeline_result["final_result"]["blocked"] = True
+            return pipeline_result
+        
+        pain_assessments = {visit_name: visit["pain_assessment"] for visit_name, visit in visits_data.items()}
         
-        # Step 2: TTS Agent - Generate combined assessment text
+        # Step 3: TTS Agent - Generate combined assessment text
         tts_text = f"Pain assessment comparison between first and second visit."
         
         tts_request = {
             "text": tts_text,
-            "output_path": output_audio if output_audio else "temp_assessment.wav",
+            "output_path": output_audio,
             "language_code": language,
-            "voice_name": voice_name
+            "voice_name": voice_name,
+            "speech_cache": self.speech_cache(cache_hits is not None)
         }
         
-        tts_result = self.call_agent("tts_agent.py", tts_request)
-        pipeline_result["steps"]["tts"] = tts_result
-        
-        # Step 3: Pain Assessment Agent for both visits
-        pain_assessments = {}
-        for visit_name, visit_data in visits_data.items():
-            pain_request = {
-                "transcript": visit_data["transcript"],
-                "visit_type": visit_name
-            }
-            
-            pain_result = self.call_agent("pain_assessment_agent.py", pain_request)
-            pipeline_result["steps"][f"{visit_name}_pain_assessment"] = pain_result
-            
-            if not pain_result.get("success"):
-                pipeline_result["final_result"] = {
-                    "success": False,
-                    "error": f"Pain assessment failed for {visit_name}",
-                    "details": pain_result
-                }
-                return pipeline_result
-            
-            pain_assessments[visit_name] = pain_result
+        tts_result = self.run_step(steps, "tts", "tts_agent.py", tts_request)
         
         # Step 4: Security & Ethics Agent
         security_request = {
@@ -172,13 +808,13 @@ class PainOrchestrator:
             "first_visit_transcript": visits_data["first_visit"]["transcript"],
             "second_visit_transcript": visits_data["second_visit"]["transcript"],
             "first_visit_assessment": pain_assessments["first_visit"],
-            "second_visit_assessment": pain_assessments["second_visit"]
+            "second_visit_assessment": pain_assessments["second_visit"],
+            "language": language
         }
         
-        security_result = self.call_agent("security_ethics_agent.py", security_request)
-        pipeline_result["steps"]["security_ethics"] = security_result
+        security_result = self.run_step(pipeline_result["steps"], "security_ethics", "security_ethics_agent.py", security_request, cache_hits)
         
-        if not security_result.get("success"):
+        if not security_result.success:
             pipeline_result["final_result"] = {
                 "success": False,
                 "error": "Security & Ethics validation failed",
@@ -195,8 +831,7 @@ class PainOrchestrator:
             "security_validation": security_result
         }
         
-        test_security_result = self.call_agent("test_security_agent.py", test_security_request)
-        pipeline_result["steps"]["test_security"] = test_security_result
+        test_security_result = self.run_step(pipeline_result["steps"], "test_security", "test_security_agent.py", test_security_request, cache_hits)
         
         if not test_security_result.get("success"):
             pipeline_result["final_result"] = {
@@ -206,6 +841,9 @@ class PainOrchestrator:
             }
             return pipeline_result
         
+        first_assessment = pain_assessments["first_visit"]
+        second_assessment = pain_assessments["second_visit"]
+        
         # Final result - structured for component compatibility
         pipeline_result["final_result"] = {
             "success": True,
@@ -223,11 +861,11 @@ class PainOrchestrator:
                 }
             },
             "comparison": {
-                "first_visit_pain_score": pain_assessments["first_visit"].get("pain_nrs", 0),
-                "second_visit_pain_score": pain_assessments["second_visit"].get("pain_nrs", 0),
-                "pain_change": pain_assessments["second_visit"].get("pain_nrs", 0) - pain_assessments["first_visit"].get("pain_nrs", 0),
-                "first_visit_severity": pain_assessments["first_visit"].get("severity", "unknown"),
-                "second_visit_severity": pain_assessments["second_visit"].get("severity", "unknown")
+                "first_visit_pain_score": first_assessment.pain_nrs,
+                "second_visit_pain_score": second_assessment.pain_nrs,
+                "pain_change": second_assessment.pain_nrs - first_assessment.pain_nrs,
+                "first_visit_severity": first_assessment.severity,
+                "second_visit_severity": second_assessment.severity
             },
             # Component-compatible structures for frontend integration matching TypeScript interfaces
             "components": [
@@ -345,7 +983,7 @@ class PainOrchestrator:
                         "patientName": "Patient",
                         "previousTreatment": {
                             "medications": ["ibuprofen", "Tylenol"],
-                            "effectiveness": "partially-effective" if pain_assessments["second_visit"].get("pain_nrs", 0) < pain_assessments["first_visit"].get("pain_nrs", 0) else "ineffective",
+                            "effectiveness": "partially-effective" if second_assessment.pain_nrs < first_assessment.pain_nrs else "ineffective",
                             "ongoingSymptoms": ["pain when lying down", "intermittent sharp pain"]
                         },
                         "clinicalDecision": {
@@ -415,39 +1053,252 @@ class PainOrchestrator:
                 }
             ],
             "tts_output": tts_result,
-            "security_status": security_result.get("overall_status", {}),
+            "security_status": security_result.overall_status,
             "security_test_results": test_security_result,
-            "requires_review": security_result.get("overall_status", {}).get("requires_review", False)
+            "requires_review": security_result.overall_status.requires_review
+        }
+        
+        return pipeline_result
+    
+    def process_visit(self, visit_name: str, audio_path: str, language: str = "en-US", use_cache: bool = True, cancellation: Optional[Cancellation] = None) -> Dict[str, Any]:
+        """
+        Run ASR, pain assessment and security validation for a single visit.
+        Each stage is memoized in the stage cache, so re-running a series
+        only processes recordings (or agents) that changed since last time.
+        A failed or blocked visit cancels `cancellation`, stopping the other
+        visits of the run.
+        """
+        visit_result = self._process_visit(visit_name, audio_path, language, use_cache, cancellation)
+        if cancellation and not visit_result["success"]:
+            cancellation.cancel(visit_result["error"])
+        return visit_result
+    
+    def _process_visit(self, visit_name: str, audio_path: str, language: str, use_cache: bool, cancellation: Optional[Cancellation]) -> Dict[str, Any]:
+        cache_hits = [] if use_cache else None
+        visit_result = {
+            "success": False,
+            "visit_name": visit_name,
+            "audio_input": audio_path,
+            "cached": False,
+            "steps": {}
+        }
+        
+        asr_result = self.run_step(visit_result["steps"], "asr", "asr_agent.py", self.asr_request(audio_path, language, visit_name, use_cache), cache_hits, cancellation, visit=visit_name)
+        if not asr_result.success:
+            visit_result["error"] = f"ASR agent failed for {visit_name}"
+            return visit_result
+        transcript = asr_result.transcript
+        
+        blocked = self.prescreen(visit_result["steps"], "security_prescreen", transcript, language, visit=visit_name)
+        if blocked:
+            visit_result.update({"error": f"Security pre-screen blocked {visit_name}", "blocked": True})
+            return visit_result
+        
+        pain_result = self.run_step(visit_result["steps"], "pain_assessment", "pain_assessment_agent.py", {
+            "transcript": transcript,
+            "visit_type": visit_name,
+            "language": language
+        }, cache_hits, cancellation, visit=visit_name)
+        if not pain_result.success:
+            visit_result["error"] = f"Pain assessment failed for {visit_name}"
+            return visit_result
+        
+        security_result = self.run_step(visit_result["steps"], "security_ethics", "security_ethics_agent.py", {
+            "mode": "full_pipeline",
+            "text": transcript,
+            "pain_score": pain_result.pain_nrs,
+            "severity": pain_result.severity,
+            "transcript": transcript,
+            "language": language
+        }, cache_hits, cancellation, visit=visit_name)
+        if not security_result.success:
+            visit_result["error"] = f"Security & Ethics validation failed for {visit_name}"
+            return visit_result
+        
+        visit_result.update({
+            "success": True,
+            "transcript": transcript,
+            "pain_assessment": pain_result,
+            "security_status": security_result.overall_status,
+            "cached": cache_hits is not None and set(cache_hits) == {"asr", "pain_assessment", "security_ethics"}
+        })
+        if visit_result["cached"]:
+            self.metrics.incr("visit_cache_hits")
+        return visit_result
+    
+    @instrumented_pipeline("visit_series_pain_assessment")
+    def process_visit_series(self, visit_paths: List[str], language: str = "en-US", voice_name: str = "en-US-Neural2-F", output_audio: str = None, max_workers: int = 4, use_cache: bool = True, trend_window: int = 3) -> Dict[str, Any]:
+        """
+        Longitudinal pain assessment pipeline over N visits, given in visit order.
+        Visits are processed in parallel; trend statistics are computed over
+        the resulting pain scores.
+        """
+        output_audio = output_audio if output_audio else "temp_assessment.wav"
+        return self._memoized_pipeline(
+            "visit_series_pain_assessment",
+            list(visit_paths),
+            {"language": language, "voice_name": voice_name, "trend_window": trend_window},
+            output_audio,
+            use_cache,
+            lambda cache_hits: self._visit_series_pipeline(visit_paths, language, voice_name, output_audio, max_workers, cache_hits is not None, trend_window)
+        )
+    
+    def _visit_series_pipeline(self, visit_paths: List[str], language: str, voice_name: str, output_audio: str, max_workers: int, use_cache: bool, trend_window: int) -> Dict[str, Any]:
+        pipeline_result = {
+            "pipeline": "visit_series_pain_assessment",
+            "orchestrator": self.name,
+            "timestamp": int(time.time()),
+            "steps": {},
+            "final_result": {}
+        }
+        
+        if not visit_paths:
+            pipeline_result["final_result"] = {
+                "success": False,
+                "error": "No visit audio files provided"
+            }
+            return pipeline_result
+        
+        from concurrent.futures import ThreadPoolExecutor
+        
+        visit_names = [f"visit_{i + 1}" for i in range(len(visit_paths))]
+        
+        # Visits overlap on threads: out-of-process modes spend them waiting on
+        # agent I/O, while inprocess mode runs agent code here under the GIL
+        # and mostly overlaps only the speech API calls
+        cancellation = Cancellation()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(visit_paths)))) as executor:
+            visits = list(executor.map(
+                lambda args: self.process_visit(args[0], args[1], language, use_cache, cancellation),
+                zip(visit_names, visit_paths)
+            ))
+        
+        for visit in visits:
+            pipeline_result["steps"][visit["visit_name"]] = visit
+        
+        failed = [visit for visit in visits if not visit.get("success")]
+        if failed:
+            # The failure that cancelled the run, not the stages it cancelled
+            pipeline_result["final_result"] = {
+                "success": False,
+                "error": cancellation.reason or failed[0].get("error", f"Processing failed for {failed[0]['visit_name']}"),
+                "failed_visits": [visit["visit_name"] for visit in failed]
+            }
+            blocked = [visit["visit_name"] for visit in failed if visit.get("blocked")]
+            if blocked:
+                pipeline_result["final_result"]["blocked_visits"] = blocked
+            return pipeline_result
+        
+        scores = [visit["pain_assessment"].pain_nrs for visit in visits]
+        trend = compute_pain_trend(scores, window=trend_window)
+        
+        tts_request = {
+            "text": f"Pain assessment across {len(visits)} visits. Pain changed by {trend['net_change']:+.1f} points, averaging {trend['slope_per_visit']:+.2f} points per visit.",
+            "output_path": output_audio,
+            "language_code": language,
+            "voice_name": voice_name,
+            "speech_cache": self.speech_cache(use_cache)
+        }
+        tts_result = self.run_step(pipeline_result["steps"], "tts", "tts_agent.py", tts_request)
+        
+        pipeline_result["final_result"] = {
+            "success": True,
+            "pipeline_type": "visit_series_pain_assessment",
+            "visits": [
+                {
+                    "visit_name": visit["visit_name"],
+                    "audio_input": visit["audio_input"],
+                    "transcript": visit["transcript"],
+                    "pain_assessment": visit["pain_assessment"],
+                    "security_status": visit["security_status"],
+                    "cached": visit["cached"]
+                }
+                for visit in visits
+            ],
+            "trend": trend,
+            "tts_output": tts_result,
+            "requires_review": any(visit["security_status"].requires_review for visit in visits)
         }
         
         return pipeline_result
 
 def main():
-    parser = argparse.ArgumentParser(description="Pain Assessment Orchestrator - Processes dual visit audio files")
-    parser.add_argument("--first-visit", required=True, help="First visit audio file path")
-    parser.add_argument("--second-visit", required=True, help="Second visit audio file path") 
+    parser = argparse.ArgumentParser(description="Pain Assessment Orchestrator - Processes dual visit or N-visit series audio files")
+    parser.add_argument("--first-visit", help="First visit audio file path")
+    parser.add_argument("--second-visit", help="Second visit audio file path") 
+    parser.add_argument("--visits", nargs="+", help="Audio file paths for an N-visit series, in visit order")
+    parser.add_argument("--mode", choices=AGENT_MODES, default="subprocess", help="Run agents as cold-started subprocesses, as children forked from a preloaded fork server, on long-lived recycled pool workers, on an agent HTTP server (CLINICAMIND_AGENT_URL, else a local one), or inside the orchestrator")
+    parser.add_argument("--preprocess-audio", action="store_true", help="Resample audio to 16 kHz mono and re-encode compactly before ASR upload")
+    parser.add_argument("--vad", action="store_true", help="Trim silence and transcribe only speech segments")
+    parser.add_argument("--chunked-asr", action="store_true", help="Transcribe content-defined chunks so edited recordings only re-transcribe changed audio")
+    parser.add_argument("--no-prescreen", action="store_true", help="Skip the security pre-screen of transcripts right after ASR")
+    parser.add_argument("--agent-timeout", type=float, default=600.0, help="Seconds before a hung agent subprocess is killed")
+    parser.add_argument("--max-workers", type=int, default=4, help="Visits processed in parallel (series mode)")
+    parser.add_argument("--cache-dir", help="Pipeline and per-stage result cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the pipeline and per-stage result caches")
     parser.add_argument("--language", default="en-US", help="Language code")
     parser.add_argument("--voice", default="en-US-Neural2-F", help="TTS voice name")
     parser.add_argument("--output-audio", help="Output audio file path (optional)")
     parser.add_argument("--output-json", help="Output JSON file path (optional)")
+    parser.add_argument("--compact", action="store_true", help="Store transcripts and assessments once and reference them by id")
+    # Checked before any agent runs; msgpack is only offered when installed
+    parser.add_argument("--encoding", choices=available_encodings(), default="pretty", help="Result encoding: indented JSON, compact JSON (orjson if installed) or msgpack (if installed)")
+    parser.add_argument("--metrics-out", help="Write run metrics to this file (optional)")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"], default="json", help="Metrics export format")
+    parser.add_argument("--trace", help="Append redacted agent request/response traces to this JSON-lines file (see trace_replay.py)")
+    parser.add_argument("--profile", help="Comma-separated profilers to enable for this run and its agents: cprofile, tracemalloc")
     args = parser.parse_args()
     
-    orchestrator = PainOrchestrator()
+    if not args.visits and not (args.first_visit and args.second_visit):
+        parser.error("either --visits or both --first-visit and --second-visit are required")
+    
+    if args.profile:
+        # Inherited by agent subprocesses so every agent dumps its own profile
+        os.environ["CLINICAMIND_PROFILE"] = args.profile
+    
+    asr_options = {}
+    if args.preprocess_audio:
+        asr_options["preprocess"] = True
+    if args.vad:
+        asr_options["vad"] = True
+    if args.chunked_asr:
+        asr_options["chunked"] = True
+    
+    orchestrator = PainOrchestrator(cache_dir=args.cache_dir, mode=args.mode, agent_timeout=args.agent_timeout, asr_options=asr_options, security_prescreen=not args.no_prescreen, trace_file=args.trace)
+    
+    if args.visits:
+        result = orchestrator.process_visit_series(
+            visit_paths=args.visits,
+            language=args.language,
+            voice_name=args.voice,
+            output_audio=args.output_audio,
+            max_workers=args.max_workers,
+            use_cache=not args.no_cache
+        )
+    else:
+        result = orchestrator.process_dual_audio(
+            first_visit_path=args.first_visit,
+            second_visit_path=args.second_visit,
+            language=args.language,
+            voice_name=args.voice,
+            output_audio=args.output_audio,
+            use_cache=not args.no_cache
+        )
+    
+    orchestrator.close()
     
-    result = orchestrator.process_dual_audio(
-        first_visit_path=args.first_visit,
-        second_visit_path=args.second_visit,
-        language=args.language,
-        voice_name=args.voice,
-        output_audio=args.output_audio
-    )
+    if args.metrics_out:
+        orchestrator.metrics.write(args.metrics_out, args.metrics_format)
     
     # Output result
+    data = encode_result(compact_result(result) if args.compact else result, args.encoding)
     if args.output_json:
-        with open(args.output_json, 'w') as f:
-            json.dump(result, f, indent=2)
+        with open(args.output_json, 'wb') as f:
+            f.write(data)
     else:
-        print(json.dumps(result, indent=2))
+        sys.stdout.buffer.write(data)
+        if args.encoding != "msgpack":
+            sys.stdout.buffer.write(b"\n")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
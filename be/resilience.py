@@ -0,0 +1,387 @@
+"""
+Resilience helpers for calls to external speech APIs: per-attempt timeouts
+under an overall deadline, jittered exponential retry, optional hedged
+requests, a circuit breaker and a token-bucket rate limiter. Breaker and
+limiter state is shared between agent processes through small locked
+state files.
+
+Tuning comes from the environment so it reaches agent subprocesses:
+CLINICAMIND_API_TIMEOUT_S, CLINICAMIND_API_DEADLINE_S, CLINICAMIND_API_RETRIES,
+CLINICAMIND_HEDGE_AFTER_S, CLINICAMIND_BREAKER_THRESHOLD,
+CLINICAMIND_BREAKER_RESET_S and the per-API quotas read by RateLimiter.from_env.
+CLINICAMIND_API_STATE_DIR pins where breaker and limiter state lives (see
+api_state_root).
+"""
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: breaker state is only shared within a process
+    fcntl = None
+
+def api_state_root(cache_dir: Union[str, bool, None] = None) -> str:
+    """
+    Absolute directory for breaker and rate limiter state, which every caller
+    of an API must share: CLINICAMIND_API_STATE_DIR, else the cache root in
+    use (`cache_dir`, then CLINICAMIND_CACHE_DIR), else ~/.cache/clinicamind.
+    Never the working directory, so callers started elsewhere (queue nodes,
+    replay, batch runs) still draw from the same buckets.
+    """
+    root = (os.getenv("CLINICAMIND_API_STATE_DIR") or cache_dir or os.getenv("CLINICAMIND_CACHE_DIR")
+            or os.path.join(os.path.expanduser("~"), ".cache", "clinicamind"))
+    return os.path.abspath(root)
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+class RateLimitTimeout(TimeoutError):
+    pass
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """
+    HTTP status of an API error, looking through wrapping exceptions.
+    """
+    while exc is not None:
+        status = getattr(exc, "status_code", None)
+        if status is not None:
+            return status
+        exc = exc.__cause__
+    return None
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    The Retry-After delay a throttled response asked for, if any.
+    """
+    while exc is not None:
+        response = getattr(exc, "response", None)
+        value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        exc = exc.__cause__
+    return None
+
+@contextmanager
+def locked_json_state(path: str, default: Dict[str, Any], thread_lock: threading.Lock):
+    """
+    Read-modify-write a small JSON state file under an exclusive lock shared
+    by threads (`thread_lock`) and processes (flock on <path>.lock).
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with thread_lock, open(f"{path}.lock", "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(path, "r") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = dict(default)
+            yield state
+            with open(path, "w") as f:
+                json.dump(state, f)
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    True for errors worth retrying: timeouts, connection failures and
+    408/409/429/5xx responses. Agents wrap API errors, so the cause is checked too.
+    """
+    while exc is not None:
+        status = getattr(exc, "status_code", None)
+        if status is not None:
+            return status in (408, 409, 429) or status >= 500
+        if isinstance(exc, (TimeoutError, ConnectionError)):
+            return True
+        if type(exc).__name__ in ("APITimeoutError", "APIConnectionError", "TimeoutException", "ConnectError"):
+            return True
+        exc = exc.__cause__
+    return False
+
+class ResiliencePolicy:
+    def __init__(self, attempt_timeout: float = 60.0, deadline: float = 180.0, attempts: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0, hedge_after: Optional[float] = None):
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+
+    @classmethod
+    def from_env(cls, attempt_timeout: float = 60.0, deadline: float = 180.0) -> "ResiliencePolicy":
+        hedge_after = os.getenv("CLINICAMIND_HEDGE_AFTER_S")
+        return cls(
+            attempt_timeout=float(os.getenv("CLINICAMIND_API_TIMEOUT_S", attempt_timeout)),
+            deadline=float(os.getenv("CLINICAMIND_API_DEADLINE_S", deadline)),
+            attempts=int(os.getenv("CLINICAMIND_API_RETRIES", 3)),
+            hedge_after=float(hedge_after) if hedge_after else None
+        )
+
+def call_with_retry(fn: Callable[[float], Any], policy: ResiliencePolicy,
+                    retryable: Callable[[BaseException], bool] = is_transient,
+                    sleep: Callable[[float], None] = time.sleep) -> Any:
+    """
+    Call fn(timeout) until it succeeds, a non-retryable error is raised, the
+    attempts run out or the overall deadline would be exceeded. Backoff uses
+    "full jitter": a uniform delay in [0, min(max_delay, base_delay * 2**n)].
+    """
+    deadline_at = time.monotonic() + policy.deadline
+    for attempt in range(policy.attempts):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline of {policy.deadline}s exceeded after {attempt} attempts")
+        try:
+            return fn(min(policy.attempt_timeout, remaining))
+        except Exception as e:
+            if attempt == policy.attempts - 1 or not retryable(e):
+                raise
+            delay = random.uniform(0, min(policy.max_delay, policy.base_delay * (2 ** attempt)))
+            if time.monotonic() + delay >= deadline_at:
+                raise
+            sleep(delay)
+
+def hedged_call(fn: Callable[[], Any], hedge_after: float, max_hedges: int = 1) -> Any:
+    """
+    Start fn(); if it has not finished after hedge_after seconds, start a
+    duplicate, up to max_hedges extra copies. The first success wins and the
+    losers are abandoned. Only use for idempotent calls.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_hedges + 1)
+    try:
+        pending = {executor.submit(fn)}
+        launched = 1
+        last_error = None
+        while pending:
+            timeout = hedge_after if launched <= max_hedges else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+            if launched <= max_hedges and (not done or not pending):
+                pending.add(executor.submit(fn))
+                launched += 1
+        raise last_error
+    finally:
+        executor.shutdown(wait=False)
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; open ->
+    half-open after `reset_timeout` seconds, when a single trial call decides
+    whether to close again (a trial that never reports back is retried after
+    another `reset_timeout`). State is kept in <api_state_root>/breakers/<name>.json.
+    """
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None,
+                 cache_dir: Union[str, bool, None] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("CLINICAMIND_BREAKER_THRESHOLD", 5))
+        self.reset_timeout = reset_timeout or float(os.getenv("CLINICAMIND_BREAKER_RESET_S", 30))
+        self.state_dir = os.path.join(api_state_root(cache_dir), "breakers")
+        self.state_path = os.path.join(self.state_dir, f"{name}.json")
+        self._thread_lock = threading.Lock()
+
+    def _locked_state(self):
+        return locked_json_state(self.state_path, {"state": "closed", "failures": 0, "opened_at": 0.0}, self._thread_lock)
+
+    def allow(self) -> bool:
+        with self._locked_state() as state:
+            if state["state"] != "closed" and time.time() - state["opened_at"] >= self.reset_timeout:
+                state.update(state="half_open", opened_at=time.time())
+                return True
+            return state["state"] == "closed"
+
+    def record_success(self):
+        with self._locked_state() as state:
+            state.update(state="closed", failures=0)
+
+    def record_failure(self):
+        with self._locked_state() as state:
+            state["failures"] += 1
+            if state["state"] == "half_open" or state["failures"] >= self.failure_threshold:
+                state.update(state="open", opened_at=time.time())
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        try:
+            result = fn()
+        except RateLimitTimeout:
+            # Our own quota ran out before the request was sent
+            raise
+        except Exception as e:
+            if is_transient(e):
+                self.record_failure()
+            elif getattr(e, "status_code", None) is not None:
+                # The service answered; a client error says it is reachable
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and for usage units per minute
+    (audio seconds, characters, ...), shared by every process through
+    <api_state_root>/rate_limits/<name>.json. Each bucket holds up to `burst_s`
+    seconds of quota. Requests larger than a bucket are admitted once it is
+    full and drive it negative, so the long-run rate still holds.
+
+    Throttling is adaptive (AIMD): a 429 halves the admitted rate, at most
+    once per `decrease_interval` and down to `min_factor` of the quota, and
+    honours Retry-After for every process. Each success adds back
+    `increase_step` of the quota.
+    """
+    def __init__(self, name: str, requests_per_min: Optional[float] = None, units_per_min: Optional[float] = None,
+                 burst_s: float = 10.0, min_factor: float = 0.1, increase_step: float = 0.05,
+                 decrease_interval: float = 1.0, cache_dir: Union[str, bool, None] = None):
+        self.name = name
+        self.limits = {"requests": requests_per_min, "units": units_per_min}
+        self.burst_s = burst_s
+        self.min_factor = min_factor
+        self.increase_step = increase_step
+        self.decrease_interval = decrease_interval
+        self.state_path = os.path.join(api_state_root(cache_dir), "rate_limits", f"{name}.json")
+        self._thread_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name: str, requests_env: str, units_env: Optional[str] = None,
+                 cache_dir: Union[str, bool, None] = None) -> "RateLimiter":
+        """
+        Limiter with quotas from the given environment variables; unset or
+        0 leaves that dimension unlimited. CLINICAMIND_RATE_BURST_S sets the burst.
+        """
+        def quota(var: Optional[str]) -> Optional[float]:
+            value = float(os.getenv(var, 0) or 0) if var else 0
+            return value if value > 0 else None
+        return cls(name, quota(requests_env), quota(units_env), burst_s=float(os.getenv("CLINICAMIND_RATE_BURST_S", 10)),
+                   cache_dir=cache_dir)
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.limits.values())
+
+    def _locked_state(self):
+        return locked_json_state(self.state_path, {"tokens": {}, "updated_at": time.time(), "factor": 1.0,
+                                                   "throttled_at": 0.0, "blocked_until": 0.0}, self._thread_lock)
+
+    def _try_take(self, state: Dict[str, Any], amounts: Dict[str, float]) -> float:
+        """
+        Refill the buckets and take `amounts` if possible; otherwise return
+        the seconds to wait before trying again.
+        """
+        now = time.time()
+        elapsed = max(0.0, now - state["updated_at"])
+        state["updated_at"] = now
+        waits = [state["blocked_until"] - now]
+        rates = {}
+        for dimension, limit in self.limits.items():
+            if not limit:
+                continue
+            rate = rates[dimension] = limit * state["factor"] / 60.0
+            capacity = rate * self.burst_s
+            tokens = min(capacity, state["tokens"].get(dimension, capacity) + elapsed * rate)
+            state["tokens"][dimension] = tokens
+            waits.append((min(amounts[dimension], capacity) - tokens) / rate)
+        wait = max(waits)
+        if wait <= 0:
+            for dimension in rates:
+                state["tokens"][dimension] -= amounts[dimension]
+        return wait
+
+    def acquire(self, units: float = 0.0, timeout: Optional[float] = None, sleep: Callable[[float], None] = time.sleep) -> float:
+        """
+        Block until one request of `units` fits the quotas; returns the
+        seconds spent waiting.
+        """
+        if not self.enabled:
+            return 0.0
+        amounts = {"requests": 1.0, "units": float(units)}
+        waited = 0.0
+        while True:
+            with self._locked_state() as state:
+                wait = self._try_take(state, amounts)
+            if wait <= 0:
+                return waited
+            if timeout is not None and waited + wait > timeout:
+                raise RateLimitTimeout(f"Rate limit '{self.name}' not available within {timeout}s")
+            # Re-check at least every second: other processes may back off or
+            # return unused capacity in the meantime
+            step = min(wait, 1.0)
+            sleep(step)
+            waited += step
+
+    def record_throttle(self, retry_after: Optional[float] = None):
+        with self._locked_state() as state:
+            now = time.time()
+            if now - state["throttled_at"] >= self.decrease_interval:
+                state["factor"] = max(self.min_factor, state["factor"] * 0.5)
+                state["throttled_at"] = now
+                # Drop saved-up burst so the lower rate applies immediately
+                state["tokens"] = {dimension: min(tokens, 0.0) for dimension, tokens in state["tokens"].items()}
+            if retry_after:
+                state["blocked_until"] = max(state["blocked_until"], now + retry_after)
+
+    def record_success(self):
+        with self._locked_state() as state:
+            if state["factor"] < 1.0:
+                state["factor"] = min(1.0, state["factor"] + self.increase_step)
+
+    def call(self, fn: Callable[[Optional[float]], Any], units: float = 0.0, timeout: Optional[float] = None) -> Any:
+        """
+        Call fn(remaining_timeout) within the quotas, backing off if it
+        reports a 429. Waiting for quota counts against `timeout`; quota that
+        does not free up within it raises RateLimitTimeout, which
+        call_with_retry retries like any other timeout.
+        """
+        if not self.enabled:
+            return fn(timeout)
+        waited = self.acquire(units, timeout)
+        try:
+            result = fn(None if timeout is None else timeout - waited)
+        except Exception as e:
+            if status_code(e) == 429:
+                self.record_throttle(retry_after_seconds(e))
+            raise
+        self.record_success()
+        return result
+
+def resilient_call(breaker: CircuitBreaker, fn: Callable[[float], Any], policy: ResiliencePolicy,
+                   fallbacks: List[Tuple[str, Callable[[], Any]]] = (), primary_name: str = "primary") -> Tuple[Any, str]:
+    """
+    Call fn(timeout) through the circuit breaker with retries (and hedging if
+    the policy enables it). If that fails or the circuit is open, try each
+    (backend_name, fallback) in order; a fallback returning None is skipped.
+    Returns (result, backend_name).
+    """
+    def attempt(timeout: float) -> Any:
+        if policy.hedge_after:
+            return hedged_call(lambda: fn(timeout), policy.hedge_after)
+        return fn(timeout)
+
+    try:
+        return breaker.call(lambda: call_with_retry(attempt, policy)), primary_name
+    except Exception as primary_error:
+        for backend_name, fallback in fallbacks:
+            try:
+                result = fallback()
+            except Exception:
+                continue
+            if result is not None:
+                return result, backend_name
+        raise primary_error
@@ -0,0 +1,115 @@
+"""
+Compact pipeline result representation and fast encoders.
+
+A pipeline result repeats each transcript in several places: the ASR step,
+the pain assessment (which echoes it), the visit summary and the security
+request. The compact form interns every long string and every pain
+assessment into a table once and replaces each occurrence with a
+{"$ref": "<id>"} marker. expand_result() restores the original structure.
+
+Encodings: "pretty" (indented JSON, the historical output), "fast"
+(compact JSON, via orjson when installed) and "msgpack" (binary, needs
+the optional msgpack package; available_encodings() leaves it out when
+msgpack is not installed).
+"""
+import json
+from typing import Any, Dict, Tuple
+
+COMPACT_FORMAT = "clinicamind-compact/1"
+MIN_INTERNED_LENGTH = 64
+ENCODINGS = ("pretty", "fast", "msgpack")
+
+def _is_assessment(value: Dict[str, Any]) -> bool:
+    return value.get("agent") == "Pain_Assessment_Agent"
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return a compact copy of `result` with long strings and pain assessments
+    stored once in "strings"/"assessments" tables and referenced by id.
+    """
+    strings, string_ids = {}, {}
+    assessments, assessment_ids = {}, {}
+
+    def intern_string(value: str) -> Dict[str, str]:
+        ref = string_ids.get(value)
+        if ref is None:
+            ref = string_ids[value] = f"s{len(string_ids)}"
+            strings[ref] = value
+        return {"$ref": ref}
+
+    def walk(value: Any) -> Any:
+        if isinstance(value, str):
+            return intern_string(value) if len(value) >= MIN_INTERNED_LENGTH else value
+        if isinstance(value, list):
+            return [walk(item) for item in value]
+        if isinstance(value, dict):
+            compacted = {key: walk(item) for key, item in value.items()}
+            if _is_assessment(value):
+                fingerprint = json.dumps(compacted, sort_keys=True)
+                ref = assessment_ids.get(fingerprint)
+                if ref is None:
+                    ref = assessment_ids[fingerprint] = f"a{len(assessment_ids)}"
+                    assessments[ref] = compacted
+                return {"$ref": ref}
+            return compacted
+        return value
+
+    body = walk(result)
+    return {"format": COMPACT_FORMAT, "strings": strings, "assessments": assessments, "result": body}
+
+def expand_result(compact: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Inverse of compact_result(); results that are not compact pass through.
+    """
+    if compact.get("format") != COMPACT_FORMAT:
+        return compact
+    tables = dict(compact["strings"], **compact["assessments"])
+
+    def walk(value: Any) -> Any:
+        if isinstance(value, list):
+            return [walk(item) for item in value]
+        if isinstance(value, dict):
+            if len(value) == 1 and "$ref" in value:
+                return walk(tables[value["$ref"]])
+            return {key: walk(item) for key, item in value.items()}
+        return value
+
+    return walk(compact["result"])
+
+def available_encodings() -> Tuple[str, ...]:
+    """
+    The ENCODINGS whose dependencies are installed.
+    """
+    try:
+        import msgpack
+    except ImportError:
+        return tuple(encoding for encoding in ENCODINGS if encoding != "msgpack")
+    return ENCODINGS
+
+def encode_result(result: Dict[str, Any], encoding: str = "pretty") -> bytes:
+    if encoding == "pretty":
+        return json.dumps(result, indent=2).encode()
+    if encoding == "fast":
+        try:
+            import orjson
+            return orjson.dumps(result)
+        except ImportError:
+            return json.dumps(result, separators=(",", ":")).encode()
+    if encoding == "msgpack":
+        import msgpack
+        return msgpack.packb(result, use_bin_type=True)
+    raise ValueError(f"Unknown result encoding: {encoding}")
+
+def decode_result(data: bytes) -> Dict[str, Any]:
+    """
+    Decode any supported encoding (JSON or msgpack) and expand compact results.
+    """
+    stripped = data.lstrip()
+    if stripped[:1] in (b"{", b"["):
+        return expand_result(json.loads(data))
+    import msgpack
+    return expand_result(msgpack.unpackb(data, raw=False))
+
+def load_result(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        return decode_result(f.read())
@@ -0,0 +1,269 @@
+"""
+Versioned rule packs for the text agents.
+
+The security agent's sensitive-data patterns, concerning terms and pain
+score thresholds, and the pain lexicons (number words, severity words,
+intensifiers, 0-10 scale patterns), live in JSON files under rules/
+(CLINICAMIND_RULES_DIR overrides the directory):
+
+    rules/security.json          {"name": "security", "version": ..., ...}
+    rules/pain_lexicon.json      {"name": "pain_lexicon", "version": ..., ...}
+    rules/<lang>/<name>.json     the same packs for another language
+
+load_rules(name, language) returns the pack compiled into ready-to-use
+matchers: patterns compiled once, phrases normalized. The language is a
+request's language code ("es-MX" uses rules/es/); languages without a
+pack of their own fall back to the top-level (English) one. A pack with
+"fold_accents" matches phrases against lower-cased, accent-stripped text,
+so ASR output with or without diacritics scores the same. Sensitive
+patterns match case-insensitively unless their entry sets
+"ignore_case": false, e.g. for ID formats defined by upper-case letters.
+
+Compiled packs are held in an LRU per (name, language) of
+CLINICAMIND_RULES_CACHE_SIZE entries (default 16), and deduplicated by
+content fingerprint, so mixed-language batches switch between warm
+matchers instead of recompiling. Each pack file is re-checked (one stat) at most every
+CLINICAMIND_RULES_CHECK_S seconds (default 2, 0 checks on every call); an
+edited pack is compiled off to the side and swapped in with one reference
+assignment, so long-running workers pick up new rules without a restart and
+a request that holds a pack keeps a consistent set. An edit that fails to
+load is reported and the previous pack keeps serving.
+
+A pack's fingerprint is the sha256 of its file; agents fold it into their
+own fingerprint(), so a rule change invalidates exactly the cached stages
+it affects.
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules")
+
+def rules_dir() -> str:
+    return os.getenv("CLINICAMIND_RULES_DIR") or DEFAULT_RULES_DIR
+
+def check_interval() -> float:
+    return float(os.getenv("CLINICAMIND_RULES_CHECK_S", 2.0))
+
+def cache_size() -> int:
+    return max(1, int(os.getenv("CLINICAMIND_RULES_CACHE_SIZE", 16)))
+
+def language_tag(language: Optional[str]) -> str:
+    """
+    Primary language subtag of a language code: "es-MX" -> "es"; "" when unset.
+    """
+    return (language or "").replace("_", "-").split("-")[0].lower()
+
+def fold_accents(text: str) -> str:
+    return "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+
+def _require(data: Dict[str, Any], key: str, kind: type) -> Any:
+    value = data.get(key)
+    if not isinstance(value, kind):
+        raise ValueError(f"rule pack field '{key}' must be a {kind.__name__}")
+    return value
+
+def _phrases(values: List[str], key: str) -> Tuple[str, ...]:
+    if any(not isinstance(value, str) or not value for value in values):
+        raise ValueError(f"rule pack field '{key}' must hold non-empty strings")
+    return tuple(values)
+
+class RulePack:
+    """
+    Common metadata of a compiled pack.
+    """
+    def __init__(self, data: Dict[str, Any], fingerprint: str, path: str):
+        if data.get("version") is None:
+            raise ValueError(f"rule pack {data['name']!r} has no version")
+        self.name = data["name"]
+        self.version = str(data["version"])
+        self.language = data.get("language", "")
+        self.fold_accents = bool(data.get("fold_accents", False))
+        self.fingerprint = fingerprint
+        self.path = path
+
+    def normalize(self, text: str) -> str:
+        """
+        The form of `text` that the pack's phrases are matched against.
+        """
+        text = text.lower()
+        return fold_accents(text) if self.fold_accents else text
+
+class SecurityRules(RulePack):
+    def __init__(self, data: Dict[str, Any], fingerprint: str, path: str):
+        super().__init__(data, fingerprint, path)
+        patterns = []
+        for entry in _require(data, "sensitive_patterns", list):
+            source = entry["pattern"] if isinstance(entry, dict) else entry
+            ignore_case = entry.get("ignore_case", True) if isinstance(entry, dict) else True
+            try:
+                patterns.append((source, re.compile(source, re.IGNORECASE if ignore_case else 0)))
+            except re.error as e:
+                raise ValueError(f"invalid sensitive pattern {source!r}: {e}")
+        # (source, compiled) pairs; issues report the source
+        self.sensitive_patterns = patterns
+        self.concerning_terms = _phrases(_require(data, "concerning_terms", list), "concerning_terms")
+        self._needles = tuple(self.normalize(term) for term in self.concerning_terms)
+        self.pain_score_thresholds = {level: float(value) for level, value in _require(data, "pain_score_thresholds", dict).items()}
+        missing = {"emergency", "urgent", "concerning"} - set(self.pain_score_thresholds)
+        if missing:
+            raise ValueError(f"pain_score_thresholds is missing {sorted(missing)}")
+
+    def find_concerning(self, text: str) -> List[str]:
+        """
+        Concerning terms present in `text`, in pack order.
+        """
+        normalized = self.normalize(text)
+        return [term for term, needle in zip(self.concerning_terms, self._needles) if needle in normalized]
+
+class PainLexicon(RulePack):
+    def __init__(self, data: Dict[str, Any], fingerprint: str, path: str):
+        super().__init__(data, fingerprint, path)
+        # Keyed by normalized phrase, the form matched against normalize(text)
+        self.word2num = {self.normalize(word): value for word, value in _require(data, "word2num", dict).items()}
+        self.severity_words = {self.normalize(phrase): score for phrase, score in _require(data, "severity_words", dict).items()}
+        self.intensifiers = {self.normalize(phrase): weight for phrase, weight in _require(data, "intensifiers", dict).items()}
+        _phrases(list(self.severity_words), "severity_words")
+        _phrases(list(self.intensifiers), "intensifiers")
+        # Hit-vector columns; severity phrases longest first, the order the
+        # severity average has always summed them in
+        self.severity_phrases = tuple(sorted(self.severity_words, key=lambda phrase: -len(phrase)))
+        self.intensifier_phrases = tuple(self.intensifiers)
+        self._severity_scores = tuple(self.severity_words[phrase] for phrase in self.severity_phrases)
+        self._intensifier_weights = tuple(self.intensifiers[phrase] for phrase in self.intensifier_phrases)
+        try:
+            self.numeric_scale_re = re.compile(_require(data, "numeric_scale_pattern", str))
+            self.word_scale_re = re.compile(_require(data, "word_scale_pattern", str))
+        except re.error as e:
+            raise ValueError(f"invalid scale pattern: {e}")
+        self.pain_term = self.normalize(_require(data, "pain_term", str))
+        self.default_score = float(data.get("default_score", 4.5))
+
+    def severity_score(self, severity_hits: Tuple[bool, ...]) -> Optional[float]:
+        hits = [score for score, hit in zip(self._severity_scores, severity_hits) if hit]
+        return sum(hits) / len(hits) if hits else None
+
+    def intensifier_shift(self, intensifier_hits: Tuple[bool, ...]) -> float:
+        return sum(weight for weight, hit in zip(self._intensifier_weights, intensifier_hits) if hit)
+
+PACK_TYPES = {
+    "security": SecurityRules,
+    "pain_lexicon": PainLexicon
+}
+
+_lock = threading.Lock()
+# Serializes reloads; _lock only guards the LRUs
+_reload_lock = threading.Lock()
+# (name, language tag) -> (compiled pack, file signature, monotonic time of the last check), LRU
+_current: "OrderedDict[Tuple[str, str], Tuple[RulePack, Tuple[int, int, int], float]]" = OrderedDict()
+# content fingerprint -> compiled pack, LRU
+_compiled: "OrderedDict[str, RulePack]" = OrderedDict()
+
+def pack_path(name: str, language: Optional[str] = None) -> str:
+    """
+    The pack file for `language`, or the top-level pack when that
+    language has none.
+    """
+    tag = language_tag(language)
+    if tag:
+        path = os.path.join(rules_dir(), tag, f"{name}.json")
+        if os.path.exists(path):
+            return path
+    return os.path.join(rules_dir(), f"{name}.json")
+
+def pack_languages(name: str) -> List[str]:
+    """
+    Language tags with a pack of their own, besides the top-level one.
+    """
+    try:
+        entries = sorted(os.listdir(rules_dir()))
+    except FileNotFoundError:
+        return []
+    return [entry for entry in entries if os.path.isfile(os.path.join(rules_dir(), entry, f"{name}.json"))]
+
+def _signature(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def compile_pack(name: str, path: str) -> RulePack:
+    with open(path, "rb") as f:
+        raw = f.read()
+    fingerprint = hashlib.sha256(raw).hexdigest()
+    with _lock:
+        pack = _compiled.get(fingerprint)
+        if pack is not None and pack.name == name:
+            _compiled.move_to_end(fingerprint)
+            return pack
+    data = json.loads(raw)
+    if data.get("name") != name:
+        raise ValueError(f"{path} holds rule pack {data.get('name')!r}, expected {name!r}")
+    pack = PACK_TYPES[name](data, fingerprint, path)
+    with _lock:
+        _compiled[fingerprint] = pack
+        while len(_compiled) > cache_size():
+            _compiled.popitem(last=False)
+    return pack
+
+def load_rules(name: str, language: Optional[str] = None) -> Any:
+    """
+    The current compiled pack `name` for `language`, reloaded if its file
+    changed.
+    """
+    key = (name, language_tag(language))
+    entry = _current.get(key)
+    now = time.monotonic()
+    if entry is not None and now - entry[2] < check_interval():
+        return entry[0]
+    with _reload_lock:
+        entry = _current.get(key)
+        if entry is not None and now - entry[2] < check_interval():
+            return entry[0]
+        signature = None
+        try:
+            path = pack_path(name, language)
+            signature = _signature(path)
+            if entry is not None and entry[1] == signature and entry[0].path == path:
+                pack = entry[0]
+            else:
+                pack = compile_pack(name, path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if entry is None:
+                raise
+            print(f"Warning: keeping rule pack {name} {entry[0].language} {entry[0].version}; reload failed: {e}", file=sys.stderr)
+            # Remember the bad file so it is reported once, not on every check
+            pack, signature = entry[0], signature or entry[1]
+        with _lock:
+            _current[key] = (pack, signature, now)
+            _current.move_to_end(key)
+            while len(_current) > cache_size():
+                _current.popitem(last=False)
+        return pack
+
+def pack_fingerprint(name: str) -> str:
+    """
+    Combined fingerprint of pack `name` in every language; what an agent
+    serving requests in any language depends on.
+    """
+    fingerprints = [load_rules(name).fingerprint] + [f"{tag}:{load_rules(name, tag).fingerprint}" for tag in pack_languages(name)]
+    return hashlib.sha256(":".join(fingerprints).encode()).hexdigest()
+
+def rules_signature() -> Tuple[str, ...]:
+    """
+    Fingerprints of every current pack; changes whenever any pack is swapped.
+    """
+    return tuple(pack_fingerprint(name) for name in PACK_TYPES)
+
+def refresh_rules():
+    """
+    Re-check every pack loaded so far, e.g. from an idle loop, so the next
+    request does not pay for a reload.
+    """
+    for name, tag in list(_current):
+        load_rules(name, tag)
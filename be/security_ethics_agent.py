@@ -2,87 +2,104 @@
 import json
 import sys
 import argparse
-import re
 import hashlib
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
 from datetime import datetime
+from instrumentation import Metrics, profiling
+from content_cache import make_key
+from rule_packs import SecurityRules, load_rules, pack_fingerprint
+from agent_results import (
+    AgentError, AuditEntry, EthicsValidation, InputValidation, OverallStatus, SecurityResult, ValidationSummary
+)
+from shm_transport import decode_message, encode_message
+
+def new_session_id() -> str:
+    return hashlib.md5(str(datetime.utcnow()).encode()).hexdigest()[:8]
 
 class SecurityEthicsAgent:
+    name = "Security_Ethics_Agent"
+    version = "1.0"
+    
     def __init__(self):
-        self.name = "Security_Ethics_Agent"
-        self.version = "1.0"
-        
-        # Security patterns to detect
-        self.sensitive_patterns = [
-            r'\b\d{3}-\d{2}-\d{4}\b',  # SSN
-            r'\b\d{16}\b',  # Credit card
-            r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',  # Email
-            r'\b\d{10}\b',  # Phone number (simple)
-            r'\b(?:password|pwd|pass)\s*[:=]\s*\S+',  # Passwords
-        ]
-        
-        # Medical ethics validation keywords
-        self.concerning_terms = [
-            'suicide', 'kill myself', 'end it all', 'self-harm', 'overdose',
-            'abuse', 'neglect', 'violence', 'illegal', 'drug dealing'
-        ]
-        
-        # Ethical guidelines for pain assessment
-        self.pain_score_thresholds = {
-            'emergency': 9.0,  # Requires immediate attention
-            'urgent': 7.0,     # Requires timely follow-up
-            'concerning': 5.0   # Monitor closely
-        }
+        self.metrics = Metrics()
     
-    def validate_input_security(self, text: str) -> Dict[str, Any]:
+    @staticmethod
+    def rules(language: Optional[str] = None) -> SecurityRules:
+        """
+        Current security rule pack for a language code (rules/security.json,
+        or rules/<lang>/security.json): sensitive-data patterns, concerning
+        terms and pain score thresholds.
+        """
+        return load_rules("security", language)
+    
+    @classmethod
+    def fingerprint(cls) -> str:
+        """
+        Identity of the agent version and its rule packs in every language;
+        the orchestrator keys its stage cache on it.
+        """
+        return make_key(cls.name, cls.version, pack_fingerprint("security"))
+    
+    def validate_input_security(self, text: str, rules: Optional[SecurityRules] = None) -> InputValidation:
         """
         Validate input text for security concerns.
         """
+        rules = rules or self.rules()
         issues = []
         redacted_text = text
         
         # Check for sensitive data patterns
-        for pattern in self.sensitive_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
+        for pattern, regex in rules.sensitive_patterns:
+            matched = False
+            for match in regex.finditer(text):
+                matched = True
                 issues.append({
                     'type': 'sensitive_data',
                     'pattern': pattern,
                     'position': [match.start(), match.end()],
                     'severity': 'high'
                 })
+            if matched:
                 # Redact sensitive data
-                redacted_text = re.sub(pattern, '[REDACTED]', redacted_text, flags=re.IGNORECASE)
+                redacted_text = regex.sub('[REDACTED]', redacted_text)
         
         # Check for concerning terms that might need escalation
-        concerning_found = []
-        for term in self.concerning_terms:
-            if term.lower() in text.lower():
-                concerning_found.append(term)
-                issues.append({
-                    'type': 'concerning_content',
-                    'term': term,
-                    'severity': 'medium',
-                    'action_required': 'review'
-                })
+        concerning_found = rules.find_concerning(text)
+        for term in concerning_found:
+            issues.append({
+                'type': 'concerning_content',
+                'term': term,
+                'severity': 'medium',
+                'action_required': 'review'
+            })
         
-        return {
-            'secure': len(issues) == 0,
-            'issues': issues,
-            'redacted_text': redacted_text,
-            'concerning_terms': concerning_found,
-            'requires_escalation': len(concerning_found) > 0
-        }
+        return InputValidation(
+            secure=len(issues) == 0,
+            issues=issues,
+            redacted_text=redacted_text,
+            concerning_terms=concerning_found,
+            requires_escalation=len(concerning_found) > 0
+        )
+    
+    def blocks_processing(self, input_validation: InputValidation) -> bool:
+        """
+        Whether a screened transcript must not be processed any further.
+        Sensitive data blocks; concerning terms only escalate, so those
+        encounters are still assessed.
+        """
+        return any(issue['severity'] == 'high' for issue in input_validation.issues)
     
-    def validate_pain_assessment_ethics(self, pain_score: float, severity: str, transcript: str) -> Dict[str, Any]:
+    def validate_pain_assessment_ethics(self, pain_score: float, severity: str, transcript: str, rules: Optional[SecurityRules] = None) -> EthicsValidation:
         """
         Validate pain assessment results from ethical perspective.
         """
+        rules = rules or self.rules()
+        thresholds = rules.pain_score_thresholds
         recommendations = []
         ethical_flags = []
         
         # Check pain score thresholds
-        if pain_score >= self.pain_score_thresholds['emergency']:
+        if pain_score >= thresholds['emergency']:
             recommendations.append({
                 'priority': 'immediate',
                 'action': 'emergency_protocol',
@@ -90,7 +107,7 @@ class SecurityEthicsAgent:
             })
             ethical_flags.append('emergency_pain_level')
         
-        elif pain_score >= self.pain_score_thresholds['urgent']:
+        elif pain_score >= thresholds['urgent']:
             recommendations.append({
                 'priority': 'urgent',
                 'action': 'urgent_follow_up',
@@ -98,7 +115,7 @@ class SecurityEthicsAgent:
             })
             ethical_flags.append('urgent_pain_level')
         
-        elif pain_score >= self.pain_score_thresholds['concerning']:
+        elif pain_score >= thresholds['concerning']:
             recommendations.append({
                 'priority': 'routine',
                 'action': 'schedule_follow_up',
@@ -106,44 +123,50 @@ class SecurityEthicsAgent:
             })
         
         # Check for concerning language in transcript
-        concerning_found = []
-        for term in self.concerning_terms:
-            if term.lower() in transcript.lower():
-                concerning_found.append(term)
-                recommendations.append({
-                    'priority': 'immediate',
-                    'action': 'human_review_required',
-                    'reason': f'Concerning language detected: {term}'
-                })
-                ethical_flags.append('concerning_language')
+        concerning_found = rules.find_concerning(transcript)
+        for term in concerning_found:
+            recommendations.append({
+                'priority': 'immediate',
+                'action': 'human_review_required',
+                'reason': f'Concerning language detected: {term}'
+            })
+            ethical_flags.append('concerning_language')
         
-        return {
-            'ethically_compliant': len(ethical_flags) == 0,
-            'flags': ethical_flags,
-            'recommendations': recommendations,
-            'requires_human_review': any(flag in ['emergency_pain_level', 'concerning_language'] for flag in ethical_flags)
-        }
+        return EthicsValidation(
+            ethically_compliant=len(ethical_flags) == 0,
+            flags=ethical_flags,
+            recommendations=recommendations,
+            requires_human_review=any(flag in ['emergency_pain_level', 'concerning_language'] for flag in ethical_flags)
+        )
     
-    def generate_audit_log(self, session_id: str, validation_results: Dict[str, Any]) -> Dict[str, Any]:
+    def summarize_validation(self, input_validation: Optional[InputValidation], ethics_validation: Optional[EthicsValidation]) -> ValidationSummary:
+        """
+        Combine whichever validations ran; a validation that did not run passes.
+        """
+        summary = ValidationSummary()
+        if input_validation is not None:
+            summary.input_secure = input_validation.secure
+            summary.requires_escalation = input_validation.requires_escalation
+        if ethics_validation is not None:
+            summary.ethically_compliant = ethics_validation.ethically_compliant
+            summary.requires_human_review = ethics_validation.requires_human_review
+        return summary
+    
+    def generate_audit_log(self, session_id: str, input_validation: Optional[InputValidation], ethics_validation: Optional[EthicsValidation]) -> AuditEntry:
         """
         Generate audit log entry for compliance tracking.
         """
-        return {
-            'session_id': session_id,
-            'timestamp': datetime.utcnow().isoformat(),
-            'agent': self.name,
-            'validation_summary': {
-                'input_secure': validation_results.get('input_validation', {}).get('secure', True),
-                'ethically_compliant': validation_results.get('ethics_validation', {}).get('ethically_compliant', True),
-                'requires_escalation': validation_results.get('input_validation', {}).get('requires_escalation', False),
-                'requires_human_review': validation_results.get('ethics_validation', {}).get('requires_human_review', False)
-            },
-            'recommendations': validation_results.get('ethics_validation', {}).get('recommendations', []),
-            'security_issues_count': len(validation_results.get('input_validation', {}).get('issues', [])),
-            'ethical_flags_count': len(validation_results.get('ethics_validation', {}).get('flags', []))
-        }
+        return AuditEntry(
+            session_id=session_id,
+            timestamp=datetime.utcnow().isoformat(),
+            agent=self.name,
+            validation_summary=self.summarize_validation(input_validation, ethics_validation),
+            recommendations=ethics_validation.recommendations if ethics_validation else [],
+            security_issues_count=len(input_validation.issues) if input_validation else 0,
+            ethical_flags_count=len(ethics_validation.flags) if ethics_validation else 0
+        )
     
-    def process(self, request: Dict[str, Any]) -> Dict[str, Any]:
+    def process(self, request: Dict[str, Any]) -> SecurityResult:
         """
         Process security and ethics validation request.
         Expected input: {
@@ -152,30 +175,26 @@ class SecurityEthicsAgent:
             'pain_score': float,  # for assessment_validation
             'severity': 'severity level',  # for assessment_validation
             'transcript': 'original transcript',  # for assessment_validation
-            'session_id': 'unique_session_id'  # optional
+            'session_id': 'unique_session_id',  # optional
+            'language': 'en-US'  # optional, selects the rule pack
         }
         """
         try:
             mode = request.get('mode', 'full_pipeline')
-            session_id = request.get('session_id', hashlib.md5(str(datetime.utcnow()).encode()).hexdigest()[:8])
+            session_id = request.get('session_id', new_session_id())
             
-            results = {
-                'success': True,
-                'agent': self.name,
-                'mode': mode,
-                'session_id': session_id
-            }
+            results = SecurityResult(agent=self.name, mode=mode, session_id=session_id)
+            # One pack for the whole request, even if it is swapped meanwhile
+            rules = self.rules(request.get('language'))
             
             if mode in ['input_validation', 'full_pipeline']:
                 text = request.get('text', '')
                 if text:
-                    results['input_validation'] = self.validate_input_security(text)
+                    with self.metrics.span("regex_scan"):
+                        results.input_validation = self.validate_input_security(text, rules)
+                    self.metrics.incr("scanned_chars", len(text))
                 else:
-                    return {
-                        'success': False,
-                        'error': 'Missing text for input validation',
-                        'agent': self.name
-                    }
+                    return AgentError(error='Missing text for input validation', agent=self.name)
             
             if mode in ['assessment_validation', 'full_pipeline']:
                 pain_score = request.get('pain_score')
@@ -183,40 +202,40 @@ class SecurityEthicsAgent:
                 transcript = request.get('transcript', '')
                 
                 if pain_score is not None:
-                    results['ethics_validation'] = self.validate_pain_assessment_ethics(
-                        pain_score, severity, transcript
-                    )
+                    with self.metrics.span("ethics_check"):
+                        results.ethics_validation = self.validate_pain_assessment_ethics(
+                            pain_score, severity, transcript, rules
+                        )
                 else:
-                    return {
-                        'success': False,
-                        'error': 'Missing pain_score for assessment validation',
-                        'agent': self.name
-                    }
+                    return AgentError(error='Missing pain_score for assessment validation', agent=self.name)
             
             # Generate audit log
-            results['audit_log'] = self.generate_audit_log(session_id, results)
+            results.audit_log = self.generate_audit_log(session_id, results.input_validation, results.ethics_validation)
             
             # Determine overall status
-            input_secure = results.get('input_validation', {}).get('secure', True)
-            ethically_compliant = results.get('ethics_validation', {}).get('ethically_compliant', True)
+            summary = results.audit_log.validation_summary
+            results.overall_status = OverallStatus(
+                approved=summary.input_secure and summary.ethically_compliant,
+                requires_review=summary.requires_escalation or summary.requires_human_review,
+                blocking_issues=not summary.input_secure
+            )
             
-            results['overall_status'] = {
-                'approved': input_secure and ethically_compliant,
-                'requires_review': (
-                    results.get('input_validation', {}).get('requires_escalation', False) or
-                    results.get('ethics_validation', {}).get('requires_human_review', False)
-                ),
-                'blocking_issues': not input_secure
-            }
+            if request.get('collect_metrics'):
+                results.metrics = self.metrics.drain()
             
             return results
             
         except Exception as e:
-            return {
-                'success': False,
-                'error': str(e),
-                'agent': self.name
-            }
+            return AgentError(error=str(e), agent=self.name)
+
+def reissue_audit_log(results: SecurityResult, request: Dict[str, Any]):
+    """
+    Give a validation result served from a cache the request's session id
+    (or a new one) and a fresh audit entry: the cached verdicts stand, but
+    every run must leave its own audit record.
+    """
+    results.session_id = request.get('session_id', new_session_id())
+    results.audit_log = SecurityEthicsAgent().generate_audit_log(results.session_id, results.input_validation, results.ethics_validation)
 
 def main():
     parser = argparse.ArgumentParser(description="Security & Ethics Agent - Validates input and assessment for safety and compliance")
@@ -227,6 +246,7 @@ def main():
     parser.add_argument("--pain-score", type=float, help="Pain score to validate (assessment mode)")
     parser.add_argument("--severity", help="Pain severity level (assessment mode)")
     parser.add_argument("--transcript", help="Original transcript (assessment mode)")
+    parser.add_argument("--language", help="Language code; selects the rule pack")
     args = parser.parse_args()
     
     agent = SecurityEthicsAgent()
@@ -243,13 +263,16 @@ def main():
             'text': args.text,
             'pain_score': args.pain_score,
             'severity': args.severity,
-            'transcript': args.transcript
+            'transcript': args.transcript,
+            'language': args.language
         }
     else:
-        request = json.load(sys.stdin)
+        request = decode_message(sys.stdin.read())
     
-    result = agent.process(request)
-    print(json.dumps(result, indent=2))
+    with profiling("security_ethics_agent"):
+        result = agent.process(request)
+    output, _ = encode_message(result.to_dict(), request.get("shm_threshold"), indent=2)
+    print(output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
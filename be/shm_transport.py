@@ -0,0 +1,108 @@
+"""
+Shared-memory transport for large agent messages.
+
+Agent requests and responses are JSON. Above CLINICAMIND_SHM_THRESHOLD
+bytes (default 256 KiB, 0 disables) the sender writes the encoded message
+to a file in /dev/shm and sends only a small handle over the pipe or
+socket:
+
+    {"$shm": "/dev/shm/clinicamind-<pid>-<id>", "size": <bytes>}
+
+The receiver maps the segment and parses straight out of the mapping, so
+the payload is never pushed through a pipe or copied into an intermediate
+buffer, and then unlinks it: whoever reads a segment owns its removal.
+Senders call discard() on their own segments when the receiver may never
+have read them (timeouts, crashes). A sender that may resend a message
+(the agent pool retrying after a worker crash) keeps ownership instead:
+its receiver reads with unlink=False and the sender discards the segment
+once the exchange is over.
+"""
+import os
+import json
+import mmap
+import uuid
+import tempfile
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_THRESHOLD_BYTES = 256 * 1024
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+def shm_threshold() -> Optional[int]:
+    """
+    Size in bytes from which messages go through shared memory, or None if disabled.
+    """
+    threshold = int(os.getenv("CLINICAMIND_SHM_THRESHOLD", DEFAULT_THRESHOLD_BYTES))
+    return threshold if threshold > 0 else None
+
+def is_handle(message: Any) -> bool:
+    return isinstance(message, dict) and "$shm" in message
+
+def share(data: bytes) -> Dict[str, Any]:
+    """
+    Write data to a new shared-memory segment and return its handle.
+    """
+    path = os.path.join(SHM_DIR, f"clinicamind-{os.getpid()}-{uuid.uuid4().hex}")
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    return {"$shm": path, "size": len(data)}
+
+def discard(handle: Optional[Dict[str, Any]]):
+    if handle:
+        try:
+            os.unlink(handle["$shm"])
+        except FileNotFoundError:
+            pass
+
+def load_shared(handle: Dict[str, Any], unlink: bool = True) -> Any:
+    """
+    Parse the JSON message in a segment directly from its mapping, then
+    unlink the segment unless the sender keeps it (`unlink=False`).
+    """
+    path = handle["$shm"]
+    if not os.path.basename(path).startswith("clinicamind-") or os.path.dirname(path) != SHM_DIR:
+        raise ValueError(f"Refusing to read shared-memory handle outside {SHM_DIR}: {path}")
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        mapping = mmap.mmap(fd, handle["size"], prot=mmap.PROT_READ)
+    finally:
+        os.close(fd)
+        if unlink:
+            os.unlink(path)
+    try:
+        view = memoryview(mapping)
+        try:
+            return _loads_buffer(view)
+        finally:
+            view.release()
+    finally:
+        mapping.close()
+
+def _loads_buffer(view: memoryview) -> Any:
+    try:
+        import orjson
+        return orjson.loads(view)
+    except ImportError:
+        return json.loads(str(view, "utf-8"))
+
+def encode_message(message: Any, threshold: Optional[int] = None, **dumps_kwargs) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Encode a message for a pipe. Returns (text to send, segment handle or
+    None); the text is the handle itself when the message was shared.
+    """
+    text = json.dumps(message, **dumps_kwargs)
+    if threshold is None or len(text) < threshold:
+        return text, None
+    handle = share(text.encode())
+    return json.dumps(handle), handle
+
+def decode_message(data: Any, unlink: bool = True) -> Any:
+    """
+    Parse a message read from a pipe, following a shared-memory handle.
+    """
+    message = json.loads(data)
+    return load_shared(message, unlink) if is_handle(message) else message
@@ -0,0 +1,46 @@
+"""
+Offline stand-ins for the OpenAI speech APIs, used by benchmarks and tests.
+
+Enabled in the agents with CLINICAMIND_SPEECH_BACKEND=fake (inherited by agent
+subprocesses). CLINICAMIND_FAKE_LATENCY_MS adds a fixed delay per call to
+approximate network time.
+"""
+import os
+import time
+import wave
+
+FAKE_TRANSCRIPT = "My arm hurts about a 6 out of 10. It's been bothering me for days."
+
+def fake_backend_enabled() -> bool:
+    return os.getenv("CLINICAMIND_SPEECH_BACKEND", "").lower() == "fake"
+
+def _simulated_latency():
+    latency_ms = float(os.getenv("CLINICAMIND_FAKE_LATENCY_MS", "0"))
+    if latency_ms > 0:
+        time.sleep(latency_ms / 1000.0)
+
+def fake_transcribe(audio_path: str, language: str = "en") -> str:
+    """
+    Return the contents of a sidecar "<audio_path>.txt" file, or a fixed
+    transcript when there is none. The audio file itself must exist.
+    """
+    if not os.path.exists(audio_path):
+        raise RuntimeError(f"Fake transcription failed: {audio_path} not found")
+    _simulated_latency()
+    sidecar = f"{audio_path}.txt"
+    if os.path.exists(sidecar):
+        with open(sidecar, "r") as f:
+            return f.read().strip()
+    return FAKE_TRANSCRIPT
+
+def fake_tts(text: str, out_wav: str, voice: str = "alloy", sample_rate: int = 24000):
+    """
+    Write silent 16-bit mono WAV audio, roughly 60 ms per word of input.
+    """
+    _simulated_latency()
+    frames = int(sample_rate * 0.06 * max(1, len(text.split())))
+    with wave.open(out_wav, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\x00\x00" * frames)
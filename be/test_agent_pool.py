@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Tests for AgentWorkerPool: a worker killed mid-request is replaced and the
+request retried once (also when the request travels through shared memory),
+workers are recycled by request count and RSS, idle workers that fail a
+ping are replaced, and cancelled requests are never retried.
+
+Workers run the ASR agent against the fake speech backend, so no API key
+is needed; CLINICAMIND_FAKE_LATENCY_MS keeps a request in flight long
+enough to kill its worker.
+"""
+import os
+import json
+import time
+import signal
+import shutil
+import tempfile
+import threading
+from agent_pool import AgentWorkerPool, WorkerCrashed
+from pain_orchestrator import Cancellation
+from shm_transport import decode_message, discard, encode_message
+
+TRANSCRIPT = "My knee hurts about a 4 out of 10."
+
+class PoolTest:
+    """
+    A pool whose workers start with the fake speech backend and the given
+    latency, plus an audio file with a known transcript.
+    """
+    def __init__(self, latency_ms: int = 0, **pool_kwargs):
+        self.saved_env = dict(os.environ)
+        os.environ.update(CLINICAMIND_SPEECH_BACKEND="fake", CLINICAMIND_FAKE_LATENCY_MS=str(latency_ms))
+        self.work_dir = tempfile.mkdtemp(prefix="agent_pool_test_")
+        self.audio_path = os.path.join(self.work_dir, "visit.wav")
+        with open(self.audio_path, "wb") as f:
+            f.write(b"RIFF fake audio")
+        with open(f"{self.audio_path}.txt", "w") as f:
+            f.write(TRANSCRIPT)
+        self.pool = AgentWorkerPool(**pool_kwargs)
+
+    def message(self) -> dict:
+        return {"agent": "asr_agent.py", "request": {"audio_path": self.audio_path, "language": "en-US", "speech_cache": False}}
+
+    def call(self, **kwargs) -> dict:
+        return json.loads(self.pool.call(json.dumps(self.message()).encode(), timeout=60, **kwargs))
+
+    def close(self):
+        self.pool.close()
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def kill_busy_worker(pool: AgentWorkerPool, after_s: float) -> threading.Thread:
+    """
+    SIGKILL the worker serving the pending request once it is in flight.
+    """
+    def killer():
+        time.sleep(after_s)
+        with pool._cond:
+            pids = [worker.pid for worker in pool._busy]
+        assert len(pids) == 1, pids
+        os.kill(pids[0], signal.SIGKILL)
+
+    thread = threading.Thread(target=killer)
+    thread.start()
+    return thread
+
+def warm(test: PoolTest) -> int:
+    """
+    Serve one request so a worker is started and idle; returns its pid.
+    """
+    assert test.call()["transcript"] == TRANSCRIPT
+    return test.pool.stats()["workers"][0]["pid"]
+
+def test_crashed_worker_is_retried_once():
+    with PoolTest(latency_ms=1500, size=1) as test:
+        first_pid = warm(test)
+        killer = kill_busy_worker(test.pool, after_s=0.5)
+        response = test.call()
+        killer.join()
+        assert response["success"] and response["transcript"] == TRANSCRIPT
+        counters = test.pool.counters
+        assert counters["crashed"] == 1 and counters["retried"] == 1 and counters["started"] == 2, counters
+        workers = test.pool.stats()["workers"]
+        assert len(workers) == 1 and workers[0]["pid"] != first_pid
+
+        # A second crash on the retry is raised rather than retried again
+        stop = threading.Event()
+
+        def keep_killing():
+            while not stop.is_set():
+                with test.pool._cond:
+                    pids = [worker.pid for worker in test.pool._busy]
+                for pid in pids:
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                time.sleep(0.05)
+
+        killer = threading.Thread(target=keep_killing)
+        killer.start()
+        try:
+            test.call()
+        except WorkerCrashed:
+            pass
+        else:
+            raise AssertionError("a request crashing twice was not raised")
+        finally:
+            stop.set()
+            killer.join()
+        assert test.pool.counters["crashed"] == 3 and test.pool.counters["retried"] == 2, test.pool.counters
+
+def test_retry_rereads_shared_request():
+    with PoolTest(latency_ms=1500, size=1) as test:
+        warm(test)
+        # Every request above 1 byte goes through a shared-memory segment
+        payload, shared = encode_message(test.message(), 1)
+        assert shared is not None
+        try:
+            killer = kill_busy_worker(test.pool, after_s=0.5)
+            response = decode_message(test.pool.call(payload.encode(), timeout=60))
+            killer.join()
+            assert response["transcript"] == TRANSCRIPT
+            assert test.pool.counters["retried"] == 1
+            # The workers read the segment without unlinking it; the sender still owns it
+            assert os.path.exists(shared["$shm"])
+        finally:
+            discard(shared)
+        assert not os.path.exists(shared["$shm"])
+
+def test_recycles_after_max_requests():
+    with PoolTest(size=1, max_requests_per_worker=1) as test:
+        for _ in range(3):
+            assert test.call()["transcript"] == TRANSCRIPT
+        counters = test.pool.counters
+        assert counters["started"] == 3 and counters["recycled"] == 3, counters
+        # Retired workers are gone, not parked
+        assert test.pool.stats()["workers"] == []
+
+def test_recycles_on_rss():
+    with PoolTest(size=1, max_rss=1) as test:
+        test.call()
+        test.call()
+        assert test.pool.counters["recycled"] == 2 and test.pool.counters["started"] == 2, test.pool.counters
+
+def test_unhealthy_idle_worker_is_replaced():
+    with PoolTest(size=1, ping_after_s=0) as test:
+        first_pid = warm(test)
+        # A live idle worker answers its ping and is reused
+        assert test.pool.check_health() == {"checked": 1, "healthy": 1}
+        assert warm(test) == first_pid and test.pool.counters["started"] == 1
+
+        os.kill(first_pid, signal.SIGKILL)
+        time.sleep(0.1)
+        # The dead worker fails the ping before dispatch; the request runs on a new one
+        assert test.call()["transcript"] == TRANSCRIPT
+        counters = test.pool.counters
+        assert counters["unhealthy"] == 1 and counters["started"] == 2 and counters["crashed"] == 0, counters
+        second_pid = test.pool.stats()["workers"][0]["pid"]
+        assert second_pid != first_pid
+
+        os.kill(second_pid, signal.SIGKILL)
+        time.sleep(0.1)
+        assert test.pool.check_health() == {"checked": 1, "healthy": 0}
+        assert test.pool.stats()["workers"] == [] and test.pool.counters["unhealthy"] == 2
+
+def test_cancelled_before_dispatch():
+    with PoolTest(size=1) as test:
+        first_pid = warm(test)
+        cancellation = Cancellation()
+        cancellation.cancel("visit abandoned")
+        try:
+            test.call(cancellation=cancellation)
+        except WorkerCrashed as e:
+            assert "cancelled before dispatch" in str(e)
+        else:
+            raise AssertionError("a cancelled run was dispatched")
+        # The worker was never handed the request and goes back to the pool
+        counters = test.pool.counters
+        assert counters["crashed"] == 0 and counters["retried"] == 0, counters
+        assert [worker["pid"] for worker in test.pool.stats()["workers"]] == [first_pid]
+
+def test_cancelled_in_flight_is_not_retried():
+    with PoolTest(latency_ms=1500, size=1) as test:
+        first_pid = warm(test)
+        cancellation = Cancellation()
+        timer = threading.Timer(0.5, cancellation.cancel, args=("visit abandoned",))
+        timer.start()
+        started = time.monotonic()
+        try:
+            test.call(cancellation=cancellation)
+        except WorkerCrashed:
+            pass
+        else:
+            raise AssertionError("a cancelled request completed")
+        finally:
+            timer.join()
+        assert time.monotonic() - started < 1.4
+        counters = test.pool.counters
+        assert counters["crashed"] == 0 and counters["retried"] == 0 and counters["started"] == 1, counters
+        # The killed worker is dropped; no retry started another
+        assert test.pool.stats()["workers"] == []
+        try:
+            os.kill(first_pid, 0)
+        except ProcessLookupError:
+            pass
+        else:
+            raise AssertionError("the cancelled worker is still running")
+
+def main():
+    tests = [test_crashed_worker_is_retried_once, test_retry_rereads_shared_request, test_recycles_after_max_requests,
+             test_recycles_on_rss, test_unhealthy_idle_worker_is_replaced, test_cancelled_before_dispatch,
+             test_cancelled_in_flight_is_not_retried]
+    for test in tests:
+        print(f"🧪 {test.__name__}")
+        test()
+        print("   ✅ passed")
+
+if __name__ == "__main__":
+    main()
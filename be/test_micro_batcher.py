@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for MicroBatcher: concurrent callers coalesced into one predict()
+led by a waiting caller, the adaptive batching window, and errors reaching
+every caller of a failed batch.
+"""
+import threading
+from micro_batcher import MicroBatcher
+
+def run_concurrently(batcher, rows):
+    """
+    Call batcher.predict for every row from its own thread, all released at
+    once. Returns {row: result or raised exception}.
+    """
+    barrier = threading.Barrier(len(rows))
+    outcomes = {}
+
+    def call(row):
+        barrier.wait()
+        try:
+            outcomes[row] = batcher.predict(row)
+        except Exception as e:
+            outcomes[row] = e
+
+    threads = [threading.Thread(target=call, args=(row,)) for row in rows]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return outcomes
+
+def test_concurrent_rows_share_batches():
+    batches = []
+
+    def predict(rows):
+        batches.append(list(rows))
+        return [row * 10 for row in rows]
+
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=200.0)
+    outcomes = run_concurrently(batcher, list(range(8)))
+    # Every caller gets the output of its own row
+    assert outcomes == {row: row * 10 for row in range(8)}, outcomes
+    assert sorted(row for batch in batches for row in batch) == list(range(8))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert len(batches) < 8, batches
+
+def test_window_adapts():
+    batcher = MicroBatcher(lambda rows: list(rows), max_batch_size=8, max_wait_ms=4.0)
+    # A lone caller halves the window each time, then stops waiting at all
+    for row in range(8):
+        assert batcher.predict(row) == row
+    assert batcher._window == 0.0
+    # Contention brings the full window back
+    batcher._window = 0.05
+    run_concurrently(batcher, list(range(8)))
+    assert batcher._window == batcher.max_wait
+
+def test_row_count_mismatch_fails_every_caller():
+    calls = []
+
+    def short_predict(rows):
+        calls.append(len(rows))
+        return list(rows)[:-1]
+
+    batcher = MicroBatcher(short_predict, max_batch_size=4, max_wait_ms=200.0)
+    outcomes = run_concurrently(batcher, list(range(4)))
+    assert sum(calls) == 4, calls
+    for row, outcome in outcomes.items():
+        assert isinstance(outcome, ValueError), (row, outcome)
+        assert "outputs for" in str(outcome)
+
+def main():
+    for test in (test_concurrent_rows_share_batches, test_window_adapts, test_row_count_mismatch_fails_every_caller):
+        print(f"🧪 {test.__name__}")
+        test()
+        print("   ✅ passed")
+
+if __name__ == "__main__":
+    main()
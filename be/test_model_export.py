@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for the NumPy model export: predictions served from the `.npz` (as
+the pain agent loads it through model_file) match the sklearn model they
+were exported from, and encoders the format cannot represent are refused.
+Skipped when scikit-learn is not installed.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+def require_sklearn():
+    if importlib.util.find_spec("sklearn") is None or importlib.util.find_spec("joblib") is None:
+        raise unittest.SkipTest("scikit-learn is not installed")
+
+def training_data(n_rows: int = 300):
+    import numpy as np
+    rng = np.random.default_rng(7)
+    # Transcript length, "pain" mentions and a small categorical column
+    X = np.column_stack([
+        rng.integers(0, 2000, n_rows),
+        rng.integers(0, 12, n_rows),
+        rng.integers(0, 3, n_rows)
+    ]).astype(np.float64)
+    score = 0.002 * X[:, 0] + 0.5 * X[:, 1] + X[:, 2] + rng.normal(0, 0.5, n_rows)
+    return X, score, np.digitize(score, [3.0, 6.0])
+
+def models():
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestRegressor
+    from sklearn.linear_model import LogisticRegression, Ridge
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    def columns():
+        return ColumnTransformer([
+            ("scaled", StandardScaler(), [0]),
+            ("kind", OneHotEncoder(handle_unknown="ignore"), [2]),
+            ("rest", "passthrough", [1])
+        ])
+
+    return [
+        ("logistic", True, Pipeline([("columns", columns()), ("model", LogisticRegression(max_iter=1000))])),
+        ("ridge", False, Pipeline([("scale", StandardScaler()), ("model", Ridge())])),
+        ("boosting", True, GradientBoostingClassifier(n_estimators=20, max_depth=3, random_state=0)),
+        ("forest", False, RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0))
+    ]
+
+def test_exported_predictions_match_sklearn():
+    require_sklearn()
+    import joblib
+    import numpy as np
+    from model_export import ExportedModel, export_model, exported_path
+    from pain_assessment_agent import load_model, model_file
+
+    X, score, label = training_data()
+    work_dir = tempfile.mkdtemp(prefix="model_export_test_")
+    try:
+        for name, classifier, model in models():
+            model.fit(X, label if classifier else score)
+            joblib_path = os.path.join(work_dir, f"{name}.joblib")
+            joblib.dump(model, joblib_path)
+            export_model(model, exported_path(joblib_path))
+
+            # The agent serves the export once it sits next to the joblib file
+            assert model_file(joblib_path) == exported_path(joblib_path)
+            exported = load_model(joblib_path)
+            assert isinstance(exported, ExportedModel)
+
+            expected = model.predict(X)
+            if classifier:
+                assert (exported.predict(X) == expected).all(), name
+                assert np.allclose(exported.predict_proba(X), model.predict_proba(X), atol=1e-9), name
+            else:
+                assert np.allclose(exported.predict(X), expected, rtol=1e-9, atol=1e-9), name
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def test_refuses_infrequent_categories():
+    require_sklearn()
+    from sklearn.compose import ColumnTransformer
+    from sklearn.linear_model import Ridge
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+    from model_export import export_model
+
+    X, score, _ = training_data()
+    # Category 2 is rare: min_frequency folds it into an "infrequent" column
+    X[X[:, 2] == 2, 2] = 1
+    X[:3, 2] = 2
+    model = Pipeline([
+        ("columns", ColumnTransformer([
+            ("kind", OneHotEncoder(handle_unknown="infrequent_if_exist", min_frequency=10), [2]),
+            ("rest", "passthrough", [0, 1])
+        ])),
+        ("model", Ridge())
+    ]).fit(X, score)
+    # Refused for the grouping itself, not only for handle_unknown
+    model.named_steps["columns"].transformers_[0][1].handle_unknown = "ignore"
+
+    work_dir = tempfile.mkdtemp(prefix="model_export_test_")
+    try:
+        path = os.path.join(work_dir, "infrequent.npz")
+        try:
+            export_model(model, path)
+        except ValueError as e:
+            assert "infrequent" in str(e)
+        else:
+            raise AssertionError("exported an encoder with infrequent categories")
+        assert not os.path.exists(path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    for test in (test_exported_predictions_match_sklearn, test_refuses_infrequent_categories):
+        print(f"🧪 {test.__name__}")
+        try:
+            test()
+        except unittest.SkipTest as e:
+            print(f"   ⏭️  skipped: {e}")
+            continue
+        print("   ✅ passed")
+
+if __name__ == "__main__":
+    main()
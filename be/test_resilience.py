@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Tests for the speech API resilience layer: the shared circuit breaker,
+jittered retry under a deadline, hedged calls, the adaptive rate limiter,
+and the ASR/TTS fallbacks from the API to the cache and the local engines,
+against fake_speech_server.py.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import importlib.util
+import subprocess
+import unittest
+from resilience import (CircuitBreaker, CircuitOpenError, DeadlineExceeded, RateLimiter, ResiliencePolicy,
+                        call_with_retry, hedged_call)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class TransientError(ConnectionError):
+    pass
+
+def test_breaker_state_is_shared():
+    state_dir = tempfile.mkdtemp(prefix="resilience_test_")
+    try:
+        # Two handles on the same state file, as two agent processes would have
+        breaker = CircuitBreaker("api", failure_threshold=2, reset_timeout=0.2, cache_dir=state_dir)
+        other = CircuitBreaker("api", failure_threshold=2, reset_timeout=0.2, cache_dir=state_dir)
+
+        def failing():
+            raise TransientError("connection reset")
+
+        for _ in range(2):
+            try:
+                breaker.call(failing)
+            except TransientError:
+                pass
+        try:
+            other.call(lambda: "sent")
+        except CircuitOpenError:
+            pass
+        else:
+            raise AssertionError("breaker did not open for the other handle")
+
+        time.sleep(0.25)
+        # Half-open: one trial is let through and its success closes the circuit
+        assert other.call(lambda: "trial") == "trial"
+        assert breaker.allow() and other.allow()
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+def test_retry_with_full_jitter():
+    calls = []
+    delays = []
+
+    def flaky(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise TransientError("503")
+        return "ok"
+
+    policy = ResiliencePolicy(attempt_timeout=5.0, deadline=60.0, attempts=3, base_delay=0.5, max_delay=8.0)
+    assert call_with_retry(flaky, policy, sleep=delays.append) == "ok"
+    assert len(calls) == 3 and all(timeout <= 5.0 for timeout in calls)
+    # Full jitter: the n-th delay is drawn from [0, base_delay * 2**n]
+    assert len(delays) == 2 and 0 <= delays[0] <= 0.5 and 0 <= delays[1] <= 1.0
+
+    def rejected(timeout):
+        calls.append(timeout)
+        raise ValueError("400 bad request")
+
+    calls.clear()
+    try:
+        call_with_retry(rejected, policy, sleep=delays.append)
+    except ValueError:
+        pass
+    assert len(calls) == 1, "a non-transient error must not be retried"
+
+def test_retry_respects_deadline():
+    def slow_failure(timeout):
+        time.sleep(0.06)
+        raise TransientError("timeout")
+
+    policy = ResiliencePolicy(attempt_timeout=1.0, deadline=0.1, attempts=10, base_delay=0.001, max_delay=0.001)
+    started = time.monotonic()
+    try:
+        call_with_retry(slow_failure, policy)
+    except (DeadlineExceeded, TransientError):
+        pass
+    else:
+        raise AssertionError("retries outlived the deadline")
+    assert time.monotonic() - started < 0.5
+
+def test_hedged_call_takes_first_success():
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            # The first copy stalls; the hedge started after 50 ms wins
+            time.sleep(1.0)
+            return "slow"
+        return "fast"
+
+    started = time.monotonic()
+    assert hedged_call(fn, hedge_after=0.05) == "fast"
+    assert time.monotonic() - started < 0.5 and len(calls) == 2
+
+class Throttled(RuntimeError):
+    """
+    A 429 as the OpenAI client raises it: status code plus response headers.
+    """
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("429 Too Many Requests")
+        self.response = type("Response", (), {"headers": {"retry-after": str(retry_after)}})()
+
+def test_rate_limiter_backs_off_on_429():
+    state_dir = tempfile.mkdtemp(prefix="resilience_test_")
+    try:
+        # 10 requests/s with room for a single request of burst
+        limiter = RateLimiter("api", requests_per_min=600, burst_s=0.1, decrease_interval=10.0, cache_dir=state_dir)
+        other = RateLimiter("api", requests_per_min=600, burst_s=0.1, decrease_interval=10.0, cache_dir=state_dir)
+        state_path = os.path.join(state_dir, "rate_limits", "api.json")
+
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+        full_rate_s = time.monotonic() - started
+
+        def throttled(timeout):
+            raise Throttled(retry_after=0.5)
+
+        try:
+            limiter.call(throttled)
+        except Throttled:
+            pass
+        with open(state_path) as f:
+            state = json.load(f)
+        assert state["factor"] == 0.5, state
+        assert 0.45 <= state["blocked_until"] - state["throttled_at"] <= 0.55, state
+
+        # The next call waits out Retry-After; its 429 comes within decrease_interval and is not halved again
+        started = time.monotonic()
+        try:
+            limiter.call(throttled)
+        except Throttled:
+            pass
+        assert time.monotonic() - started >= 0.4
+        with open(state_path) as f:
+            assert json.load(f)["factor"] == 0.5
+
+        # Retry-After holds back every limiter sharing the state, not only the throttled one
+        started = time.monotonic()
+        other.acquire()
+        assert time.monotonic() - started >= 0.4
+        started = time.monotonic()
+        for _ in range(4):
+            other.acquire()
+        throttled_s = time.monotonic() - started
+        # 4 requests at 5/s, against 4 at 10/s before the 429
+        assert throttled_s >= 0.7 and throttled_s > 1.5 * full_rate_s, (throttled_s, full_rate_s)
+
+        assert other.call(lambda timeout: "ok") == "ok"
+        with open(state_path) as f:
+            assert abs(json.load(f)["factor"] - 0.55) < 1e-9
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+class FakeSpeechServer:
+    """
+    fake_speech_server.py on a free local port, failing every request if asked.
+    """
+    def __init__(self, fail_rate: float):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", os.path.join(HERE, "fake_speech_server.py"), "--port", str(self.port),
+             "--fail-rate", str(fail_rate)],
+            stdout=subprocess.PIPE, text=True
+        )
+        # Prints its URL once listening
+        self.process.stdout.readline()
+        self.url = f"http://127.0.0.1:{self.port}/v1"
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+def test_fallbacks_against_fake_server():
+    if importlib.util.find_spec("openai") is None:
+        raise unittest.SkipTest("openai is not installed")
+    import asr_agent
+    import tts_agent
+    from openai_client import reset_openai_client
+
+    work_dir = tempfile.mkdtemp(prefix="resilience_test_")
+    saved_env = dict(os.environ)
+    saved_local = (asr_agent.transcribe_local_whisper, tts_agent.tts_local)
+    try:
+        os.environ.pop("CLINICAMIND_SPEECH_BACKEND", None)
+        os.environ.update(OPENAI_API_KEY="fake", CLINICAMIND_API_RETRIES="1", CLINICAMIND_BREAKER_THRESHOLD="1",
+                          CLINICAMIND_BREAKER_RESET_S="300", CLINICAMIND_API_STATE_DIR=os.path.join(work_dir, "state"))
+        cache_dir = os.path.join(work_dir, "cache")
+        audio_path = os.path.join(work_dir, "visit.wav")
+        with open(audio_path, "wb") as f:
+            f.write(b"RIFF fake audio")
+        out_wav = os.path.join(work_dir, "out.wav")
+
+        # A healthy API fills the caches
+        server = FakeSpeechServer(fail_rate=0.0)
+        try:
+            os.environ["OPENAI_BASE_URL"] = server.url
+            reset_openai_client()
+            assert asr_agent.transcribe_resilient(audio_path, cache_dir=cache_dir)[1] == "openai_whisper"
+            assert tts_agent.tts_resilient("Take ibuprofen with food.", out_wav, cache_dir=cache_dir) == "openai_tts"
+        finally:
+            server.close()
+
+        # A failing API opens the breakers; cached results are served instead
+        server = FakeSpeechServer(fail_rate=1.0)
+        try:
+            os.environ["OPENAI_BASE_URL"] = server.url
+            reset_openai_client()
+            transcript, backend = asr_agent.transcribe_resilient(audio_path, cache_dir=cache_dir)
+            assert backend == "cache" and transcript
+            assert tts_agent.tts_resilient("Take ibuprofen with food.", out_wav, cache_dir=cache_dir) == "cache"
+            assert not CircuitBreaker("openai_whisper", cache_dir=cache_dir).allow()
+            assert not CircuitBreaker("openai_tts", cache_dir=cache_dir).allow()
+            assert not [name for name in os.listdir(work_dir) if name.endswith(".part")]
+
+            # Nothing cached for new input: the local engines are next
+            asr_agent.transcribe_local_whisper = lambda path, language="en": "local transcript"
+
+            def local_tts(text, path):
+                with open(path, "wb") as f:
+                    f.write(b"local audio")
+                return path
+
+            tts_agent.tts_local = local_tts
+            other_audio = os.path.join(work_dir, "other.wav")
+            with open(other_audio, "wb") as f:
+                f.write(b"RIFF other audio")
+            assert asr_agent.transcribe_resilient(other_audio, cache_dir=cache_dir) == ("local transcript", "local_whisper")
+            assert tts_agent.tts_resilient("Rest the arm.", out_wav, cache_dir=cache_dir) == "local_tts"
+        finally:
+            server.close()
+    finally:
+        asr_agent.transcribe_local_whisper, tts_agent.tts_local = saved_local
+        os.environ.clear()
+        os.environ.update(saved_env)
+        reset_openai_client()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    tests = [test_breaker_state_is_shared, test_retry_with_full_jitter, test_retry_respects_deadline,
+             test_hedged_call_takes_first_success, test_rate_limiter_backs_off_on_429, test_fallbacks_against_fake_server]
+    for test in tests:
+        print(f"🧪 {test.__name__}")
+        try:
+            test()
+        except unittest.SkipTest as e:
+            print(f"   ⏭️  skipped: {e}")
+            continue
+        print("   ✅ passed")
+
+if __name__ == "__main__":
+    main()
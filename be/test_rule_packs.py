@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the Spanish rule packs: accent folding of concerning terms and
+pain phrases, per-pattern case sensitivity of the PII patterns, and the
+per-language matcher cache keeping English and Spanish packs apart.
+"""
+import os
+from rule_packs import load_rules
+from security_ethics_agent import SecurityEthicsAgent
+from pain_assessment_agent import estimate_pain_from_text, pain_lexicon
+
+def pii_patterns(text, language):
+    agent = SecurityEthicsAgent()
+    validation = agent.validate_input_security(text, agent.rules(language))
+    return validation, {issue["pattern"] for issue in validation.issues if issue["type"] == "sensitive_data"}
+
+def test_spanish_concerning_terms_fold_accents():
+    rules = SecurityEthicsAgent.rules("es-MX")
+    # ASR output may or may not carry the diacritics
+    for text in ("A veces quiero hacerme daño.", "a veces quiero hacerme dano", "HACERME DAÑO"):
+        assert "hacerme dano" in rules.find_concerning(text), text
+    assert rules.find_concerning("Pensé en el SUICIDIO y en una autolesión") == ["suicidio", "autolesion"]
+    assert rules.find_concerning("Me duele el brazo desde el lunes.") == []
+
+def test_spanish_pii_patterns():
+    dni = r"\b\d{8}-?[A-HJ-NP-TV-Z]\b"
+    assert dni in {source for source, _ in SecurityEthicsAgent.rules("es").sensitive_patterns}
+    validation, found = pii_patterns("Mi DNI es 12345678Z y mi contraseña: secreto123", "es")
+    assert dni in found and not validation.secure
+    assert "12345678Z" not in validation.redacted_text and "secreto123" not in validation.redacted_text
+    # The password keyword matches without its tilde too
+    _, found = pii_patterns("contrasena = secreto123", "es")
+    assert any("contrase" in source for source in found), found
+    # DNI letters are upper case by definition: that pattern does not ignore case
+    _, found = pii_patterns("el código 12345678z del pedido", "es")
+    assert dni not in found, found
+    # Other patterns keep matching case-insensitively
+    _, found = pii_patterns("escriba a PACIENTE@EJEMPLO.ES", "es")
+    assert any("@" in source for source in found), found
+
+def test_spanish_pain_lexicon_folds_accents():
+    lexicon = pain_lexicon("es")
+    accented = estimate_pain_from_text("Tengo un dolor pulsátil, insoportable.", lexicon)[0]
+    plain = estimate_pain_from_text("tengo un dolor pulsatil, insoportable", lexicon)[0]
+    assert accented == plain
+    assert estimate_pain_from_text("El dolor es un ocho de diez.", lexicon)[0] >= 7.5
+
+def test_languages_do_not_share_packs():
+    english = load_rules("security", "en-US")
+    spanish = load_rules("security", "es-ES")
+    assert english is not spanish and english.fingerprint != spanish.fingerprint
+    assert os.path.join("rules", "es") in spanish.path
+    # Regional variants share the language's entry; languages without a pack use English
+    assert load_rules("security", "es-MX") is spanish
+    assert load_rules("security", "fr-FR").fingerprint == english.fingerprint
+    assert spanish.find_concerning("I want to kill myself") == []
+    assert english.find_concerning("quiero suicidarme") == []
+    assert load_rules("pain_lexicon", "es").pain_term == "dolor"
+    assert load_rules("pain_lexicon", "en").pain_term != "dolor"
+
+def test_small_cache_keeps_languages_apart():
+    saved = os.environ.get("CLINICAMIND_RULES_CACHE_SIZE")
+    os.environ["CLINICAMIND_RULES_CACHE_SIZE"] = "1"
+    try:
+        # Every switch evicts the other language's matcher; each reload must compile the right file
+        for language in ("en", "es", "en", "es-MX", "en-GB"):
+            rules = load_rules("security", language)
+            assert (os.path.join("rules", "es") in rules.path) == language.startswith("es"), (language, rules.path)
+            assert bool(rules.find_concerning("suicidio")) == language.startswith("es"), language
+    finally:
+        if saved is None:
+            os.environ.pop("CLINICAMIND_RULES_CACHE_SIZE", None)
+        else:
+            os.environ["CLINICAMIND_RULES_CACHE_SIZE"] = saved
+
+def main():
+    tests = [test_spanish_concerning_terms_fold_accents, test_spanish_pii_patterns, test_spanish_pain_lexicon_folds_accents,
+             test_languages_do_not_share_packs, test_small_cache_keeps_languages_apart]
+    for test in tests:
+        print(f"🧪 {test.__name__}")
+        test()
+        print("   ✅ passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for the lease-based work queue: two local worker processes draining
+one queue on the fake speech backend, recovery of an expired lease, and
+rejection of ids that would escape the output directory.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+from work_queue import QueueWorker, WorkQueue
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+AUDIO = os.path.join(HERE, "first visit.m4a")
+JOBS = 6
+
+def encounter(encounter_id):
+    return {"id": encounter_id, "first_visit": AUDIO, "second_visit": AUDIO}
+
+def fake_env():
+    return dict(os.environ, CLINICAMIND_SPEECH_BACKEND="fake")
+
+def test_two_processes_drain_queue():
+    work_dir = tempfile.mkdtemp(prefix="work_queue_test_")
+    try:
+        db = os.path.join(work_dir, "queue.sqlite")
+        output_dir = os.path.join(work_dir, "out")
+        queue = WorkQueue(db, lease_s=1.0)
+        assert queue.enqueue([encounter(f"encounter_{i}") for i in range(JOBS)]) == JOBS
+        # A worker that leased the first job and died: its lease must expire and the job re-run
+        crashed = queue.lease("crashed-worker")
+        assert crashed["id"] == "encounter_0"
+
+        command = [sys.executable, "work_queue.py", "work", "--db", db, "--output-dir", output_dir,
+                   "--lease-s", "1.0", "--poll-s", "0.2", "--mode", "inprocess",
+                   "--cache-dir", os.path.join(work_dir, "cache")]
+        workers = [subprocess.Popen(command, cwd=HERE, env=fake_env(), stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, text=True) for _ in range(2)]
+        summaries = []
+        for worker in workers:
+            stdout, stderr = worker.communicate(timeout=300)
+            assert worker.returncode == 0, stderr
+            summaries.append(json.loads(stdout))
+
+        stats = queue.stats()
+        assert stats["counts"] == {"pending": 0, "leased": 0, "done": JOBS, "failed": 0}, stats
+        # Fenced completion: every job is completed by exactly one worker
+        done = sum(counter["value"] for summary in summaries for counter in summary["metrics"]["counters"]
+                   if counter["name"] == "jobs_done")
+        assert done == JOBS, summaries
+        owners = {summary["worker"] for summary in summaries}
+        for i in range(JOBS):
+            with open(os.path.join(output_dir, f"encounter_{i}.json")) as f:
+                job = json.load(f)["job"]
+            assert job["worker"] in owners
+        with open(os.path.join(output_dir, "encounter_0.json")) as f:
+            assert json.load(f)["job"]["attempt"] == 2
+        queue.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def test_rejects_escaping_ids():
+    work_dir = tempfile.mkdtemp(prefix="work_queue_test_")
+    try:
+        db = os.path.join(work_dir, "queue.sqlite")
+        output_dir = os.path.join(work_dir, "out", "sub")
+        queue = WorkQueue(db)
+        try:
+            queue.enqueue([encounter("ok"), encounter("../escaped")])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("enqueue accepted an id outside the output directory")
+        assert queue.stats()["counts"]["pending"] == 0
+
+        # An id written to the database directly fails its job instead of running it
+        queue.conn.execute("INSERT INTO jobs (id, seq, payload, updated_at) VALUES (?, 1, ?, 0)",
+                           ("../escaped", json.dumps(encounter("../escaped"))))
+        worker = QueueWorker(queue, output_dir, mode="inprocess", cache_dir=False)
+        worker.run(poll_s=0.1)
+        stats = queue.stats()
+        assert stats["counts"]["failed"] == 1 and stats["failed"][0]["attempts"] == 1, stats
+        assert not os.path.exists(os.path.join(work_dir, "out", "escaped.json"))
+        assert not os.path.exists(os.path.join(work_dir, "out", "escaped.wav"))
+        queue.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    os.environ["CLINICAMIND_SPEECH_BACKEND"] = "fake"
+    for test in (test_rejects_escaping_ids, test_two_processes_drain_queue):
+        print(f"🧪 {test.__name__}")
+        test()
+        print("   ✅ passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Replay recorded agent traces as load, for capacity sizing.
+
+Plays the call_agent() requests captured by agent_trace.py back through a
+PainOrchestrator in any agent mode (inprocess, pool, http, ...) and reports
+throughput, latency histograms and error rates, overall and per agent.
+
+Two drivers:
+
+  --rate R         open loop: request i is due at start + i / R, whether or
+                   not earlier ones finished (up to --max-in-flight run at
+                   once). Latency is measured from the due time, so queueing
+                   behind a saturated backend shows up in the percentiles
+                   instead of silently lowering the offered rate.
+  --concurrency C  closed loop: C callers each send their next request as
+                   soon as the previous one returns.
+
+The run ends after --requests requests (default: one pass over the trace)
+or --duration seconds, whichever comes first; the trace is cycled in order.
+
+Offline by default: the speech agents run on the fakes in speech_fakes.py,
+each ASR request gets a placeholder audio file whose transcript sidecar is
+the recorded transcript (filler words under the default "text" trace
+redaction), and TTS writes into a scratch directory. Audio
+pre-processing, VAD and chunking are turned off for the placeholders.
+--live replays requests unchanged against the real backends (record with
+CLINICAMIND_TRACE_REDACT=none so audio paths survive).
+
+    python pain_orchestrator.py --trace trace.jsonl ...
+    python trace_replay.py --trace trace.jsonl --mode pool --rate 50 --duration 30
+    python trace_replay.py --trace trace.jsonl --mode http --url http://agents:8770 --concurrency 16
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from agent_trace import load_traces
+from instrumentation import Metrics
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+ASR_OPTIONS = ("preprocess", "vad", "chunked")
+
+def prepare_offline(traces: List[Dict[str, Any]], work_dir: str) -> List[Dict[str, Any]]:
+    """
+    Requests rewritten to run on the speech fakes: placeholder audio with
+    the recorded transcript as its sidecar, TTS output in `work_dir`.
+    """
+    requests = []
+    for index, entry in enumerate(traces):
+        request = dict(entry["request"])
+        if entry["agent"] == "asr_agent.py":
+            audio_path = os.path.join(work_dir, f"asr-{index}{os.path.splitext(request.get('audio_path', ''))[1] or '.m4a'}")
+            with open(audio_path, "wb") as f:
+                f.write(b"\x00" * 1024)
+            response = entry.get("response") or {}
+            if response.get("transcript"):
+                with open(f"{audio_path}.txt", "w") as f:
+                    f.write(response["transcript"])
+            request["audio_path"] = audio_path
+            for option in ASR_OPTIONS:
+                request[option] = False
+        elif entry["agent"] == "tts_agent.py":
+            request["output_path"] = os.path.join(work_dir, f"tts-{index}.wav")
+        if "speech_cache" in request:
+            # Measure the backends, not the transcript and audio caches
+            request["speech_cache"] = False
+        requests.append(request)
+    return requests
+
+def is_error(result: Any) -> Optional[str]:
+    """
+    Error kind of an agent result, or None if it succeeded.
+    """
+    if result.get("success"):
+        return None
+    error = str(result.get("error") or "unknown error")
+    if "timed out" in error:
+        return "timeout"
+    if error.startswith("Failed to call agent"):
+        return "transport"
+    if error.startswith("Agent worker crashed"):
+        return "crash"
+    return "agent"
+
+def histogram(latencies_ms: List[float]) -> List[Dict[str, Any]]:
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for latency in latencies_ms:
+        for bucket, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if latency <= bound:
+                counts[bucket] += 1
+                break
+        else:
+            counts[-1] += 1
+    return [{"le_ms": bound, "count": count} for bound, count in zip(HISTOGRAM_BUCKETS_MS + ("+Inf",), counts)]
+
+def summarize(metrics: Metrics, elapsed: float, **labels) -> Dict[str, Any]:
+    """
+    Throughput, latency quantiles, histogram and errors of the requests
+    recorded with `labels` (none: all requests).
+    """
+    latency = next((entry for entry in metrics.summary() if entry["name"] == "request" and entry["labels"] == labels), None)
+    errors = {}
+    for counter in metrics.to_dict()["counters"]:
+        if counter["name"] == "errors" and all(counter["labels"].get(key) == value for key, value in labels.items()):
+            errors[counter["labels"]["kind"]] = errors.get(counter["labels"]["kind"], 0) + counter["value"]
+    count = latency["count"] if latency else 0
+    summary = {
+        "requests": count,
+        "errors": sum(errors.values()),
+        "error_rate": sum(errors.values()) / count if count else 0.0,
+        "errors_by_kind": errors,
+        "throughput_per_s": count / elapsed if elapsed > 0 else 0.0
+    }
+    if latency:
+        summary["latency_ms"] = {key[:-3]: value for key, value in latency.items() if key.endswith("_ms") and key != "total_ms"}
+        summary["latency_ms"]["mean"] = latency["total_ms"] / count
+        summary["histogram"] = histogram([span["duration_ms"] for span in metrics.spans if span["name"] == "request" and span["labels"] == labels])
+    return summary
+
+class Replayer:
+    def __init__(self, orchestrator, traces: List[Dict[str, Any]], requests: List[Dict[str, Any]]):
+        self.orchestrator = orchestrator
+        self.agents = [entry["agent"] for entry in traces]
+        self.requests = requests
+        self.metrics = Metrics()
+        self.late_dispatches = 0
+
+    def _call(self, index: int, due: float):
+        position = index % len(self.requests)
+        agent = self.agents[position]
+        result = self.orchestrator.call_agent(agent, dict(self.requests[position]))
+        latency = time.perf_counter() - due
+        # Once overall, once per agent
+        self.metrics.record_span("request", latency)
+        self.metrics.record_span("request", latency, agent=agent)
+        error = is_error(result)
+        if error:
+            self.metrics.incr("errors", agent=agent, kind=error)
+
+    def open_loop(self, rate: float, total: int, deadline: float, max_in_flight: int) -> float:
+        start = time.perf_counter()
+        late = 0
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            for index in range(total):
+                due = start + index / rate
+                if due >= deadline:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.001:
+                    late += 1
+                executor.submit(self._call, index, due)
+        self.late_dispatches = late
+        return time.perf_counter() - start
+
+    def closed_loop(self, concurrency: int, total: int, deadline: float) -> float:
+        start = time.perf_counter()
+        counter = iter(range(total))
+        counter_lock = threading.Lock()
+
+        def caller():
+            while time.perf_counter() < deadline:
+                with counter_lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                self._call(index, time.perf_counter())
+
+        threads = [threading.Thread(target=caller) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        report = summarize(self.metrics, elapsed)
+        report["duration_s"] = elapsed
+        report["agents"] = {agent: summarize(self.metrics, elapsed, agent=agent) for agent in sorted(set(self.agents))}
+        return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded agent traces at a target rate or concurrency")
+    parser.add_argument("--trace", required=True, help="Trace file written with CLINICAMIND_TRACE_FILE / --trace")
+    parser.add_argument("--mode", default="inprocess", help="Agent mode to replay against (see pain_orchestrator.AGENT_MODES)")
+    parser.add_argument("--url", help="Agent HTTP server for --mode http (default: start a local one)")
+    driver = parser.add_mutually_exclusive_group(required=True)
+    driver.add_argument("--rate", type=float, help="Open loop: requests per second")
+    driver.add_argument("--concurrency", type=int, help="Closed loop: concurrent callers")
+    parser.add_argument("--requests", type=int, help="Requests to send (default: one pass over the trace)")
+    parser.add_argument("--duration", type=float, help="Stop sending after this many seconds")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Open loop: most requests outstanding at once")
+    parser.add_argument("--agents", nargs="+", help="Replay only these agents' requests")
+    parser.add_argument("--warmup", type=int, default=1, help="Requests per agent sent before measuring (worker start-up, model loading)")
+    parser.add_argument("--agent-timeout", type=float, default=60.0, help="Seconds before a request counts as timed out")
+    parser.add_argument("--live", action="store_true", help="Use the real speech backends and the recorded paths")
+    parser.add_argument("--fake-latency-ms", type=float, help="Simulated speech API latency for offline runs (CLINICAMIND_FAKE_LATENCY_MS)")
+    parser.add_argument("--output", help="Write the JSON report here as well")
+    args = parser.parse_args()
+
+    traces = load_traces(args.trace, args.agents)
+    if not traces:
+        parser.error(f"no replayable requests in {args.trace}")
+    work_dir = tempfile.mkdtemp(prefix="clinicamind_replay_")
+    if args.live:
+        requests = [dict(entry["request"]) for entry in traces]
+    else:
+        # Set before any agent process starts, so pools and servers inherit it
+        os.environ["CLINICAMIND_SPEECH_BACKEND"] = "fake"
+        if args.fake_latency_ms is not None:
+            os.environ["CLINICAMIND_FAKE_LATENCY_MS"] = str(args.fake_latency_ms)
+        requests = prepare_offline(traces, work_dir)
+    if args.url:
+        os.environ["CLINICAMIND_AGENT_URL"] = args.url
+
+    from pain_orchestrator import AGENT_MODES, PainOrchestrator
+    if args.mode not in AGENT_MODES:
+        parser.error(f"--mode must be one of {', '.join(AGENT_MODES)}")
+    # The replayer must not record its own traffic
+    os.environ.pop("CLINICAMIND_TRACE_FILE", None)
+    orchestrator = PainOrchestrator(mode=args.mode, agent_timeout=args.agent_timeout)
+    replayer = Replayer(orchestrator, traces, requests)
+    try:
+        first_requests = {}
+        for agent, request in zip(replayer.agents, requests):
+            first_requests.setdefault(agent, request)
+        for agent, request in first_requests.items():
+            for _ in range(args.warmup):
+                orchestrator.call_agent(agent, dict(request))
+
+        total = args.requests or len(requests)
+        deadline = time.perf_counter() + args.duration if args.duration else float("inf")
+        if args.duration and not args.requests:
+            total = sys.maxsize
+        if args.rate:
+            elapsed = replayer.open_loop(args.rate, total, deadline, args.max_in_flight)
+        else:
+            elapsed = replayer.closed_loop(args.concurrency, total, deadline)
+    finally:
+        orchestrator.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"trace": args.trace, "mode": args.mode, "live": args.live}
+    report["driver"] = {"rate": args.rate} if args.rate else {"concurrency": args.concurrency}
+    if args.rate:
+        report["driver"]["late_dispatches"] = replayer.late_dispatches
+    report.update(replayer.report(elapsed))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,38 @@ import sys
 import argparse
 import tempfile
 import os
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Optional, Union
+from instrumentation import Metrics, profiling
+from speech_fakes import fake_backend_enabled, fake_tts
+from content_cache import ContentCache, make_key
+from resilience import CircuitBreaker, RateLimiter, ResiliencePolicy, resilient_call
+from openai_client import get_openai_client
+from agent_results import AgentError, TTSResult
+from shm_transport import decode_message, encode_message
 
-def tts_openai(text: str, out_wav: str, voice: str = "alloy"):
+def tts_openai(text: str, out_wav: str, voice: str = "alloy", timeout: Optional[float] = None,
+               cache_dir: Union[str, bool, None] = None):
     """
-    Generate speech using OpenAI Text-to-Speech API.
+    Generate speech using OpenAI Text-to-Speech API, within the shared
+    requests/min and characters/min quotas kept under `cache_dir`.
     """
-    from openai import OpenAI
+    limiter = RateLimiter.from_env("openai_tts", "CLINICAMIND_TTS_RPM", "CLINICAMIND_TTS_CHARS_PER_MIN", cache_dir)
+    return limiter.call(lambda remaining: _tts_openai(text, out_wav, voice, remaining), len(text), timeout)
+
+def _tts_openai(text: str, out_wav: str, voice: str, timeout: Optional[float]):
+    if fake_backend_enabled():
+        return fake_tts(text, out_wav, voice)
     
-    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    # Shared, connection-pooled client; retries are handled by the resilience layer
+    client = get_openai_client()
     
     try:
         response = client.audio.speech.create(
             model="tts-1",
             voice=voice,
-            input=text
+            input=text,
+            timeout=timeout
         )
         
         with open(out_wav, "wb") as f:
@@ -27,19 +44,95 @@ def tts_openai(text: str, out_wav: str, voice: str = "alloy"):
     except Exception as e:
         raise RuntimeError(f"OpenAI TTS failed: {str(e)}") from e
 
+def tts_local(text: str, out_wav: str) -> Optional[str]:
+    """
+    Synthesize with a local pyttsx3 engine, if available.
+    """
+    try:
+        import pyttsx3
+    except ImportError:
+        return None
+    engine = pyttsx3.init()
+    engine.save_to_file(text, out_wav)
+    engine.runAndWait()
+    return out_wav
+
+def tts_backend() -> str:
+    """
+    Backend behind the TTS API calls; cache keys include it so fake audio
+    is never served to runs against the real API.
+    """
+    return "fake" if fake_backend_enabled() else "openai_tts"
+
+def tts_resilient(text: str, out_wav: str, voice: str = "alloy", cache_dir: Union[str, bool, None] = None) -> str:
+    """
+    Synthesize via OpenAI TTS with deadlines, retries and a circuit breaker,
+    falling back to cached audio for the same text and voice and then to a
+    local engine. Returns the backend that produced the audio.
+    `cache_dir` is the audio cache's root (False bypasses it) and roots
+    the shared breaker and rate limiter state.
+    """
+    cache = ContentCache("tts_audio", cache_dir)
+    primary = tts_backend()
+    key = make_key(text, voice, primary)
+    
+    def synthesize(timeout: float) -> str:
+        # Hedged copies must not write the same file concurrently
+        part_path = f"{out_wav}.{threading.get_ident()}.part"
+        try:
+            tts_openai(text, part_path, voice, timeout, cache_dir)
+        except BaseException:
+            # A failed or abandoned attempt leaves no partial audio behind
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+            raise
+        os.replace(part_path, out_wav)
+        return out_wav
+    
+    def cached_audio():
+        data = cache.get_bytes(key, ".audio")
+        if data is None:
+            return None
+        with open(out_wav, "wb") as f:
+            f.write(data)
+        return out_wav
+    
+    _, backend = resilient_call(
+        CircuitBreaker("openai_tts", cache_dir=cache_dir),
+        synthesize,
+        ResiliencePolicy.from_env(attempt_timeout=30.0, deadline=90.0),
+        fallbacks=[
+            ("cache", cached_audio),
+            ("local_tts", lambda: tts_local(text, out_wav))
+        ],
+        primary_name=primary
+    )
+    if backend == primary:
+        with open(out_wav, "rb") as f:
+            cache.put_bytes(key, f.read(), ".audio")
+    return backend
+
 class TTSAgent:
+    name = "TTS_Agent"
+    version = "1.0"
+    
     def __init__(self):
-        self.name = "TTS_Agent"
-        self.version = "1.0"
+        self.metrics = Metrics()
     
-    def process(self, request: Dict[str, Any]) -> Dict[str, Any]:
+    @classmethod
+    def fingerprint(cls) -> str:
+        return make_key(cls.name, cls.version, tts_backend())
+    
+    def process(self, request: Dict[str, Any]) -> TTSResult:
         """
         Process TTS request and return JSON response.
         Expected input: {
             "text": "text to synthesize",
             "output_path": "path/to/output.wav",
             "language_code": "en-US",
-            "voice_name": "en-US-Neural2-F"
+            "voice_name": "en-US-Neural2-F",
+            "speech_cache": "cache/dir" | false (optional, audio cache root,
+                            default CLINICAMIND_CACHE_DIR; false bypasses it)
         }
         """
         try:
@@ -63,34 +156,35 @@ class TTSAgent:
             openai_voice = openai_voices.get(voice_name, "alloy")
             
             if not text:
-                return {
-                    "success": False,
-                    "error": "Missing text in request",
-                    "agent": self.name
-                }
+                return AgentError(error="Missing text in request", agent=self.name)
             
             if not output_path:
                 output_path = tempfile.mktemp(suffix=".wav")
             
-            tts_openai(text, output_path, openai_voice)
+            with self.metrics.span("api_call", api="openai_tts"):
+                backend = tts_resilient(text, output_path, openai_voice, request.get("speech_cache"))
+            self.metrics.incr("backend_calls", backend=backend)
+            self.metrics.incr("input_chars", len(text))
             
-            return {
-                "success": True,
-                "agent": self.name,
-                "text": text,
-                "output_path": output_path,
-                "language_code": language_code,
-                "voice_name": voice_name,
-                "openai_voice": openai_voice,
-                "file_size": os.path.getsize(output_path) if os.path.exists(output_path) else 0
-            }
+            response = TTSResult(
+                agent=self.name,
+                text=text,
+                output_path=output_path,
+                language_code=language_code,
+                voice_name=voice_name,
+                openai_voice=openai_voice,
+                backend=backend,
+                file_size=os.path.getsize(output_path) if os.path.exists(output_path) else 0
+            )
+            self.metrics.incr("output_bytes", response.file_size)
+            
+            if request.get("collect_metrics"):
+                response.metrics = self.metrics.drain()
+            
+            return response
             
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "agent": self.name
-            }
+            return AgentError(error=str(e), agent=self.name)
 
 def main():
     parser = argparse.ArgumentParser(description="TTS Agent - Text-to-Speech service")
@@ -117,10 +211,12 @@ def main():
             with open(args.input, 'r') as f:
                 request = json.load(f)
     else:
-        request = json.load(sys.stdin)
+        request = decode_message(sys.stdin.read())
     
-    result = agent.process(request)
-    print(json.dumps(result, indent=2))
+    with profiling("tts_agent"):
+        result = agent.process(request)
+    output, _ = encode_message(result.to_dict(), request.get("shm_threshold"), indent=2)
+    print(output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
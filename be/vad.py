@@ -0,0 +1,88 @@
+"""
+Energy-based voice activity detection over mono PCM samples.
+
+Frames are scored by RMS level in dBFS against an adaptive threshold (the
+recording's noise floor plus a margin). Short pauses are bridged, blips
+are dropped, and segments are padded so word onsets are not clipped.
+Everything is vectorized with NumPy; a 40-minute encounter at 16 kHz
+segments in well under a second.
+"""
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+def frame_energy_db(samples: np.ndarray, sample_rate: int, frame_ms: int = 30) -> np.ndarray:
+    """
+    RMS level of each non-overlapping frame in dBFS (0 dB = full-scale int16).
+    """
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0)
+    frames = samples[:n_frames * frame_len].astype(np.float32).reshape(n_frames, frame_len) / 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Start and end (exclusive) indices of the True runs in a boolean mask.
+    """
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def detect_speech(samples: np.ndarray, sample_rate: int, frame_ms: int = 30, margin_db: float = 12.0,
+                  floor_db: float = -55.0, min_speech_ms: int = 250, min_silence_ms: int = 600,
+                  pad_ms: int = 200) -> List[Tuple[int, int]]:
+    """
+    Return speech regions as (start_sample, end_sample) pairs.
+    """
+    energy = frame_energy_db(samples, sample_rate, frame_ms)
+    if energy.size == 0:
+        return []
+
+    threshold = max(floor_db, float(np.percentile(energy, 10)) + margin_db)
+    speech = energy > threshold
+
+    # Bridge pauses shorter than min_silence_ms (interior silence runs only)
+    starts, ends = _runs(~speech)
+    bridge = ((ends - starts) * frame_ms < min_silence_ms) & (starts > 0) & (ends < speech.size)
+    fill = np.zeros(speech.size + 1, dtype=np.int32)
+    np.add.at(fill, starts[bridge], 1)
+    np.add.at(fill, ends[bridge], -1)
+    speech |= np.cumsum(fill[:-1]) > 0
+
+    # Drop blips shorter than min_speech_ms
+    starts, ends = _runs(speech)
+    keep = (ends - starts) * frame_ms >= min_speech_ms
+    starts, ends = starts[keep], ends[keep]
+    if starts.size == 0:
+        return []
+
+    frame_len = int(sample_rate * frame_ms / 1000)
+    pad = int(sample_rate * pad_ms / 1000)
+    seg_starts = np.maximum(starts * frame_len - pad, 0)
+    seg_ends = np.minimum(ends * frame_len + pad, len(samples))
+
+    # Padding can make neighbours overlap; merge them
+    merged = [[int(seg_starts[0]), int(seg_ends[0])]]
+    for start, end in zip(seg_starts[1:], seg_ends[1:]):
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], int(end))
+        else:
+            merged.append([int(start), int(end)])
+    return [(start, end) for start, end in merged]
+
+def speech_segments(samples: np.ndarray, sample_rate: int, **kwargs) -> Dict[str, Any]:
+    """
+    Speech regions with time offsets in seconds, plus the speech ratio.
+    """
+    regions = detect_speech(samples, sample_rate, **kwargs)
+    speech_samples = sum(end - start for start, end in regions)
+    return {
+        "segments": [
+            {"start": start / sample_rate, "end": end / sample_rate, "start_sample": start, "end_sample": end}
+            for start, end in regions
+        ],
+        "duration_s": len(samples) / sample_rate,
+        "speech_ratio": speech_samples / len(samples) if len(samples) else 0.0
+    }
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Lease-based work queue for backfills across processes and nodes.
+
+Visit pairs from a manifest (see batch_triage.load_manifest) become jobs in
+a SQLite database on a filesystem every worker can reach. Workers lease one
+job at a time, run it through PainOrchestrator.process_dual_audio, and
+heartbeat while it runs; a lease that is not renewed expires and the job
+goes back to any worker, so crashed or partitioned workers lose no work.
+A job that expires or fails `max_attempts` times is marked failed.
+
+Leases are fenced: only the current lease holder can complete, fail or
+renew a job, so a worker that lost its lease (and whose job was handed to
+someone else) cannot overwrite the outcome. Results are written to
+`<output-dir>/<id>.json` (and `.wav`) through a temp file and rename, so a
+late duplicate write replaces an identical result instead of corrupting it.
+
+    python work_queue.py enqueue --db backfill.sqlite --manifest pairs.json
+    python work_queue.py work --db backfill.sqlite --output-dir out --processes 4
+    python work_queue.py status --db backfill.sqlite
+
+SQLite needs working file locks: a local disk, or a network filesystem
+with reliable POSIX locking.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+from typing import Any, Dict, List, Optional
+from instrumentation import Metrics
+from pain_orchestrator import AGENT_MODES, PainOrchestrator
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    result_path TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+"""
+
+STATUSES = ("pending", "leased", "done", "failed")
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class WorkQueue:
+    def __init__(self, path: str, lease_s: float = 60.0, max_attempts: int = 3):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max(1, max_attempts)
+        self.conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        with self._lock:
+            return self.conn.execute(sql, params).rowcount
+
+    def enqueue(self, entries: List[Dict[str, Any]]) -> int:
+        """
+        Add jobs; ids already in the queue are skipped, so re-enqueueing a
+        manifest is safe. Returns the number of new jobs. Ids name the
+        result files, so one that is not a plain file name raises ValueError
+        and nothing is added.
+        """
+        from batch_triage import check_encounter_ids
+        check_encounter_ids(entries)
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                (seq,) = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM jobs").fetchone()
+                added = 0
+                for entry in entries:
+                    seq += 1
+                    added += self.conn.execute(
+                        "INSERT OR IGNORE INTO jobs (id, seq, payload, updated_at) VALUES (?, ?, ?, ?)",
+                        (entry["id"], seq, json.dumps(entry), now)
+                    ).rowcount
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def lease(self, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Lease the oldest available job: pending, or leased by someone whose
+        lease expired. Jobs out of attempts are failed on the way.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'lease expired'), lease_owner = NULL, updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                row = self.conn.execute(
+                    "SELECT id, payload, attempts FROM jobs "
+                    "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY seq LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                job_id, payload, attempts = row
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'leased', attempts = ?, lease_owner = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (attempts + 1, owner, now + self.lease_s, now, job_id)
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return {"id": job_id, "attempt": attempts + 1, "entry": json.loads(payload)}
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """
+        Extend a lease; False means it was lost (expired and re-leased).
+        """
+        now = time.time()
+        return self._write(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + self.lease_s, now, job_id, owner)
+        ) == 1
+
+    def complete(self, job_id: str, owner: str, result_path: Optional[str] = None) -> bool:
+        return self._write(
+            "UPDATE jobs SET status = 'done', lease_owner = NULL, error = NULL, result_path = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (result_path, time.time(), job_id, owner)
+        ) == 1
+
+    def fail(self, job_id: str, owner: str, error: str, retry: bool = True) -> bool:
+        """
+        Give a job back for another attempt, or fail it for good once it is
+        out of attempts or the error is not worth retrying.
+        """
+        return self._write(
+            "UPDATE jobs SET status = CASE WHEN ? AND attempts < ? THEN 'pending' ELSE 'failed' END, "
+            "lease_owner = NULL, error = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (retry, self.max_attempts, error, time.time(), job_id, owner)
+        ) == 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            failed = [{"id": job_id, "attempts": attempts, "error": error} for job_id, attempts, error in
+                      self.conn.execute("SELECT id, attempts, error FROM jobs WHERE status = 'failed' ORDER BY seq")]
+        return {"counts": {status: counts.get(status, 0) for status in STATUSES}, "failed": failed}
+
+class Heartbeat:
+    """
+    Renews a lease every third of the lease period until stopped.
+    """
+    def __init__(self, queue: WorkQueue, job_id: str, owner: str):
+        self.queue = queue
+        self.job_id = job_id
+        self.owner = owner
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_s / 3):
+            if not self.queue.heartbeat(self.job_id, self.owner):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+class QueueWorker:
+    """
+    Drains a queue with one PainOrchestrator until no job is left.
+    """
+    def __init__(self, queue: WorkQueue, output_dir: str, language: str = "en-US", voice_name: str = "en-US-Neural2-F", **orchestrator_kwargs):
+        self.queue = queue
+        self.output_dir = output_dir
+        self.language = language
+        self.voice_name = voice_name
+        self.owner = worker_id()
+        self.orchestrator = PainOrchestrator(**orchestrator_kwargs)
+        self.metrics = Metrics()
+
+    def _write_result(self, job_id: str, result: Dict[str, Any]) -> str:
+        path = os.path.join(self.output_dir, f"{job_id}.json")
+        tmp_path = f"{path}.{self.owner.replace(':', '_')}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def run_job(self, job: Dict[str, Any]) -> bool:
+        from batch_triage import check_encounter_ids
+        job_id = job["id"]
+        try:
+            # enqueue() checks ids, but rows may have been added some other way
+            check_encounter_ids([{"id": job_id}])
+        except ValueError as e:
+            self.metrics.incr("jobs_failed")
+            self.queue.fail(job_id, self.owner, str(e), retry=False)
+            return False
+        output_audio = os.path.join(self.output_dir, f"{job_id}.wav")
+        # Render audio next to the final path, then move it in, like the JSON
+        work_audio = f"{output_audio}.{self.owner.replace(':', '_')}.tmp.wav"
+        try:
+            return self._run_job(job, output_audio, work_audio)
+        finally:
+            # Left behind unless the job completed and moved it into place
+            if os.path.exists(work_audio):
+                os.unlink(work_audio)
+
+    def _run_job(self, job: Dict[str, Any], output_audio: str, work_audio: str) -> bool:
+        entry = job["entry"]
+        job_id = job["id"]
+        with Heartbeat(self.queue, job_id, self.owner) as heartbeat, self.metrics.span("job"):
+            try:
+                result = self.orchestrator.process_dual_audio(
+                    entry["first_visit"],
+                    entry["second_visit"],
+                    language=entry.get("language", self.language),
+                    voice_name=entry.get("voice_name", self.voice_name),
+                    output_audio=work_audio
+                )
+            except Exception as e:
+                self.metrics.incr("jobs_errored")
+                self.queue.fail(job_id, self.owner, f"{type(e).__name__}: {e}")
+                return False
+        if heartbeat.lost:
+            # Someone else owns the job now; leave the outcome to them
+            self.metrics.incr("leases_lost")
+            return False
+
+        final = result["final_result"]
+        if not final.get("success"):
+            self.metrics.incr("jobs_failed")
+            # A blocked encounter fails the same way every time
+            self.queue.fail(job_id, self.owner, str(final.get("error")), retry=not final.get("blocked"))
+            return False
+        if os.path.exists(work_audio):
+            os.replace(work_audio, output_audio)
+            for tts in (result["steps"].get("tts"), final.get("tts_output")):
+                if tts and tts.get("output_path") == work_audio:
+                    tts["output_path"] = output_audio
+        result["job"] = {"id": job_id, "attempt": job["attempt"], "worker": self.owner}
+        path = self._write_result(job_id, result)
+        if self.queue.complete(job_id, self.owner, path):
+            self.metrics.incr("jobs_done")
+            return True
+        self.metrics.incr("leases_lost")
+        return False
+
+    def run(self, poll_s: float = 1.0, idle_exit: bool = True) -> Dict[str, Any]:
+        """
+        Lease and run jobs until none is available (then return if
+        `idle_exit`, else keep polling for new or expired ones).
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        try:
+            while True:
+                job = self.queue.lease(self.owner)
+                if job is None:
+                    if idle_exit and not self._leases_outstanding():
+                        break
+                    time.sleep(poll_s)
+                    continue
+                self.run_job(job)
+        finally:
+            self.orchestrator.close()
+        return {"worker": self.owner, "metrics": self.metrics.to_dict()}
+
+    def _leases_outstanding(self) -> bool:
+        # Leased jobs may still expire and come back; wait for them
+        return self.queue.stats()["counts"]["leased"] > 0
+
+def _work(args: argparse.Namespace) -> Dict[str, Any]:
+    queue = WorkQueue(args.db, args.lease_s, args.max_attempts)
+    try:
+        worker = QueueWorker(queue, args.output_dir, args.language, args.voice, cache_dir=args.cache_dir, mode=args.mode)
+        return worker.run(args.poll_s, idle_exit=not args.follow)
+    finally:
+        queue.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Lease-based SQLite work queue for multi-process / multi-node backfills")
+    parser.add_argument("command", choices=("enqueue", "work", "status"))
+    parser.add_argument("--db", required=True, help="Queue database (on storage every worker can reach)")
+    parser.add_argument("--manifest", help="JSON list or JSON lines of {id, first_visit, second_visit} (enqueue)")
+    parser.add_argument("--output-dir", help="Directory for per-job results (work)")
+    parser.add_argument("--processes", type=int, default=1, help="Local worker processes (work)")
+    parser.add_argument("--lease-s", type=float, default=60.0, help="Lease length; heartbeats renew it every third")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts before a job is failed")
+    parser.add_argument("--poll-s", type=float, default=1.0, help="Wait between lease attempts while others hold leases")
+    parser.add_argument("--follow", action="store_true", help="Keep polling for new jobs instead of exiting when drained")
+    parser.add_argument("--mode", choices=AGENT_MODES, default="subprocess", help="Agent execution mode")
+    parser.add_argument("--cache-dir", help="Pipeline and per-stage result cache directory")
+    parser.add_argument("--language", default="en-US", help="Default language code")
+    parser.add_argument("--voice", default="en-US-Neural2-F", help="Default TTS voice name")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        if not args.manifest:
+            parser.error("enqueue needs --manifest")
+        from batch_triage import check_encounter_ids, load_manifest
+        entries = load_manifest(args.manifest)
+        try:
+            check_encounter_ids(entries)
+        except ValueError as e:
+            parser.error(str(e))
+        queue = WorkQueue(args.db, args.lease_s, args.max_attempts)
+        added = queue.enqueue(entries)
+        print(json.dumps({"enqueued": added, **queue.stats()}, indent=2))
+        queue.close()
+    elif args.command == "work":
+        if not args.output_dir:
+            parser.error("work needs --output-dir")
+        if args.processes <= 1:
+            print(json.dumps(_work(args), indent=2))
+            return
+        import multiprocessing
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(args.processes) as pool:
+            summaries = pool.map(_work, [args] * args.processes)
+        print(json.dumps(summaries, indent=2))
+    else:
+        queue = WorkQueue(args.db, args.lease_s, args.max_attempts)
+        print(json.dumps(queue.stats(), indent=2))
+        queue.close()
+
+if __name__ == "__main__":
+    main()